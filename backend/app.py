@@ -1,9 +1,19 @@
-from flask import Flask
+import logging
+import os
+from flask import Flask, g, request
 from flask_cors import CORS
+from config import Config
+from services.logging_setup import setup_logging, logging_stats
+from services.registry import get_registry
+from services.unit_of_work import begin_unit_of_work, end_unit_of_work, db_call_stats
+
+# Antes de importar las rutas, así los logs de cualquier import ya pasan por la cola
+setup_logging()
+logger = logging.getLogger(__name__)
+
 from routes.user_routes import user_bp
 from routes.game_routes import game_bp
 from routes.ai_routes import ai_bp
-from config import Config
 
 app = Flask(__name__)
 
@@ -13,7 +23,7 @@ CORS(app, resources={
         "origins": ["http://localhost:5173", "http://127.0.0.1:5173"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"],
-        "expose_headers": ["Content-Type"],
+        "expose_headers": ["Content-Type", "X-DB-Calls", "X-Next-Cursor"],
         "supports_credentials": True
     }
 })
@@ -23,6 +33,26 @@ app.register_blueprint(user_bp)
 app.register_blueprint(game_bp)
 app.register_blueprint(ai_bp)
 
+# Unidad de trabajo por petición: filas leídas una vez, inserciones juntas al final
+@app.before_request
+def open_unit_of_work():
+    g.unit_of_work = begin_unit_of_work(request.endpoint)
+
+def _flush_unit_of_work(uow):
+    get_registry().db.flush_unit_of_work(uow)
+
+@app.after_request
+def close_unit_of_work(response):
+    uow = end_unit_of_work(_flush_unit_of_work)
+    if uow is not None and Config.DB_CALLS_HEADER:
+        response.headers["X-DB-Calls"] = str(uow.db_calls)
+    return response
+
+@app.teardown_request
+def discard_unit_of_work(error=None):
+    # Si la petición falló antes de after_request, lo pendiente igual se escribe
+    end_unit_of_work(_flush_unit_of_work)
+
 @app.route('/')
 def index():
     return {
@@ -39,12 +69,19 @@ def index():
 def health():
     return {
         "status": "healthy",
-        "message": "YachAI Backend is running! 🚀"
+        "message": "YachAI Backend is running! 🚀",
+        "logging": logging_stats(),
+        "services": get_registry().stats(),
+        "db_calls": db_call_stats.snapshot()
     }
 
 if __name__ == '__main__':
-    print("🎮 Iniciando YachAI Backend...")
-    print(f"📡 API URL: http://localhost:{Config.PORT}")
-    print(f"🤖 Modelo IA: llama-3.3-70b-versatile")
-    print(f"🗄️  Base de datos: Supabase")
+    logger.info("Iniciando YachAI Backend en http://localhost:%s (modelo IA: %s, base de datos: Supabase)",
+                Config.PORT, Config.AI_PRIMARY_MODEL)
+    # Con debug el proceso que sirve es el hijo del recargador; solo ese toma el journal
+    if not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        try:
+            get_registry().warm()
+        except Exception as e:
+            logger.warning("No se pudieron crear los servicios al arrancar: %s", e)
     app.run(host='0.0.0.0', port=Config.PORT, debug=Config.DEBUG)
\ No newline at end of file
@@ -0,0 +1,275 @@
+"""Pre-generación de contenido para un currículo completo, fuera del horario de clases.
+
+Uso (desde backend/):
+    python batch_generate.py temas.txt --output jsonl --out curriculo.jsonl.gz
+    python batch_generate.py temas.txt --output supabase --ttl-days 120
+
+El archivo de temas tiene un tema por línea (las líneas vacías y las que
+empiezan con # se ignoran). Por cada tema se genera cada tipo de juego en
+cada dificultad con AIService, con prioridad de segundo plano en el
+planificador de Groq (respeta GROQ_RPM_LIMIT y GROQ_TPM_LIMIT).
+
+Cada trabajo terminado se anota en el archivo de checkpoint después de
+escribir su resultado; si la corrida se interrumpe, al volver a ejecutar el
+mismo comando se saltan los trabajos ya hechos.
+
+Salidas:
+    jsonl     registros {topic, game_type, difficulty, age_range, cache_key, content, usage, seconds}
+              en un .jsonl.gz (se agrega al final si ya existe)
+    supabase  filas de content_cache en lotes, así /api/games/start las encuentra en caché
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import Config
+from models.game import GameType, DifficultyLevel
+from services.ai_service import AIService
+from services.content_cache import SupabaseContentStore, make_cache_key
+from services.groq_scheduler import Priority, groq_context, track_usage
+from services.logging_setup import setup_logging
+from services.topic_index import TopicIndex
+
+Job = Tuple[str, GameType, DifficultyLevel, str]
+
+
+def read_topics(path: str) -> List[str]:
+    """Temas del archivo, sin repetir variantes del mismo tema"""
+    index = TopicIndex()
+    topics, seen = [], set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            topic = index.canonicalize(line)
+            if topic != line:
+                print(f"🏷️ '{line}' se une a '{topic}'")
+            if topic not in seen:
+                seen.add(topic)
+                topics.append(topic)
+    return topics
+
+
+class Checkpoint:
+    """Llaves de los trabajos ya escritos, una por línea (solo se agregan)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def mark(self, keys: List[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in keys)
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(keys)
+
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, records: List[Dict[str, Any]]):
+        # Cada escritura agrega un miembro gzip nuevo; gzip los lee como un solo archivo
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class SupabaseWriter:
+    def __init__(self, ttl_seconds: int):
+        from supabase import create_client
+        self.store = SupabaseContentStore(create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY))
+        self.ttl_seconds = ttl_seconds
+
+    def write(self, records: List[Dict[str, Any]]):
+        self.store.set_many(
+            [(r["cache_key"], json.dumps(r["content"], ensure_ascii=False)) for r in records],
+            self.ttl_seconds
+        )
+
+
+class BatchReport:
+    """Rendimiento, fallos y tokens por tema"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.topics: Dict[str, Dict[str, Any]] = {}
+        self.failures: List[Dict[str, str]] = []
+        self.skipped = 0
+
+    def _topic(self, topic: str) -> Dict[str, Any]:
+        return self.topics.setdefault(topic, {"ok": 0, "failed": 0, "calls": 0, "tokens": 0, "seconds": 0.0})
+
+    def success(self, topic: str, usage: Dict[str, int], seconds: float):
+        entry = self._topic(topic)
+        entry["ok"] += 1
+        entry["calls"] += usage["calls"]
+        entry["tokens"] += usage["total_tokens"]
+        entry["seconds"] += seconds
+
+    def failure(self, job: Job, error: str):
+        self._topic(job[0])["failed"] += 1
+        self.failures.append({"key": make_cache_key(*job), "error": error})
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        ok = sum(t["ok"] for t in self.topics.values())
+        tokens = sum(t["tokens"] for t in self.topics.values())
+        minutes = elapsed / 60 if elapsed else 1
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "jobs_ok": ok,
+            "jobs_failed": len(self.failures),
+            "jobs_skipped": self.skipped,
+            "jobs_per_minute": round(ok / minutes, 2),
+            "tokens": tokens,
+            "tokens_per_minute": round(tokens / minutes),
+            "topics": {
+                topic: {**entry, "seconds": round(entry["seconds"], 2)} for topic, entry in self.topics.items()
+            },
+            "failures": self.failures
+        }
+
+    def print(self):
+        summary = self.summary()
+        print(f"\n{'Tema':40} {'ok':>4} {'fallos':>6} {'llamadas':>8} {'tokens':>9} {'seg':>8}")
+        for topic, entry in summary["topics"].items():
+            print(f"{topic[:40]:40} {entry['ok']:>4} {entry['failed']:>6} {entry['calls']:>8} "
+                  f"{entry['tokens']:>9} {entry['seconds']:>8.1f}")
+        print(f"\n✅ {summary['jobs_ok']} generados, ❌ {summary['jobs_failed']} fallidos, "
+              f"⏭️ {summary['jobs_skipped']} ya hechos, en {summary['elapsed_seconds']}s "
+              f"({summary['jobs_per_minute']} juegos/min, {summary['tokens_per_minute']} tokens/min)")
+        for failure in summary["failures"]:
+            print(f"   ❌ {failure['key']}: {failure['error']}")
+
+
+def run_job(service: AIService, job: Job, retries: int) -> Tuple[Any, Dict[str, int], float]:
+    topic, game_type, difficulty, age_range = job
+    start = time.perf_counter()
+    with groq_context(Priority.BACKGROUND, user_id="batch"), track_usage() as usage:
+        for attempt in range(retries + 1):
+            try:
+                content = service.generate_game_content(topic, game_type, difficulty, age_range, fresh=True)
+                break
+            except Exception:
+                if attempt == retries:
+                    raise
+    return content, usage.as_dict(), time.perf_counter() - start
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("topics", help="archivo con un tema por línea")
+    parser.add_argument("--game-types", default=",".join(t.value for t in GameType))
+    parser.add_argument("--difficulties", default=",".join(d.value for d in DifficultyLevel))
+    parser.add_argument("--age-range", default="8-14")
+    parser.add_argument("--output", choices=["jsonl", "supabase"], default="jsonl")
+    parser.add_argument("--out", default="curriculum.jsonl.gz", help="archivo de salida para --output jsonl")
+    parser.add_argument("--ttl-days", type=float, default=120, help="vigencia en caché para --output supabase")
+    parser.add_argument("--checkpoint", help="archivo de avance (por defecto <salida>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=4, help="generaciones en paralelo")
+    parser.add_argument("--batch-size", type=int, default=25, help="resultados por escritura")
+    parser.add_argument("--retries", type=int, default=1, help="reintentos por juego fallido")
+    parser.add_argument("--queue-timeout", type=float, default=600,
+                        help="segundos que una llamada puede esperar su turno ante los límites de Groq")
+    parser.add_argument("--report", help="guardar el resumen en este archivo JSON")
+    parser.add_argument("--dry-run", action="store_true", help="solo listar los trabajos pendientes")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    try:
+        game_types = [GameType(t.strip()) for t in args.game_types.split(",")]
+        difficulties = [DifficultyLevel(d.strip()) for d in args.difficulties.split(",")]
+    except ValueError as e:
+        parser.error(f"Tipo de juego o dificultad inválidos: {str(e)}")
+
+    topics = read_topics(args.topics)
+    checkpoint = Checkpoint(args.checkpoint or (args.out if args.output == "jsonl" else "supabase") + ".checkpoint")
+    jobs: List[Job] = [
+        (topic, game_type, difficulty, args.age_range)
+        for topic in topics for game_type in game_types for difficulty in difficulties
+    ]
+    pending = [job for job in jobs if make_cache_key(*job) not in checkpoint.done]
+
+    report = BatchReport()
+    report.skipped = len(jobs) - len(pending)
+    print(f"📚 {len(topics)} temas, {len(jobs)} juegos, {len(pending)} pendientes "
+          f"(checkpoint: {checkpoint.path})")
+    if args.dry_run:
+        for job in pending:
+            print(f"   {make_cache_key(*job)}")
+        return 0
+
+    writer = JsonlWriter(args.out) if args.output == "jsonl" else SupabaseWriter(int(args.ttl_days * 86400))
+    service = AIService()
+    service.cache = None  # el resultado lo escribe el writer en lotes
+    if service.scheduler is not None:
+        # Esperar el cupo de TPM es lo normal en un lote; no debe contar como fallo
+        service.scheduler.queue_timeout_seconds = args.queue_timeout
+
+    buffer: List[Dict[str, Any]] = []
+
+    def flush():
+        if not buffer:
+            return
+        writer.write(buffer)
+        checkpoint.mark([record["cache_key"] for record in buffer])
+        buffer.clear()
+
+    executor = ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch")
+    futures = {executor.submit(run_job, service, job, args.retries): job for job in pending}
+    interrupted = False
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            job = futures[future]
+            topic, game_type, difficulty, age_range = job
+            try:
+                content, usage, seconds = future.result()
+            except Exception as e:
+                report.failure(job, str(e))
+                print(f"[{done}/{len(pending)}] ❌ {make_cache_key(*job)}: {str(e)}")
+                continue
+            report.success(topic, usage, seconds)
+            buffer.append({
+                "topic": topic,
+                "game_type": game_type.value,
+                "difficulty": difficulty.value,
+                "age_range": age_range,
+                "cache_key": make_cache_key(*job),
+                "content": content.model_dump(mode="json"),
+                "usage": usage,
+                "seconds": round(seconds, 3)
+            })
+            print(f"[{done}/{len(pending)}] ✅ {make_cache_key(*job)} "
+                  f"({seconds:.1f}s, {usage['total_tokens']} tokens)")
+            if len(buffer) >= args.batch_size:
+                flush()
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n⏹️ Interrumpido: guardando lo generado; vuelve a ejecutar el comando para continuar")
+        executor.shutdown(wait=False, cancel_futures=True)
+    finally:
+        flush()
+        executor.shutdown(wait=not interrupted, cancel_futures=True)
+
+    report.print()
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.summary(), f, ensure_ascii=False, indent=2)
+    if interrupted:
+        return 130
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Benchmark: generación en una sola llamada frente a generación en paralelo por partes.
+
+Uso (desde backend/):
+    python -m benchmarks.fanout_benchmark [--runs 200] [--workers 6] [--extra 1]
+    python -m benchmarks.fanout_benchmark --live --runs 10   # llamadas reales (requiere GROQ_API_KEY)
+
+Sin --live no se llama a Groq: se usa SyntheticTransport, que espera una
+latencia simulada (tiempo hasta el primer token + tokens generados / velocidad,
+con ruido lognormal y una cola lenta ocasional) y devuelve JSON sintético con
+la forma que pide el prompt. Reporta p50/p95 por tipo de juego y modo.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("LLM_TRANSPORT", "synthetic")  # antes de importar Config
+
+from config import Config  # noqa: E402
+from models.game import GameType, DifficultyLevel  # noqa: E402
+from services.ai_service import AIService  # noqa: E402
+from services.fanout_generation import FanoutGenerator  # noqa: E402
+from services.llm_transport import LatencyModel, LiveTransport, SyntheticTransport  # noqa: E402
+
+TOPIC = "la fotosíntesis"
+
+
+def _percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _measure(service: AIService, game_type: GameType, fanout: bool, runs: int, scale: float):
+    service.fanout_game_types = {game_type.value} if fanout else set()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        service._generate_content_live(TOPIC, game_type, DifficultyLevel.MEDIUM, "8-14")
+        samples.append((time.perf_counter() - start) * scale)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200, help="generaciones por tipo de juego y modo")
+    parser.add_argument("--workers", type=int, default=Config.AI_FANOUT_MAX_WORKERS)
+    parser.add_argument("--extra", type=int, default=Config.AI_FANOUT_EXTRA_CALLS, help="llamadas extra en paralelo")
+    parser.add_argument("--live", action="store_true", help="usar Groq en lugar de la latencia simulada")
+    parser.add_argument("--ttft", type=float, default=0.35, help="segundos hasta el primer token (simulado)")
+    parser.add_argument("--tps", type=float, default=250.0, help="tokens por segundo (simulado)")
+    parser.add_argument("--sigma", type=float, default=0.25, help="ruido lognormal (simulado)")
+    parser.add_argument("--straggler-rate", type=float, default=0.05)
+    parser.add_argument("--straggler-factor", type=float, default=3.0)
+    parser.add_argument("--speedup", type=float, default=20.0, help="acelera el reloj simulado")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    service = AIService()
+    service.cache = None
+    service.scheduler = None  # medir solo la generación, sin los límites de la cuenta
+    service.fanout = FanoutGenerator(service, args.workers, args.extra)
+    scale = 1.0
+    if args.live:
+        from groq import Groq
+        service.transport = LiveTransport(Groq(api_key=Config.GROQ_API_KEY))
+    else:
+        latency = LatencyModel(args.ttft, args.tps, args.sigma, args.straggler_rate,
+                               args.straggler_factor, args.speedup)
+        service.transport = SyntheticTransport(latency, seed=args.seed)
+        scale = args.speedup
+
+    mode = "Groq" if args.live else f"simulado (x{args.speedup:g})"
+    print(f"Latencia de generación en segundos ({mode}, {args.runs} corridas)")
+    print(f"{'juego':10} {'modo':10} {'p50':>7} {'p95':>7} {'media':>7}")
+    for game_type in (GameType.TRIVIA, GameType.ADVENTURE, GameType.MARKET):
+        for fanout in (False, True):
+            samples = _measure(service, game_type, fanout, args.runs, scale)
+            print(f"{game_type.value:10} {'paralelo' if fanout else 'única':10} "
+                  f"{_percentile(samples, 50):>7.2f} {_percentile(samples, 95):>7.2f} {statistics.mean(samples):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Microbenchmark: extract_json frente a la limpieza anterior basada en regex.
+
+Uso (desde backend/):
+    python -m benchmarks.json_extract_benchmark [--repeat 2000]
+
+Compara, sobre respuestas de la IA de tamaño real (benchmarks/fixtures),
+la ruta anterior (_clean_json_response + json.loads en el llamador) con
+extract_json, que recorre el texto una vez y devuelve el objeto parseado.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.json_parsing import extract_json  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+def legacy_clean_json_response(text: str, prefer_top: str = "auto") -> str:
+    """Copia de AIService._clean_json_response antes de extract_json"""
+    text = re.sub(r'```json\s*', '', text)
+    text = re.sub(r'```\s*', '', text)
+    text = text.strip()
+
+    try:
+        json.loads(text)
+        return text
+    except Exception:
+        pass
+
+    obj_match = re.search(r'\{[\s\S]*\}', text)
+    arr_match = re.search(r'\[[\s\S]*\]', text)
+
+    def _strip_comments(s: str) -> str:
+        return re.sub(r'//.*?(?:\n|$)', '', s)
+
+    if prefer_top == "object" and obj_match:
+        return _strip_comments(obj_match.group(0))
+    if prefer_top == "array" and arr_match:
+        return _strip_comments(arr_match.group(0))
+
+    if obj_match and ('"scenes"' in obj_match.group(0) or '"title"' in obj_match.group(0)):
+        return _strip_comments(obj_match.group(0))
+    if arr_match:
+        return _strip_comments(arr_match.group(0))
+    if obj_match:
+        return _strip_comments(obj_match.group(0))
+
+    return text
+
+
+def legacy_parse(text: str):
+    return json.loads(legacy_clean_json_response(text))
+
+
+def new_parse(text: str):
+    return extract_json(text, partial=True)
+
+
+def _time_per_call(fn, text: str, repeat: int) -> float:
+    samples = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                fn(text)
+            except ValueError:
+                pass
+        samples.append((time.perf_counter() - start) / repeat)
+    return statistics.median(samples) * 1e6
+
+
+def _outcome(fn, text: str) -> str:
+    try:
+        data = fn(text)
+    except ValueError as e:
+        return f"error ({type(e).__name__})"
+    if isinstance(data, list):
+        return f"list[{len(data)}]"
+    if isinstance(data, dict):
+        return f"dict[{', '.join(list(data)[:2])}]"
+    return type(data).__name__
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="llamadas por muestra")
+    args = parser.parse_args()
+
+    fixtures = sorted(FIXTURES_DIR.glob("*.txt"))
+    print(f"{'fixture':32} {'bytes':>6} {'legacy µs':>10} {'nuevo µs':>10} {'x':>6}  resultado legacy / nuevo")
+    total_legacy = total_new = 0.0
+    for path in fixtures:
+        text = path.read_text(encoding="utf-8")
+        legacy_us = _time_per_call(legacy_parse, text, args.repeat)
+        new_us = _time_per_call(new_parse, text, args.repeat)
+        total_legacy += legacy_us
+        total_new += new_us
+        print(f"{path.name:32} {len(text):>6} {legacy_us:>10.1f} {new_us:>10.1f} {legacy_us / new_us:>6.2f}  "
+              f"{_outcome(legacy_parse, text)} / {_outcome(new_parse, text)}")
+    print(f"{'TOTAL':32} {'':>6} {total_legacy:>10.1f} {total_new:>10.1f} {total_legacy / total_new:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Perfil del pipeline de contenido completo sin red.
+
+Uso (desde backend/):
+    python -m benchmarks.pipeline_profile [--transport synthetic|replay] [--runs 50] [--top 25]
+
+Genera contenido de los tres juegos con AIService (prompts, llamada, parseo,
+validación y caché) sobre un transporte sin red y muestra las funciones con
+más tiempo acumulado según cProfile. Con ``--transport replay`` se usan las
+grabaciones de LLM_CASSETTE_DIR (crearlas antes con LLM_TRANSPORT=record).
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("LLM_TRANSPORT", "synthetic")  # antes de importar Config
+
+from config import Config  # noqa: E402
+from models.game import GameType, DifficultyLevel  # noqa: E402
+from services.ai_service import AIService  # noqa: E402
+from services.llm_transport import CassetteStore, ReplayTransport, SyntheticTransport  # noqa: E402
+
+TOPICS = ["la fotosíntesis", "los animales del Perú", "el ciclo del agua", "las fracciones"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["synthetic", "replay"], default="synthetic")
+    parser.add_argument("--runs", type=int, default=50, help="generaciones por tipo de juego")
+    parser.add_argument("--top", type=int, default=25, help="funciones a mostrar")
+    parser.add_argument("--cache", action="store_true", help="dejar activa la caché de contenido")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    service = AIService()
+    service.scheduler = None
+    if not args.cache:
+        service.cache = None
+    if args.transport == "replay":
+        service.transport = ReplayTransport(CassetteStore(Config.LLM_CASSETTE_DIR), speedup=1e9)
+    else:
+        service.transport = SyntheticTransport(seed=args.seed)
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    generated = 0
+    profiler.enable()
+    for i in range(args.runs):
+        for game_type in (GameType.TRIVIA, GameType.ADVENTURE, GameType.MARKET):
+            service.generate_game_content(TOPICS[i % len(TOPICS)], game_type, DifficultyLevel.MEDIUM,
+                                          "8-14", fresh=not args.cache)
+            generated += 1
+    profiler.disable()
+    elapsed = time.perf_counter() - start
+
+    print(f"{generated} generaciones en {elapsed:.2f}s ({elapsed / generated * 1000:.2f} ms c/u, transporte {args.transport})")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
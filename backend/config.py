@@ -24,9 +24,130 @@ class Config:
     MAX_TOKENS = int(os.getenv('MAX_TOKENS', '2000'))
     TEMPERATURE = float(os.getenv('TEMPERATURE', '0.7'))
     
+    # Caché de contenido generado (memory | sqlite | supabase)
+    CONTENT_CACHE_ENABLED = os.getenv('CONTENT_CACHE_ENABLED', 'True') == 'True'
+    CONTENT_CACHE_BACKEND = os.getenv('CONTENT_CACHE_BACKEND', 'memory')
+    CONTENT_CACHE_MAX_ENTRIES = int(os.getenv('CONTENT_CACHE_MAX_ENTRIES', '500'))
+    CONTENT_CACHE_MAX_BYTES = int(os.getenv('CONTENT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    CONTENT_CACHE_TTL_SECONDS = int(os.getenv('CONTENT_CACHE_TTL_SECONDS', '3600'))
+    CONTENT_CACHE_SQLITE_PATH = os.getenv('CONTENT_CACHE_SQLITE_PATH', 'content_cache.sqlite3')
+    
+    # Pool de contenido pre-generado para temas populares
+    CONTENT_POOL_ENABLED = os.getenv('CONTENT_POOL_ENABLED', 'False') == 'True'
+    CONTENT_POOL_DEPTH = int(os.getenv('CONTENT_POOL_DEPTH', '3'))
+    CONTENT_POOL_REFILL_CONCURRENCY = int(os.getenv('CONTENT_POOL_REFILL_CONCURRENCY', '2'))
+    CONTENT_POOL_HALF_LIFE_SECONDS = float(os.getenv('CONTENT_POOL_HALF_LIFE_SECONDS', '3600'))
+    CONTENT_POOL_MAX_KEYS = int(os.getenv('CONTENT_POOL_MAX_KEYS', '50'))
+    CONTENT_POOL_REFILL_INTERVAL_SECONDS = float(os.getenv('CONTENT_POOL_REFILL_INTERVAL_SECONDS', '15'))
+    CONTENT_POOL_MAX_REFILLS_PER_MINUTE = int(os.getenv('CONTENT_POOL_MAX_REFILLS_PER_MINUTE', '10'))
+    CONTENT_POOL_ITEM_TTL_SECONDS = float(os.getenv('CONTENT_POOL_ITEM_TTL_SECONDS', str(6 * 3600)))
+    CONTENT_POOL_MAX_TRACKED_KEYS = int(os.getenv('CONTENT_POOL_MAX_TRACKED_KEYS', '5000'))
+    
+    # Generación en paralelo por partes (tipos de juego separados por comas: trivia,adventure,market)
+    AI_FANOUT_GAME_TYPES = [t.strip() for t in os.getenv('AI_FANOUT_GAME_TYPES', '').split(',') if t.strip()]
+    AI_FANOUT_MAX_WORKERS = int(os.getenv('AI_FANOUT_MAX_WORKERS', '6'))
+    AI_FANOUT_EXTRA_CALLS = int(os.getenv('AI_FANOUT_EXTRA_CALLS', '1'))
+    # Juegos que se generan por partes a la vez en un proceso (como GUNICORN_THREADS)
+    AI_FANOUT_CONCURRENT_GAMES = int(os.getenv('AI_FANOUT_CONCURRENT_GAMES', '8'))
+    
+    # Feedback de la IA en segundo plano
+    FEEDBACK_WORKERS = int(os.getenv('FEEDBACK_WORKERS', '4'))
+    FEEDBACK_RETENTION_SECONDS = float(os.getenv('FEEDBACK_RETENTION_SECONDS', '600'))
+    FEEDBACK_STREAM_TIMEOUT_SECONDS = float(os.getenv('FEEDBACK_STREAM_TIMEOUT_SECONDS', '30'))
+    
+    # Caché de feedback por rango de porcentaje
+    FEEDBACK_CACHE_ENABLED = os.getenv('FEEDBACK_CACHE_ENABLED', 'True') == 'True'
+    FEEDBACK_CACHE_VARIANTS = int(os.getenv('FEEDBACK_CACHE_VARIANTS', '4'))
+    FEEDBACK_CACHE_TTL_SECONDS = int(os.getenv('FEEDBACK_CACHE_TTL_SECONDS', str(24 * 3600)))
+    FEEDBACK_CACHE_BUCKET_SIZE = int(os.getenv('FEEDBACK_CACHE_BUCKET_SIZE', '20'))
+    FEEDBACK_CACHE_MAX_KEYS = int(os.getenv('FEEDBACK_CACHE_MAX_KEYS', '2000'))
+    
+    # Transporte de las llamadas a la IA: live | record | replay | synthetic
+    LLM_TRANSPORT = os.getenv('LLM_TRANSPORT', 'live')
+    LLM_CASSETTE_DIR = os.getenv('LLM_CASSETTE_DIR', 'cassettes')
+    LLM_REPLAY_SPEEDUP = float(os.getenv('LLM_REPLAY_SPEEDUP', '1'))
+    LLM_TRANSPORT_SEED = int(os.getenv('LLM_TRANSPORT_SEED')) if os.getenv('LLM_TRANSPORT_SEED') else None
+    LLM_LATENCY_TTFT_SECONDS = float(os.getenv('LLM_LATENCY_TTFT_SECONDS', '0'))  # 0 y 0 = sin latencia simulada
+    LLM_LATENCY_TOKENS_PER_SECOND = float(os.getenv('LLM_LATENCY_TOKENS_PER_SECOND', '0'))
+    LLM_LATENCY_SIGMA = float(os.getenv('LLM_LATENCY_SIGMA', '0.25'))
+    
+    # Modelos de IA: principal, respaldo rápido y cortacircuitos
+    AI_PRIMARY_MODEL = os.getenv('AI_PRIMARY_MODEL', 'llama-3.3-70b-versatile')
+    AI_FALLBACK_MODEL = os.getenv('AI_FALLBACK_MODEL', 'llama-3.1-8b-instant')
+    AI_HEDGE_AFTER_SECONDS = float(os.getenv('AI_HEDGE_AFTER_SECONDS', '0'))  # 0 = sin petición de respaldo en paralelo
+    AI_BREAKER_FAILURES = int(os.getenv('AI_BREAKER_FAILURES', '5'))
+    AI_BREAKER_RESET_SECONDS = float(os.getenv('AI_BREAKER_RESET_SECONDS', '30'))
+    
+    # Planificador de llamadas a Groq (límites de la cuenta)
+    GROQ_SCHEDULER_ENABLED = os.getenv('GROQ_SCHEDULER_ENABLED', 'True') == 'True'
+    GROQ_RPM_LIMIT = int(os.getenv('GROQ_RPM_LIMIT', '30'))
+    GROQ_TPM_LIMIT = int(os.getenv('GROQ_TPM_LIMIT', '12000'))
+    GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '3'))
+    GROQ_RETRY_BASE_SECONDS = float(os.getenv('GROQ_RETRY_BASE_SECONDS', '1'))
+    GROQ_QUEUE_TIMEOUT_SECONDS = float(os.getenv('GROQ_QUEUE_TIMEOUT_SECONDS', '30'))
+    
+    # Conexiones HTTP reutilizables (keep-alive) hacia Supabase y Groq, compartidas por todo el proceso
+    HTTP_POOL_MAX_CONNECTIONS = int(os.getenv('HTTP_POOL_MAX_CONNECTIONS', '20'))
+    HTTP_POOL_MAX_KEEPALIVE = int(os.getenv('HTTP_POOL_MAX_KEEPALIVE', '10'))
+    HTTP_KEEPALIVE_SECONDS = float(os.getenv('HTTP_KEEPALIVE_SECONDS', '60'))
+    HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv('HTTP_CONNECT_TIMEOUT_SECONDS', '5'))
+    SUPABASE_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', '15'))
+    GROQ_TIMEOUT_SECONDS = float(os.getenv('GROQ_TIMEOUT_SECONDS', '60'))
+
+    # Contenido de las sesiones guardado una vez por hash en game_contents; contenidos recientes en memoria
+    GAME_CONTENTS_ENABLED = os.getenv('GAME_CONTENTS_ENABLED', 'True') == 'True'
+    GAME_CONTENTS_CACHE_SIZE = int(os.getenv('GAME_CONTENTS_CACHE_SIZE', '256'))
+
+    # Escritura diferida: submit encola el puntaje y las estadísticas en un journal local y un hilo
+    # los aplica en lotes cada WRITE_BEHIND_FLUSH_MS (requiere apply_stat_events de schema.sql)
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'False') == 'True'
+    WRITE_BEHIND_FLUSH_MS = float(os.getenv('WRITE_BEHIND_FLUSH_MS', '250'))
+    WRITE_BEHIND_MAX_BATCH = int(os.getenv('WRITE_BEHIND_MAX_BATCH', '500'))
+    WRITE_BEHIND_JOURNAL_DIR = os.getenv('WRITE_BEHIND_JOURNAL_DIR', 'write_behind')
+    WRITE_BEHIND_FSYNC = os.getenv('WRITE_BEHIND_FSYNC', 'True') == 'True'
+    WRITE_BEHIND_JOURNAL_MAX_BYTES = int(os.getenv('WRITE_BEHIND_JOURNAL_MAX_BYTES', str(1024 * 1024)))
+
+    # Cabecera X-DB-Calls con las llamadas a Supabase de cada petición (por defecto solo en DEBUG)
+    DB_CALLS_HEADER = os.getenv('DB_CALLS_HEADER', str(DEBUG)) == 'True'
+
+    # Ranking en memoria: cada worker lo carga de la tabla users y lo recarga cada tanto
+    LEADERBOARD_ENABLED = os.getenv('LEADERBOARD_ENABLED', 'True') == 'True'
+    LEADERBOARD_RECONCILE_SECONDS = float(os.getenv('LEADERBOARD_RECONCILE_SECONDS', '60'))
+    LEADERBOARD_MAX_USERS = int(os.getenv('LEADERBOARD_MAX_USERS', '100000'))
+    # Rankings por semana, mes y edad (tabla score_buckets): días que se conservan sin compactar
+    # y cada cuántas horas el hilo del ranking junta los días viejos en meses (0 = nunca)
+    SCORE_BUCKETS_KEEP_DAYS = int(os.getenv('SCORE_BUCKETS_KEEP_DAYS', '62'))
+    SCORE_BUCKETS_COMPACT_HOURS = float(os.getenv('SCORE_BUCKETS_COMPACT_HOURS', '24'))
+
+    # Logs: nivel, formato (text | json) y cuánto de cada payload grande se escribe
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+    LOG_MAX_CHARS = int(os.getenv('LOG_MAX_CHARS', '2000'))
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0.1'))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+    # Índice de temas canónicos (une "fotosintesis" y "la Fotosíntesis")
+    TOPIC_INDEX_ENABLED = os.getenv('TOPIC_INDEX_ENABLED', 'True') == 'True'
+    TOPIC_SIMILARITY_THRESHOLD = float(os.getenv('TOPIC_SIMILARITY_THRESHOLD', '0.75'))
+    TOPIC_INDEX_MAX_TOPICS = int(os.getenv('TOPIC_INDEX_MAX_TOPICS', '50000'))
+    # Unir un tema más específico al general que contiene ("animales de la selva" -> "Animales")
+    TOPIC_CONTAINMENT_MERGE = os.getenv('TOPIC_CONTAINMENT_MERGE', 'False') == 'True'
+    TOPIC_INDEX_SEED_SESSIONS = int(os.getenv('TOPIC_INDEX_SEED_SESSIONS', '1000'))
+    
+    # Banco de preguntas: arma juegos con elementos ya generados (memory | sqlite | supabase)
+    QUESTION_BANK_ENABLED = os.getenv('QUESTION_BANK_ENABLED', 'True') == 'True'
+    QUESTION_BANK_BACKEND = os.getenv('QUESTION_BANK_BACKEND', 'memory')
+    QUESTION_BANK_SQLITE_PATH = os.getenv('QUESTION_BANK_SQLITE_PATH', 'question_bank.sqlite3')
+    QUESTION_BANK_LOAD_LIMIT = int(os.getenv('QUESTION_BANK_LOAD_LIMIT', '20000'))
+    QUESTION_BANK_HISTORY_SESSIONS = int(os.getenv('QUESTION_BANK_HISTORY_SESSIONS', '30'))
+    
+    # Reparación de contenido: máximo de elementos inválidos que se regeneran por respuesta
+    CONTENT_REPAIR_MAX_ITEMS = int(os.getenv('CONTENT_REPAIR_MAX_ITEMS', '3'))  # 0 = no reparar, falla como antes
+    
     # Configuración de juegos
     TRIVIA_QUESTIONS_COUNT = 5
     ADVENTURE_CHOICES_COUNT = 3
+    ADVENTURE_SCENES_COUNT = 5
     MARKET_MISSIONS_COUNT = 3
     
     # Contexto local
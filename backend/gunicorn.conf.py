@@ -0,0 +1,31 @@
+"""Configuración de gunicorn: ``gunicorn app:app`` la toma automáticamente desde backend/.
+
+La app se importa una vez en el proceso maestro (preload_app) y los workers
+la heredan con fork. Las rutas no crean servicios al importarse
+(services.registry), así cada worker abre sus propios clientes de Supabase
+y Groq, con conexiones keep-alive (el registro y el hilo de logs se
+reinician solos en cada proceso hijo). ``post_fork`` los crea apenas nace
+el worker: la escritura diferida reenvía su journal y adopta los de
+workers caídos sin esperar a la primera partida.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+# Hilos por worker: las vistas pasan la mayor parte del tiempo esperando a Groq o Supabase
+worker_class = "gthread"
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+preload_app = True
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
+accesslog = "-"
+
+
+
+def post_fork(server, worker):
+    from services.registry import get_registry
+    try:
+        get_registry().warm()
+    except Exception as e:
+        # El worker sigue arrancando: cada servicio se vuelve a intentar en su primer uso
+        server.log.warning("No se pudieron crear los servicios del worker %s: %s", worker.pid, e)
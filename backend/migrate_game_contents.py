@@ -0,0 +1,84 @@
+"""Pasa el contenido de las sesiones existentes a game_contents.
+
+Uso (desde backend/, después de ejecutar database/schema.sql):
+    python migrate_game_contents.py --dry-run
+    python migrate_game_contents.py --batch-size 200
+
+Recorre las sesiones que todavía guardan su contenido en game_sessions.content,
+guarda cada contenido distinto una sola vez en game_contents (con el mismo hash
+que usa la app, ver services/game_contents.py) y deja en la sesión solo el
+content_id. Cada lote se escribe completo antes de pasar al siguiente; si se
+interrumpe, al volver a ejecutarlo sigue con las sesiones que faltan.
+"""
+import argparse
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from postgrest.types import ReturnMethod
+
+from config import Config
+from services.game_contents import canonical_json, content_hash, pack_content
+from services.logging_setup import setup_logging
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100, help="sesiones por lote")
+    parser.add_argument("--dry-run", action="store_true", help="solo medir cuánto se ahorraría, sin escribir")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    from supabase import create_client
+    client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+
+    sessions = 0
+    raw_bytes = 0
+    stored_bytes = 0
+    distinct = set()
+    last_id = None
+    while True:
+        query = client.table("game_sessions").select("id, content")\
+            .is_("content_id", "null").not_.is_("content", "null")
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(args.batch_size).execute().data or []
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+
+        by_content: Dict[str, List[str]] = defaultdict(list)
+        payloads: Dict[str, str] = {}
+        for row in rows:
+            content_id = content_hash(row["content"])
+            by_content[content_id].append(row["id"])
+            raw_bytes += len(canonical_json(row["content"]).encode("utf-8"))
+            if content_id not in distinct and content_id not in payloads:
+                payloads[content_id] = pack_content(row["content"])
+                stored_bytes += len(payloads[content_id])
+        sessions += len(rows)
+        distinct.update(by_content)
+
+        if not args.dry_run:
+            client.table("game_contents").upsert(
+                [{"content_id": content_id, "payload": payload} for content_id, payload in payloads.items()],
+                on_conflict="content_id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            ).execute()
+            # Una escritura por contenido distinto del lote, no por sesión
+            for content_id, session_ids in by_content.items():
+                client.table("game_sessions")\
+                    .update({"content_id": content_id, "content": None}, returning=ReturnMethod.minimal)\
+                    .in_("id", session_ids)\
+                    .execute()
+        print(f"📦 {sessions} sesiones, {len(distinct)} contenidos distintos")
+
+    ratio = (raw_bytes / stored_bytes) if stored_bytes else 0
+    print(f"{'🔍 (dry-run) ' if args.dry_run else '✅ '}{sessions} sesiones → {len(distinct)} contenidos; "
+          f"{raw_bytes / 1024:.0f} KB de JSON → {stored_bytes / 1024:.0f} KB guardados ({ratio:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -65,6 +65,7 @@ class GameContent(BaseModel):
     generated_at: datetime = Field(default_factory=datetime.now)
     local_context: str = "Perú"
     age_range: str = "8-14"
+    generated_by: Optional[str] = None  # modelo(s) de IA que generaron el contenido
 
 class GameSession(BaseModel):
     """Sesión de juego"""
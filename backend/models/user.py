@@ -1,8 +1,11 @@
+import logging
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 from datetime import datetime
 import hashlib
 
+logger = logging.getLogger(__name__)
+
 class User(BaseModel):
     """Modelo de usuario"""
     id: Optional[str] = None
@@ -35,7 +38,7 @@ class User(BaseModel):
             password_hash = hashlib.sha256(password.encode('utf-8')).hexdigest()
             return password_hash == hashed
         except Exception as e:
-            print(f"❌ Error verificando contraseña: {str(e)}")
+            logger.error("Error verificando contraseña: %s", e)
             return False
     
 class UserProgress(BaseModel):
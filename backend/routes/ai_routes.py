@@ -1,11 +1,18 @@
+import math
 from flask import Blueprint, request, jsonify
-from services import AIService, SupabaseService
 from models.game import GameType, DifficultyLevel, GameContent
 from pydantic import ValidationError
+from services.groq_scheduler import RateLimitedError, QueueTimeoutError
+from services.registry import lazy
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
-ai_service = AIService()
-db = SupabaseService()
+ai_service = lazy("ai")
+db = lazy("db")
+topic_index = lazy("topic_index")
+
+def canonical_topic(topic: str) -> str:
+    """Tema canónico compartido con /api/games/start"""
+    return topic_index.canonicalize(topic) if topic_index else topic
 
 @ai_bp.route('/generate-content', methods=['POST'])
 def generate_content():
@@ -17,9 +24,11 @@ def generate_content():
         game_type_str = data.get('game_type', 'trivia')
         difficulty_str = data.get('difficulty', 'medium')
         age_range = data.get('age_range', '8-14')
+        fresh = bool(data.get('fresh', False))
         
         if not topic:
             return jsonify({"error": "El tema es requerido"}), 400
+        topic = canonical_topic(topic)
         
         # Convertir strings a enums
         try:
@@ -33,7 +42,8 @@ def generate_content():
             topic=topic,
             game_type=game_type,
             difficulty=difficulty,
-            age_range=age_range
+            age_range=age_range,
+            fresh=fresh
         )
         
         return jsonify({
@@ -41,9 +51,112 @@ def generate_content():
             "content": content.model_dump()
         }), 200
         
+    except RateLimitedError as e:
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return response, 429
+    except QueueTimeoutError as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Error al generar contenido: {str(e)}"}), 500
 
+@ai_bp.route('/generate-bundle', methods=['POST'])
+def generate_bundle():
+    """Genera en paralelo trivia, aventura y mercadito para un mismo tema"""
+    try:
+        data = request.get_json()
+        
+        topic = data.get('topic')
+        difficulty_str = data.get('difficulty', 'medium')
+        age_range = data.get('age_range', '8-14')
+        game_type_strs = data.get('game_types') or [t.value for t in GameType]
+        fresh = bool(data.get('fresh', False))
+        
+        if not topic:
+            return jsonify({"error": "El tema es requerido"}), 400
+        topic = canonical_topic(topic)
+        
+        try:
+            difficulty = DifficultyLevel(difficulty_str)
+            game_types = [GameType(t) for t in game_type_strs]
+        except ValueError:
+            return jsonify({"error": "Tipo de juego o dificultad inválidos"}), 400
+        
+        bundle = ai_service.run(ai_service.generate_bundle(
+            topic=topic,
+            difficulty=difficulty,
+            age_range=age_range,
+            game_types=game_types,
+            fresh=fresh
+        ))
+        
+        if not bundle["contents"]:
+            return jsonify({
+                "error": "No se pudo generar ningún contenido",
+                "errors": bundle["errors"]
+            }), 500
+        
+        return jsonify({
+            "message": "Paquete generado exitosamente",
+            "contents": {
+                game_type: content.model_dump(mode="json")
+                for game_type, content in bundle["contents"].items()
+            },
+            "errors": bundle["errors"]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"error": f"Error al generar paquete: {str(e)}"}), 500
+
+@ai_bp.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Estadísticas de la caché de contenido generado"""
+    if ai_service.cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **ai_service.cache.stats()}), 200
+
+@ai_bp.route('/single-flight/stats', methods=['GET'])
+def single_flight_stats():
+    """Generaciones ejecutadas frente a llamadas agrupadas en una generación en curso"""
+    return jsonify(ai_service.content_flights.stats()), 200
+
+@ai_bp.route('/feedback-cache/stats', methods=['GET'])
+def feedback_cache_stats():
+    """Estadísticas de la caché de feedback (aciertos y llamadas a la IA)"""
+    if ai_service.feedback_cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **ai_service.feedback_cache.stats()}), 200
+
+@ai_bp.route('/models/stats', methods=['GET'])
+def model_stats():
+    """Qué modelo respondió cada llamada, respaldos lanzados y estado del cortacircuitos"""
+    return jsonify(ai_service.router.stats()), 200
+
+@ai_bp.route('/repair/stats', methods=['GET'])
+def repair_stats():
+    """Elementos inválidos detectados, reparados y tokens ahorrados frente a regenerar todo"""
+    return jsonify(ai_service.repairer.stats()), 200
+
+@ai_bp.route('/topics/clusters', methods=['GET'])
+def topic_clusters():
+    """Vista de administración: temas canónicos y las variantes que se unieron a cada uno"""
+    if not topic_index:
+        return jsonify({"enabled": False}), 200
+    min_size = request.args.get('min_size', 2, type=int)
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({
+        "enabled": True,
+        **topic_index.stats(),
+        "clusters": topic_index.clusters(min_size=min_size, limit=limit)
+    }), 200
+
+@ai_bp.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """Profundidad de la cola, tiempos de espera y reintentos de las llamadas a Groq"""
+    if ai_service.scheduler is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **ai_service.scheduler.stats()}), 200
+
 @ai_bp.route('/generate-feedback', methods=['POST'])
 def generate_feedback():
     """Genera feedback personalizado"""
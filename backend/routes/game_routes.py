@@ -1,27 +1,45 @@
-from flask import Blueprint, request, jsonify
-from services import AIService, SupabaseService
+import logging
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from models.game import GameType, DifficultyLevel
+from services.groq_scheduler import Priority, groq_context, RateLimitedError, QueueTimeoutError
+from services.question_bank import BANK_GENERATOR
+from services.logging_setup import log_payload
+from services.registry import lazy
+from services.supabase_service import InvalidCursor
+from config import Config
 from datetime import datetime  
+import json
+import math
+
+logger = logging.getLogger(__name__)
 
 game_bp = Blueprint('games', __name__, url_prefix='/api/games')
-ai_service = AIService()
-db = SupabaseService()
+
+# Servicios compartidos con las demás rutas; se crean en la primera petición (ver services.registry)
+ai_service = lazy("ai")
+db = lazy("db")
+content_pool = lazy("content_pool")        # pool de contenido pre-generado (opcional)
+feedback_worker = lazy("feedback_worker")  # feedback de la IA generado en segundo plano
+write_behind = lazy("write_behind")        # puntaje y estadísticas aplicados en lotes (opcional)
+# Temas canónicos: variantes como "fotosintesis" y "la Fotosíntesis" comparten contenido
+topic_index = lazy("topic_index")
 
 @game_bp.route('/start', methods=['POST'])
 def start_game():
     """Inicia una nueva sesión de juego"""
     try:
         data = request.get_json()
-        print(f"Datos recibidos para iniciar juego: {data}")
 
         user_id = data.get('user_id')
         topic = data.get('topic')
         game_type_str = data.get('game_type', 'trivia')
         difficulty_str = data.get('difficulty', 'medium')
         age_range = data.get('age_range', '8-14')
+        fresh = bool(data.get('fresh', False))
 
         if not all([user_id, topic, game_type_str]):
             return jsonify({"error": "Faltan datos requeridos"}), 400
+        topic = canonical_topic(topic)
         
         # Verificar que el usuario existe
         user = db.get_user(user_id)
@@ -35,20 +53,29 @@ def start_game():
         except ValueError as e:
             return jsonify({"error": f"Tipo de juego o dificultad inválidos: {str(e)}"}), 400
         
-        print(f"   Generando contenido con IA...")
-        print(f"   Tema: {topic}")
-        print(f"   Tipo: {game_type.value}")
-        print(f"   Dificultad: {difficulty.value}")
-        
-        # Generar contenido con IA
-        game_content = ai_service.generate_game_content(
-            topic=topic,
-            game_type=game_type,
-            difficulty=difficulty,
-            age_range=age_range
-        )
+        # Generar contenido con IA (o tomarlo del pool pre-generado)
+        with groq_context(Priority.INTERACTIVE, user_id):
+            if content_pool:
+                game_content, source = content_pool.acquire(
+                    topic=topic,
+                    game_type=game_type,
+                    difficulty=difficulty,
+                    age_range=age_range,
+                    fresh=fresh,
+                    user_id=user_id
+                )
+            else:
+                game_content = ai_service.generate_game_content(
+                    topic=topic,
+                    game_type=game_type,
+                    difficulty=difficulty,
+                    age_range=age_range,
+                    fresh=fresh,
+                    user_id=user_id
+                )
+                source = "bank" if game_content.generated_by == BANK_GENERATOR else "generated"
 
-        print(f"Contenido del juego generado: {game_content}")
+        log_payload(logger, "Contenido del juego", game_content, source=source)
 
         # Convertir contenido a dict
         content_dict = game_content.model_dump()
@@ -64,7 +91,12 @@ def start_game():
             content=content_dict 
         )
         
-        print(f" Sesión creada: {session['id']}")
+        logger.info("Sesión creada", extra={
+            "session_id": session['id'], "user_id": user_id, "topic": topic,
+            "game_type": game_type.value, "difficulty": difficulty.value, "source": source
+        })
+        if ai_service.bank is not None:
+            ai_service.bank.mark_seen(user_id, game_content)
 
         # Convertir contenido a dict
         content_dict = game_content.model_dump()
@@ -81,20 +113,129 @@ def start_game():
         
         return jsonify(response_data), 201
         
+    except RateLimitedError as e:
+        logger.warning("Groq limitó las peticiones en start_game: %s", e)
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(max(1, math.ceil(e.retry_after)))
+        return response, 429
+    except QueueTimeoutError as e:
+        logger.warning("Cola de IA saturada en start_game: %s", e)
+        return jsonify({"error": "Hay muchos juegos generándose ahora mismo. Intenta de nuevo en un momento"}), 503
     except Exception as e:
-        print(f"Error en start_game: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en start_game")
         return jsonify({"error": f"Error al iniciar juego: {str(e)}"}), 500
 
+@game_bp.route('/start/stream', methods=['POST'])
+def start_game_stream():
+    """Inicia una sesión de juego enviando cada pregunta o escena por Server-Sent Events"""
+    data = request.get_json() or {}
+
+    user_id = data.get('user_id')
+    topic = data.get('topic')
+    game_type_str = data.get('game_type', 'trivia')
+    difficulty_str = data.get('difficulty', 'medium')
+    age_range = data.get('age_range', '8-14')
+    fresh = bool(data.get('fresh', False))
+
+    if not all([user_id, topic, game_type_str]):
+        return jsonify({"error": "Faltan datos requeridos"}), 400
+    topic = canonical_topic(topic)
+
+    try:
+        game_type = GameType(game_type_str)
+        difficulty = DifficultyLevel(difficulty_str)
+    except ValueError as e:
+        return jsonify({"error": f"Tipo de juego o dificultad inválidos: {str(e)}"}), 400
+
+    user = db.get_user(user_id)
+    if not user:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+
+    if content_pool:
+        content_pool.record_request(topic, game_type, difficulty, age_range)
+
+    def generate():
+        try:
+            game_content = None
+            with groq_context(Priority.INTERACTIVE, user_id):
+                for event, item in ai_service.stream_game_content(
+                    topic=topic,
+                    game_type=game_type,
+                    difficulty=difficulty,
+                    age_range=age_range,
+                    fresh=fresh
+                ):
+                    if event == "content":
+                        game_content = item
+                    else:
+                        yield _sse(event, item.model_dump(mode="json"))
+
+            # Guardar la sesión una vez terminado el stream
+            session = db.create_game_session(
+                user_id=user_id,
+                topic=topic,
+                game_type=game_type.value,
+                difficulty=difficulty.value,
+                age_range=age_range,
+                content=game_content.model_dump(mode="json")
+            )
+            logger.info("Sesión creada (streaming)", extra={
+                "session_id": session['id'], "user_id": user_id, "topic": topic,
+                "game_type": game_type.value, "difficulty": difficulty.value
+            })
+            if ai_service.bank is not None:
+                ai_service.bank.mark_seen(user_id, game_content)
+            yield _sse("session", {"message": "Sesión de juego creada", "session": session})
+        except RateLimitedError as e:
+            yield _sse("error", {"error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            logger.exception("Error en start_game_stream")
+            yield _sse("error", {"error": f"Error al iniciar juego: {str(e)}"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def canonical_topic(topic: str) -> str:
+    """Tema canónico para caché, pool y banco (el mismo texto si el índice está deshabilitado)"""
+    return topic_index.canonicalize(topic) if topic_index else topic
+
+def _sse(event: str, data) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@game_bp.route('/bank/stats', methods=['GET'])
+def bank_stats():
+    """Tamaño del banco de preguntas, juegos armados sin IA y elementos más difíciles"""
+    if ai_service.bank is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **ai_service.bank.stats()}), 200
+
+@game_bp.route('/bank/items/<item_id>', methods=['GET'])
+def bank_item_stats(item_id):
+    """Veces servido, respondido y acertado de un elemento del banco"""
+    if ai_service.bank is None:
+        return jsonify({"error": "El banco de preguntas está deshabilitado"}), 404
+    stats = ai_service.bank.item_stats(item_id)
+    if stats is None:
+        return jsonify({"error": "Elemento no encontrado"}), 404
+    return jsonify(stats), 200
+
+@game_bp.route('/pool/stats', methods=['GET'])
+def pool_stats():
+    """Estadísticas del pool de contenido pre-generado"""
+    if not content_pool:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **content_pool.stats()}), 200
+
 @game_bp.route('/<session_id>/submit', methods=['POST'])
 def submit_game(session_id):
     """Envía las respuestas y completa el juego"""
     try:
         data = request.get_json()
-        
-        print(f"Enviando respuestas para sesión: {session_id}")
-        print(f"   Respuestas: {data}")
+        log_payload(logger, "Respuestas recibidas", data, session_id=session_id)
         
         answers = data.get('answers', [])
         
@@ -116,26 +257,26 @@ def submit_game(session_id):
         
         coins = score // 10
 
-        db.update_game_session(session_id, score, answers, status="completed")
-        
-        db.update_user_score(
-            user_id=session['user_id'],
-            score=score,
-            coins=coins
-        )
-        db.update_user_statistics(
-            user_id=session['user_id'],
-            game_type=session['game_type'],
-            intelligence_scores=intelligence_analysis,
-            topic=session['topic']
-        )
+        # Sesión, puntaje, estadísticas y logros en una sola transacción, o con la escritura
+        # diferida: la sesión ahora y lo demás en el siguiente lote
+        recorder = write_behind if write_behind else db
+        submission = recorder.submit_game_session(session, score, coins, answers, intelligence_analysis)
+        if submission.get('status') == 'already_completed':
+            return jsonify({"error": "Esta sesión ya fue completada"}), 400
+        if submission.get('status') == 'not_found':
+            return jsonify({"error": "Sesión no encontrada"}), 404
+        if ai_service.bank is not None:
+            ai_service.bank.record_answers(session['game_type'], session['content'], answers)
         
-        feedback = ai_service.generate_feedback(
+        # El feedback de la IA se genera aparte; se responde con un mensaje provisional
+        feedback_ticket = feedback_worker.submit(
+            session_id=session_id,
             topic=session['topic'],
             score=score,
             max_score=max_score,
             game_type=GameType(session['game_type']),
-            answers=answers
+            answers=answers,
+            user_id=session['user_id']
         )
         
         percentage = (score / max_score * 100) if max_score > 0 else 0
@@ -147,7 +288,6 @@ def submit_game(session_id):
             recommendations.append("¡Buen trabajo! Sigue practicando para mejorar")
         else:
             recommendations.append("Sigue intentándolo. La práctica hace al maestro")
-        check_achievements(session['user_id'], score, session['game_type'])
         response = {
             "result": {
                 "session_id": session_id,
@@ -157,23 +297,54 @@ def submit_game(session_id):
                 "max_score": max_score,
                 "coins_earned": coins,
                 "percentage": percentage,
-                "feedback": feedback,
+                "feedback": feedback_ticket['placeholder'],
+                "feedback_ticket": feedback_ticket['ticket'],
+                "feedback_status": feedback_ticket['status'],
                 "intelligence_analysis": intelligence_analysis,
-                "recommendations": recommendations
+                "recommendations": recommendations,
+                "achievements": submission.get('achievements', [])
             }
         }
         
-        print(f"Juego completado - Score: {score}/{max_score} ({percentage:.1f}%)")
+        logger.info("Juego completado", extra={
+            "session_id": session_id, "user_id": session['user_id'], "score": score, "max_score": max_score
+        })
         
         return jsonify(response), 200
         
     except Exception as e:
-        print(f"Error en submit_game: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en submit_game")
         return jsonify({"error": str(e)}), 500
 
 
+@game_bp.route('/<session_id>/feedback', methods=['GET'])
+def get_feedback(session_id):
+    """Consulta el feedback de la IA de una sesión completada"""
+    feedback = feedback_worker.get(session_id)
+    if feedback is None:
+        return jsonify({"error": "No hay feedback para esta sesión"}), 404
+    return jsonify(feedback), 200
+
+@game_bp.route('/<session_id>/feedback/stream', methods=['GET'])
+def stream_feedback(session_id):
+    """Envía el feedback por Server-Sent Events apenas está listo"""
+    feedback = feedback_worker.get(session_id)
+    if feedback is None:
+        return jsonify({"error": "No hay feedback para esta sesión"}), 404
+
+    def generate():
+        current = feedback
+        if current['status'] == 'pending':
+            yield _sse("placeholder", current)
+            current = feedback_worker.wait(session_id, Config.FEEDBACK_STREAM_TIMEOUT_SECONDS)
+        yield _sse("feedback" if current and current['status'] != 'pending' else "timeout", current)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @game_bp.route('/<session_id>', methods=['GET'])
 def get_game(session_id):
     """Obtiene una sesión de juego"""
@@ -264,59 +435,19 @@ def calculate_score(content, answers, game_type):
     
     return score, max_score, intelligence_analysis
 
-def check_achievements(user_id, score, game_type):
-    """Verifica y otorga logros"""
-    try:
-        # Obtener estadísticas actualizadas
-        stats = db.get_user_statistics(user_id)
-        if not stats:
-            return
-        
-        # Logro: Primera victoria
-        if stats['games_played'] == 1:
-            db.add_achievement(
-                user_id=user_id,
-                achievement_type="first_game",
-                title="🎮 Primer Juego",
-                description="¡Completaste tu primer juego en YachAI!"
-            )
-        
-        # Logro: 5 juegos completados
-        if stats['games_played'] == 5:
-            db.add_achievement(
-                user_id=user_id,
-                achievement_type="dedicated",
-                title="🔥 Dedicado",
-                description="¡Completaste 5 juegos!"
-            )
-        
-        # Logro: 10 juegos completados
-        if stats['games_played'] == 10:
-            db.add_achievement(
-                user_id=user_id,
-                achievement_type="veteran",
-                title="⭐ Veterano",
-                description="¡Completaste 10 juegos!"
-            )
-        
-        # Logro: Puntuación alta
-        if score >= 50:
-            db.add_achievement(
-                user_id=user_id,
-                achievement_type="high_score",
-                title="🌟 Súper Estrella",
-                description="¡Obtuviste más de 50 puntos en un juego!"
-            )
-    except Exception as e:
-        print(f"❌ Error verificando logros: {str(e)}")
-        
 @game_bp.route('/user/<user_id>/sessions', methods=['GET'])
 def get_user_sessions(user_id):
-    """Obtiene las sesiones de un usuario"""
+    """Obtiene una página del historial de juegos de un usuario (igual que /api/users/<user_id>/sessions)"""
     try:
-        limit = request.args.get('limit', 10, type=int)
-        sessions = db.get_user_game_sessions(user_id, limit)
-        return jsonify(sessions), 200
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        try:
+            sessions, next_cursor = db.get_user_session_page(user_id, limit, request.args.get('cursor'))
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+        response = jsonify(sessions)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
     except Exception as e:
-        print(f"Error en get_user_sessions: {str(e)}")
+        logger.exception("Error en get_user_sessions")
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -1,10 +1,16 @@
+import logging
 from flask import Blueprint, request, jsonify
-from services import SupabaseService
+from services.registry import lazy
+from services.leaderboard import AGE_BRACKETS, WINDOWS, assign_ranks, window_start
+from services.supabase_service import InvalidCursor
 from models.user import User
 from pydantic import ValidationError
 
+logger = logging.getLogger(__name__)
+
 user_bp = Blueprint('users', __name__, url_prefix='/api/users')
-db = SupabaseService()
+db = lazy("db")
+leaderboard = lazy("leaderboard")
 
 @user_bp.route('/register', methods=['POST'])
 def register_user():
@@ -12,8 +18,6 @@ def register_user():
     try:
         data = request.get_json()
         
-        print(f"📥 Datos recibidos: {data}")
-        
         if not data:
             return jsonify({"error": "No se enviaron datos"}), 400
         
@@ -43,7 +47,7 @@ def register_user():
                 email=email
             )
         except ValidationError as ve:
-            print(f"❌ Error de validación: {ve}")
+            logger.info("Registro con %d dato(s) inválido(s)", ve.error_count())
             return jsonify({
                 "error": "Datos inválidos",
                 "details": ve.errors()
@@ -63,17 +67,13 @@ def register_user():
             email=email
         )
         
-        print(f"✅ Usuario creado: {new_user}")
-        
         return jsonify({
             "message": "Usuario creado exitosamente",
             "user": new_user
         }), 201
         
     except Exception as e:
-        print(f"❌ Error en register_user: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en register_user")
         return jsonify({"error": f"Error al crear usuario: {str(e)}"}), 500
 
 @user_bp.route('/login', methods=['POST'])
@@ -100,7 +100,7 @@ def login_user():
             return jsonify({"error": "Credenciales inválidas"}), 401
             
     except Exception as e:
-        print(f"❌ Error en login_user: {str(e)}")
+        logger.exception("Error en login_user")
         return jsonify({"error": str(e)}), 500
         
 @user_bp.route('/<user_id>', methods=['GET'])
@@ -154,20 +154,55 @@ def get_achievements(user_id):
 
 @user_bp.route('/<user_id>/sessions', methods=['GET'])
 def get_user_sessions(user_id):
-    """Obtiene las sesiones de juego del usuario"""
+    """Obtiene una página del historial de juegos del usuario (resumen, sin contenido)"""
     try:
-        limit = request.args.get('limit', 10, type=int)
-        sessions = db.get_user_sessions(user_id, limit)
-        return jsonify(sessions), 200
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        try:
+            sessions, next_cursor = db.get_user_session_page(user_id, limit, request.args.get('cursor'))
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+        response = jsonify(sessions)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @user_bp.route('/leaderboard', methods=['GET'])
 def get_leaderboard():
-    """Obtiene el ranking global"""
+    """Obtiene el ranking global, de la semana o del mes, y opcionalmente de un rango de edad"""
     try:
         limit = request.args.get('limit', 10, type=int)
-        leaderboard = db.get_leaderboard(limit)
-        return jsonify(leaderboard), 200
+        window = request.args.get('window', 'all')
+        bracket = request.args.get('age_bracket')
+        if window not in WINDOWS:
+            return jsonify({"error": f"window debe ser uno de: {', '.join(WINDOWS)}"}), 400
+        if bracket is not None and bracket not in AGE_BRACKETS:
+            return jsonify({"error": f"age_bracket debe ser uno de: {', '.join(AGE_BRACKETS)}"}), 400
+
+        if window != 'all' or bracket:
+            rows = db.get_windowed_leaderboard(window_start(window), bracket, limit)
+            return jsonify(assign_ranks(rows, 'score')), 200
+        if leaderboard and leaderboard.ready.is_set():
+            return jsonify(leaderboard.top(limit)), 200
+        # Ranking en memoria deshabilitado o todavía cargando
+        return jsonify(assign_ranks(db.get_leaderboard(limit))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@user_bp.route('/<user_id>/rank', methods=['GET'])
+def get_user_rank(user_id):
+    """Puesto del usuario en el ranking global y los usuarios cercanos"""
+    try:
+        radius = min(max(request.args.get('radius', 2, type=int), 0), 50)
+        if leaderboard and leaderboard.ready.is_set():
+            result = leaderboard.around(user_id, radius)
+            if result is None:
+                return jsonify({"error": "Usuario no encontrado"}), 404
+            return jsonify(result), 200
+        result = db.get_user_rank(user_id)
+        if result is None:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        return jsonify({**result, "around": []}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
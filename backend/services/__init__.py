@@ -1,4 +1,8 @@
 from .ai_service import AIService
+from .async_ai_service import AsyncAIService
 from .supabase_service import SupabaseService
+from .content_cache import ContentCache
+from .content_pool import ContentPool
+from .feedback_worker import FeedbackWorker
 
-__all__ = ['AIService', 'SupabaseService']
+__all__ = ['AIService', 'AsyncAIService', 'SupabaseService', 'ContentCache', 'ContentPool', 'FeedbackWorker']
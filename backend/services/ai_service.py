@@ -1,59 +1,343 @@
 import json
+import logging
+import httpx
 from groq import Groq
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Iterator, Tuple
 from models.game import GameContent, GameType, TriviaQuestion, AdventureStory, AdventureScene, MarketMission, DifficultyLevel
 from config import Config
-import re;
+from services.content_cache import get_shared_cache, make_cache_key
+from services.single_flight import SingleFlight
+from services.json_parsing import JsonItemStream, JsonExtractionError, extract_json, as_item_list
+from services.fanout_generation import FanoutGenerator
+from services.feedback_cache import get_shared_feedback_cache
+from services.groq_scheduler import SchedulerError, get_shared_scheduler, estimate_tokens, record_usage
+from services.llm_transport import build_transport
+from services.model_router import get_shared_router, track_models, models_label
+from services.content_repair import ContentRepairer
+from services.question_bank import get_shared_question_bank, BANKABLE_GAME_TYPES
+from services.logging_setup import Truncated, log_payload
+
+logger = logging.getLogger(__name__)
+
+JSON_SYSTEM_PROMPT = "Eres un asistente que SOLO responde con JSON válido, sin texto adicional."
+
+
+def groq_timeout() -> httpx.Timeout:
+    return httpx.Timeout(Config.GROQ_TIMEOUT_SECONDS, connect=Config.HTTP_CONNECT_TIMEOUT_SECONDS)
 
 class AIService:
     """Servicio para generar contenido educativo con IA"""
     
-    def __init__(self):
-        self.client = Groq(api_key=Config.GROQ_API_KEY)
-        self.model = "llama-3.3-70b-versatile"  # Cambiado de llama-3.1-70b-versatile
-        
+    # Compartido por todas las instancias del proceso para agrupar generaciones idénticas
+    content_flights = SingleFlight()
     
-    def _clean_json_response(self, text: str, prefer_top: str = "auto") -> str:
-        # Quitar fences de markdown
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
-        text = text.strip()
+    def __init__(self, http_client: Optional[httpx.Client] = None):
+        # En replay/synthetic no se usa Groq (ni hace falta la API key)
+        self.client = Groq(
+            api_key=Config.GROQ_API_KEY,
+            http_client=http_client,
+            timeout=groq_timeout()
+        ) if Config.LLM_TRANSPORT in ("live", "record") else None
+        self.transport = build_transport(self.client)
+        self.model = Config.AI_PRIMARY_MODEL
+        self.router = get_shared_router()
+        self.cache = get_shared_cache() if Config.CONTENT_CACHE_ENABLED else None
+        self.fanout = FanoutGenerator(self, Config.AI_FANOUT_MAX_WORKERS, Config.AI_FANOUT_EXTRA_CALLS,
+                                      Config.AI_FANOUT_CONCURRENT_GAMES)
+        self.fanout_game_types = set(Config.AI_FANOUT_GAME_TYPES)
+        self.feedback_cache = get_shared_feedback_cache() if Config.FEEDBACK_CACHE_ENABLED else None
+        self.scheduler = get_shared_scheduler() if Config.GROQ_SCHEDULER_ENABLED else None
+        self.repairer = ContentRepairer(self, Config.CONTENT_REPAIR_MAX_ITEMS)
+        self.bank = get_shared_question_bank() if Config.QUESTION_BANK_ENABLED else None
+        
+    def _chat_params(self, prompt: str, temperature: float, max_tokens: int,
+                     system: Optional[str] = JSON_SYSTEM_PROMPT,
+                     response_format: Optional[Dict[str, str]] = None,
+                     model: Optional[str] = None) -> Dict[str, Any]:
+        """Parámetros comunes para una llamada de chat"""
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        params = {
+            "messages": messages,
+            "model": model or self.model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if response_format:
+            params["response_format"] = response_format
+        return params
+
+    def _chat(self, prompt: str, temperature: float, max_tokens: int,
+              system: Optional[str] = JSON_SYSTEM_PROMPT,
+              response_format: Optional[Dict[str, str]] = None) -> str:
+        """Ejecuta una llamada de chat y devuelve el texto de la respuesta"""
+        def call(model: str) -> str:
+            params = self._chat_params(prompt, temperature, max_tokens, system, response_format, model)
+            response = self._schedule(lambda: self.transport.create(**params), params)
+            record_usage(response)
+            return response.choices[0].message.content
+
+        text, _ = self.router.complete(call, self._response_validator(system, response_format))
+        return text
 
-        # Intento directo: ¿ya es JSON válido?
+    @staticmethod
+    def _response_validator(system: Optional[str], response_format: Optional[Dict[str, str]]):
+        """Una respuesta es válida si trae texto y, cuando se pidió JSON, se puede parsear completa"""
+        expects_json = system == JSON_SYSTEM_PROMPT or bool(response_format)
+
+        def validate(text: Optional[str]) -> bool:
+            if not text or not text.strip():
+                return False
+            if not expects_json:
+                return True
+            try:
+                extract_json(text)  # una respuesta truncada no es válida: mejor probar el otro modelo
+                return True
+            except ValueError:
+                return False
+        return validate
+
+    def _schedule(self, create, params: Dict[str, Any]) -> Any:
+        """Pasa la llamada a Groq por el planificador (límites, prioridad, reintentos)"""
+        if self.scheduler is None:
+            return create()
+        return self.scheduler.call(create, estimate_tokens(params["messages"], params["max_tokens"]))
+
+    def _chat_stream(self, prompt: str, temperature: float, max_tokens: int,
+                     system: Optional[str] = JSON_SYSTEM_PROMPT,
+                     response_format: Optional[Dict[str, str]] = None) -> Iterator[str]:
+        """Ejecuta una llamada de chat en streaming y va entregando los fragmentos de texto"""
+        # En streaming no hay respaldo en paralelo: solo se respeta el cortacircuitos
+        model = self.router.pick_model()
+        params = self._chat_params(prompt, temperature, max_tokens, system, response_format, model)
         try:
-            json.loads(text)
-            return text
+            stream = self._schedule(lambda: self.transport.create(**params, stream=True), params)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except SchedulerError:
+            self.router.release(model)
+            raise
         except Exception:
-            pass
-
-        # Búsquedas
-        obj_match = re.search(r'\{[\s\S]*\}', text)   # objeto más amplio
-        arr_match = re.search(r'\[[\s\S]*\]', text)   # array más amplio
-
-        def _strip_comments(s: str) -> str:
-            # quita //comentarios al final de línea o fin de texto
-            return re.sub(r'//.*?(?:\n|$)', '', s)
-
-        # Preferencia explícita
-        if prefer_top == "object" and obj_match:
-            return _strip_comments(obj_match.group(0))
-        if prefer_top == "array" and arr_match:
-            return _strip_comments(arr_match.group(0))
-
-        # Heurística "auto"
-        if obj_match and ('"scenes"' in obj_match.group(0) or '"title"' in obj_match.group(0)):
-            return _strip_comments(obj_match.group(0))
-        if arr_match:
-            return _strip_comments(arr_match.group(0))
-        if obj_match:
-            return _strip_comments(obj_match.group(0))
-
-        return text
-
+            self.router.report(model, ok=False)
+            raise
+        self.router.report(model, ok=True)
+        
+    
     def generate_game_content(self, topic: str, game_type: GameType, 
                              difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
-                             age_range: str = "8-14") -> GameContent:
-        """Genera contenido para un juego específico"""
+                             age_range: str = "8-14", fresh: bool = False,
+                             user_id: Optional[str] = None) -> GameContent:
+        """Genera contenido para un juego específico (usa la caché salvo que se pida una variante nueva).
+
+        Con ``user_id`` primero se intenta armar el juego con elementos del
+        banco de preguntas que el usuario no vio.
+        """
+        
+        if user_id:
+            banked = self.assemble_from_bank(topic, game_type, difficulty, age_range, user_id)
+            if banked is not None:
+                return banked
+        
+        key = make_cache_key(topic, game_type, difficulty, age_range)
+        if fresh:
+            # Variante nueva a propósito: no se comparte con otras llamadas en curso
+            return self._generate_and_cache(key, topic, game_type, difficulty, age_range)
+        
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        content, _ = self.content_flights.do(
+            key,
+            lambda: self._generate_and_cache(key, topic, game_type, difficulty, age_range)
+        )
+        return content
+
+    def _generate_and_cache(self, key: str, topic: str, game_type: GameType,
+                            difficulty: DifficultyLevel, age_range: str) -> GameContent:
+        content = self._generate_content_live(topic, game_type, difficulty, age_range)
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return content
+
+    def stream_game_content(self, topic: str, game_type: GameType,
+                            difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+                            age_range: str = "8-14", fresh: bool = False) -> Iterator[Tuple[str, Any]]:
+        """Genera contenido en streaming.
+
+        Entrega ("question" | "scene" | "mission", elemento) apenas cada elemento
+        está completo y al final ("content", GameContent).
+        """
+        if not fresh:
+            cached = self.get_cached_content(topic, game_type, difficulty, age_range)
+            if cached is not None:
+                for event in self._content_events(cached):
+                    yield event
+                yield "content", cached
+                return
+
+        prompt, params = self._content_request(topic, game_type, difficulty, age_range)
+        if game_type == GameType.TRIVIA:
+            marker, event_name = "question", "question"
+            build = lambda data: self._build_trivia_question(data, difficulty)
+        elif game_type == GameType.ADVENTURE:
+            marker, event_name = "scene_number", "scene"
+            build = self._build_adventure_scene
+        else:
+            marker, event_name = "mission_id", "mission"
+            build = self._build_market_mission
+
+        parser = JsonItemStream(marker)
+        items = []
+        with track_models() as models:
+            for chunk in self._chat_stream(prompt, **params):
+                for data in parser.feed(chunk):
+                    try:
+                        item = build(data)
+                    except (KeyError, ValueError) as e:
+                        logger.warning("Elemento inválido en streaming (%s): %s", event_name, e)
+                        continue
+                    items.append(item)
+                    yield event_name, item
+
+        if not items:
+            raise ValueError(f"La IA no devolvió elementos válidos para {game_type.value}")
+
+        if game_type == GameType.TRIVIA:
+            game_data = {"trivia_questions": items}
+        elif game_type == GameType.ADVENTURE:
+            game_data = {"adventure_story": self._assemble_streamed_story(topic, parser.full_text(), items)}
+        else:
+            game_data = {"market_missions": items}
+        content = GameContent(
+            topic=topic,
+            game_type=game_type,
+            difficulty=difficulty,
+            age_range=age_range,
+            generated_by=models_label(models),
+            **game_data
+        )
+
+        self.cache_content(content)
+        self.bank_content(content)
+        yield "content", content
+
+    def _assemble_streamed_story(self, topic: str, raw_response: str, scenes: List[AdventureScene]) -> AdventureStory:
+        """Arma la historia con las escenas ya emitidas y los datos generales del JSON completo"""
+        try:
+            story_data = extract_json(raw_response, prefer="object", partial=True)
+        except (json.JSONDecodeError, JsonExtractionError):
+            story_data = {}
+        if not isinstance(story_data, dict):
+            story_data = {}
+        return AdventureStory(
+            title=story_data.get("title", f"Aventura educativa sobre {topic}"),
+            introduction=story_data.get("introduction", ""),
+            scenes=scenes,
+            conclusion=story_data.get("conclusion", ""),
+            total_scenes=len(scenes)
+        )
+
+    def _content_events(self, content: GameContent) -> Iterator[Tuple[str, Any]]:
+        """Eventos de streaming para un contenido ya generado"""
+        if content.trivia_questions:
+            for question in content.trivia_questions:
+                yield "question", question
+        if content.adventure_story:
+            for scene in content.adventure_story.scenes:
+                yield "scene", scene
+        if content.market_missions:
+            for mission in content.market_missions:
+                yield "mission", mission
+
+    def get_cached_content(self, topic: str, game_type: GameType,
+                           difficulty: DifficultyLevel, age_range: str) -> Optional[GameContent]:
+        """Devuelve el contenido en caché, si existe"""
+        if self.cache is None:
+            return None
+        return self.cache.get(make_cache_key(topic, game_type, difficulty, age_range))
+
+    def cache_content(self, content: GameContent):
+        """Guarda en caché un contenido generado fuera de generate_game_content"""
+        if self.cache is not None:
+            self.cache.set(make_cache_key(content.topic, content.game_type, content.difficulty, content.age_range), content)
+
+    def generate_variant(self, topic: str, game_type: GameType,
+                         difficulty: DifficultyLevel, age_range: str) -> GameContent:
+        """Genera una variante nueva sin leer ni escribir la caché (para el pool de contenido)"""
+        return self._generate_content_live(topic, game_type, difficulty, age_range)
+
+    def assemble_from_bank(self, topic: str, game_type: GameType, difficulty: DifficultyLevel,
+                           age_range: str, user_id: Optional[str] = None) -> Optional[GameContent]:
+        """Juego armado con el banco de preguntas, sin llamar a la IA (None si el banco no alcanza)"""
+        if self.bank is None or game_type not in BANKABLE_GAME_TYPES:
+            return None
+        return self.bank.assemble(topic, game_type, difficulty, age_range, user_id)
+
+    def bank_content(self, content: GameContent):
+        """Agrega al banco de preguntas los elementos de un contenido recién generado"""
+        if self.bank is not None:
+            try:
+                self.bank.add_content(content)
+            except Exception as e:
+                logger.warning("Error agregando al banco de preguntas: %s", e)
+
+    def _content_request(self, topic: str, game_type: GameType,
+                         difficulty: DifficultyLevel, age_range: str) -> Tuple[str, Dict[str, Any]]:
+        """Prompt y parámetros de la llamada para cada tipo de juego"""
+        if game_type == GameType.TRIVIA:
+            return self._trivia_prompt(topic, difficulty, age_range), {
+                "temperature": Config.TEMPERATURE,
+                "max_tokens": Config.MAX_TOKENS
+            }
+        if game_type == GameType.ADVENTURE:
+            return self._adventure_prompt(topic, difficulty, age_range), {
+                "temperature": 0.7,
+                "max_tokens": 2500,
+                "response_format": {"type": "json_object"}
+            }
+        return self._market_prompt(topic, difficulty, age_range), {
+            "temperature": 0.7,
+            "max_tokens": Config.MAX_TOKENS
+        }
+
+    def _parse_content(self, raw_response: str, topic: str, game_type: GameType,
+                       difficulty: DifficultyLevel, age_range: str) -> GameContent:
+        """Convierte la respuesta cruda de la IA en un GameContent"""
+        if game_type == GameType.TRIVIA:
+            game_data = {"trivia_questions": self._parse_trivia(raw_response, topic, difficulty, age_range)}
+        elif game_type == GameType.ADVENTURE:
+            game_data = {"adventure_story": self._parse_adventure(raw_response, topic, difficulty, age_range)}
+        else:
+            game_data = {"market_missions": self._parse_market(raw_response, topic, difficulty, age_range)}
+        return GameContent(
+            topic=topic,
+            game_type=game_type,
+            difficulty=difficulty,
+            age_range=age_range,
+            **game_data
+        )
+
+    def _use_fanout(self, game_type: GameType) -> bool:
+        """Indica si este tipo de juego se genera en paralelo por partes"""
+        return game_type.value in self.fanout_game_types
+
+    def _generate_content_live(self, topic: str, game_type: GameType,
+                               difficulty: DifficultyLevel, age_range: str) -> GameContent:
+        """Genera contenido llamando al modelo de IA y anota qué modelo(s) respondieron"""
+        with track_models() as models:
+            content = self._generate_content_by_type(topic, game_type, difficulty, age_range)
+        content.generated_by = models_label(models)
+        self.bank_content(content)
+        return content
+
+    def _generate_content_by_type(self, topic: str, game_type: GameType,
+                                  difficulty: DifficultyLevel, age_range: str) -> GameContent:
+        """Genera el contenido según el tipo de juego"""
         
         if game_type == GameType.TRIVIA:
             trivia_questions = self._generate_trivia(topic, difficulty, age_range)
@@ -83,10 +367,9 @@ class AIService:
                 age_range=age_range
             )
 
-    def _generate_trivia(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[TriviaQuestion]:
-        """Genera preguntas de trivia"""
-        
-        prompt = f"""Eres un experto educador creando preguntas de trivia para niños de {age_range} años en Perú.
+    def _trivia_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> str:
+        """Prompt para generar preguntas de trivia"""
+        return f"""Eres un experto educador creando preguntas de trivia para niños de {age_range} años en Perú.
 
 Tema: {topic}
 Nivel: {difficulty.value}
@@ -106,50 +389,44 @@ Para cada pregunta, genera en formato JSON:
 
 Genera {Config.TRIVIA_QUESTIONS_COUNT} preguntas en este formato exacto."""
 
-        response = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "Eres un asistente que SOLO responde con JSON válido, sin texto adicional."},
-                {"role": "user", "content": prompt}
-            ],
-            model=self.model,  
-            temperature=Config.TEMPERATURE,
-            max_tokens=Config.MAX_TOKENS,
+    def _build_trivia_question(self, q: Dict[str, Any], difficulty: DifficultyLevel) -> TriviaQuestion:
+        """Construye una pregunta de trivia a partir del JSON de la IA"""
+        return TriviaQuestion(
+            question=q["question"],
+            options=q["options"],
+            correct_answer=q["correct_answer"],
+            explanation=q["explanation"],
+            difficulty=difficulty,
+            intelligence_type=q.get("intelligence_type", "logical_mathematical")
         )
+
+    def _generate_trivia(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[TriviaQuestion]:
+        """Genera preguntas de trivia"""
+        
+        if self._use_fanout(GameType.TRIVIA):
+            return self.fanout.generate_trivia(topic, difficulty, age_range)
+        prompt, params = self._content_request(topic, GameType.TRIVIA, difficulty, age_range)
+        return self._parse_trivia(self._chat(prompt, **params), topic, difficulty, age_range)
+
+    def _parse_trivia(self, raw_response: str, topic: str, difficulty: DifficultyLevel,
+                      age_range: str) -> List[TriviaQuestion]:
+        """Convierte la respuesta de la IA en preguntas de trivia (regenerando solo las inválidas)"""
         
         try:
-            raw_response = response.choices[0].message.content
-            print(f"\n=== RESPUESTA CRUDA TRIVIA ===\n{raw_response}\n=== FIN ===\n")
-            
-            clean_response = self._clean_json_response(raw_response)
-            print(f"\n=== RESPUESTA LIMPIA TRIVIA ===\n{clean_response}\n=== FIN ===\n")
-            
-            questions_data = json.loads(clean_response)
+            log_payload(logger, "Respuesta cruda de trivia", raw_response)
             
             # Asegurar que sea una lista
-            if not isinstance(questions_data, list):
-                questions_data = [questions_data]
+            questions_data = as_item_list(extract_json(raw_response, partial=True), "question")
             
-            questions = []
-            for q in questions_data:
-                questions.append(TriviaQuestion(
-                    question=q["question"],
-                    options=q["options"],
-                    correct_answer=q["correct_answer"],
-                    explanation=q["explanation"],
-                    difficulty=difficulty,
-                    intelligence_type=q.get("intelligence_type", "logical_mathematical")
-                ))
-            return questions
-        except json.JSONDecodeError as e:
-            print(f"\n❌ Error parseando trivia: {str(e)}")
-            print(f"Respuesta cruda:\n{raw_response}")
+            return self.repairer.repair_trivia(questions_data, topic, difficulty, age_range)
+        except (json.JSONDecodeError, JsonExtractionError) as e:
+            logger.warning("Error parseando trivia: %s; respuesta: %s", e, Truncated(raw_response))
             raise ValueError(f"Error al parsear respuesta de IA para trivia: {str(e)}")
     
     
-    def _generate_adventure(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> AdventureStory:
-        """Genera una historia de aventura interactiva"""
-        
-        prompt = f"""Eres un escritor de cuentos educativos interactivos para niños de {age_range} años en Perú.
+    def _adventure_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> str:
+        """Prompt para generar una historia de aventura"""
+        return f"""Eres un escritor de cuentos educativos interactivos para niños de {age_range} años en Perú.
 
 Tema educativo: {topic}
 Nivel: {difficulty.value}
@@ -243,29 +520,39 @@ Formato JSON EXACTO:
 }}
 
 Genera SOLO el objeto JSON de la aventura."""
-        response = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "Eres un asistente que SOLO responde con JSON válido, sin texto adicional."},
-                {"role": "user", "content": prompt}
-            ],
-            model=self.model,
-            temperature=0.7,
-            max_tokens=2500,
-            response_format={"type": "json_object"}
+
+    def _build_adventure_scene(self, scene_data: Dict[str, Any]) -> AdventureScene:
+        """Construye una escena de aventura a partir del JSON de la IA"""
+        return AdventureScene(
+            scene_number=scene_data.get("scene_number", 0),
+            description=scene_data.get("description", ""),
+            choices=scene_data.get("choices", []),
+            learning_point=scene_data.get("learning_point", "")
         )
+
+    def _generate_adventure(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> AdventureStory:
+        """Genera una historia de aventura interactiva"""
+        
+        if self._use_fanout(GameType.ADVENTURE):
+            try:
+                return self.fanout.generate_adventure(topic, difficulty, age_range)
+            except Exception as e:
+                logger.warning("Aventura en paralelo falló, uso una sola llamada: %s", e)
+        prompt, params = self._content_request(topic, GameType.ADVENTURE, difficulty, age_range)
+        return self._parse_adventure(self._chat(prompt, **params), topic, difficulty, age_range)
+
+    def _parse_adventure(self, raw_response: str, topic: str, difficulty: DifficultyLevel,
+                         age_range: str) -> AdventureStory:
+        """Convierte la respuesta de la IA en una historia de aventura (reparando las escenas inválidas)"""
         
         try:
-            raw_response = response.choices[0].message.content
-            print(f"\n=== RESPUESTA CRUDA AVENTURA ===\n{raw_response}\n=== FIN ===\n")
-            
-            clean_response = self._clean_json_response(raw_response, prefer_top="object")
-            print(f"\n=== RESPUESTA LIMPIA AVENTURA ===\n{clean_response}\n=== FIN ===\n")
+            log_payload(logger, "Respuesta cruda de aventura", raw_response)
             
-            story_data = json.loads(clean_response)
+            story_data = extract_json(raw_response, partial=True)
             
             # Si es un array, tomar el primer elemento
             if isinstance(story_data, list):
-                print("[WARN] ️ La IA devolvió un array; asumo que es la lista de escenas y la envuelvo.")
+                logger.info("La IA devolvió un array de aventura; se toma como la lista de escenas")
                 if story_data and all(isinstance(s, dict) and "scene_number" in s for s in story_data):
                     story_data = {
                         "title": f"Aventura educativa sobre {topic}",
@@ -288,46 +575,23 @@ Genera SOLO el objeto JSON de la aventura."""
             if not isinstance(story_data['scenes'], list):
                 raise ValueError("'scenes' debe ser una lista")
             
-            # Construir escenas
-            scenes = []
-            for scene_data in story_data["scenes"]:
-                # Validar que scene_data sea un diccionario
-                if not isinstance(scene_data, dict):
-                    print(f"� ️ Escena inválida (no es dict): {scene_data}")
-                    continue
-                
-                scenes.append(AdventureScene(
-                    scene_number=scene_data.get("scene_number", 0),
-                    description=scene_data.get("description", ""),
-                    choices=scene_data.get("choices", []),
-                    learning_point=scene_data.get("learning_point", "")
-                ))
-            
-            return AdventureStory(
-                title=story_data.get("title", "Aventura educativa"),
-                introduction=story_data.get("introduction", ""),
-                scenes=scenes,
-                conclusion=story_data.get("conclusion", ""),
-                total_scenes=story_data.get("total_scenes", len(scenes))
-            )
+            # Validar cada escena y regenerar solo las rotas
+            return self.repairer.repair_adventure(story_data, topic, difficulty, age_range)
             
-        except json.JSONDecodeError as e:
-            print(f"\n❌ Error parseando aventura: {str(e)}")
-            print(f"Respuesta cruda:\n{raw_response}")
+        except (json.JSONDecodeError, JsonExtractionError) as e:
+            logger.warning("Error parseando aventura: %s; respuesta: %s", e, Truncated(raw_response))
             raise ValueError(f"Error al parsear respuesta de IA para aventura: {str(e)}")
         except KeyError as e:
-            print(f"\n❌ Error de clave en aventura: {str(e)}")
-            print(f"Datos recibidos:\n{story_data}")
+            logger.warning("Error de clave en aventura: %s; datos: %s", e, Truncated(story_data))
             raise ValueError(f"Formato incorrecto de aventura: falta clave {str(e)}")
         except Exception as e:
-            print(f"\n❌ Error general en aventura: {str(e)}")
+            logger.warning("Error general en aventura: %s", e)
             raise ValueError(f"Error al generar aventura: {str(e)}")
 
 
-    def _generate_market(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[MarketMission]:
-        """Genera misiones para el juego del mercadito"""
-        
-        prompt = f"""Eres un diseñador de juegos educativos para niños de {age_range} años en Perú.
+    def _market_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> str:
+        """Prompt para generar misiones del mercadito"""
+        return f"""Eres un diseñador de juegos educativos para niños de {age_range} años en Perú.
 
 
 Tema: {topic}
@@ -358,45 +622,42 @@ Formato:
 ]
 
 Genera {Config.MARKET_MISSIONS_COUNT} misiones en este formato exacto."""
-        response = self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "Eres un asistente que SOLO responde con JSON válido, sin texto adicional."},
-                {"role": "user", "content": prompt}
-            ],
-            model=self.model,
-            temperature=0.7,
-            max_tokens=Config.MAX_TOKENS,
+
+    def _build_market_mission(self, m: Dict[str, Any]) -> MarketMission:
+        """Construye una misión del mercadito a partir del JSON de la IA"""
+        return MarketMission(
+            mission_id=m["mission_id"],
+            title=m["title"],
+            description=m["description"],
+            task_type=m["task_type"],
+            items=m["items"],
+            correct_items=m["correct_items"],
+            points=m["points"],
+            hint=m["hint"],
+            intelligence_type=m.get("intelligence_type", "logical_mathematical")
         )
+
+    def _generate_market(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[MarketMission]:
+        """Genera misiones para el juego del mercadito"""
+        
+        if self._use_fanout(GameType.MARKET):
+            return self.fanout.generate_market(topic, difficulty, age_range)
+        prompt, params = self._content_request(topic, GameType.MARKET, difficulty, age_range)
+        return self._parse_market(self._chat(prompt, **params), topic, difficulty, age_range)
+
+    def _parse_market(self, raw_response: str, topic: str, difficulty: DifficultyLevel,
+                      age_range: str) -> List[MarketMission]:
+        """Convierte la respuesta de la IA en misiones del mercadito (regenerando solo las inválidas)"""
+        
         try:
-            raw_response = response.choices[0].message.content
-            print(f"\n=== RESPUESTA CRUDA MERCADITO ===\n{raw_response}\n=== FIN ===\n")
-            
-            clean_response = self._clean_json_response(raw_response)
-            print(f"\n=== RESPUESTA LIMPIA MERCADITO ===\n{clean_response}\n=== FIN ===\n")
-            
-            missions_data = json.loads(clean_response)
+            log_payload(logger, "Respuesta cruda de mercadito", raw_response)
             
             # Asegurar que sea una lista
-            if not isinstance(missions_data, list):
-                missions_data = [missions_data]
+            missions_data = as_item_list(extract_json(raw_response, partial=True), "mission_id")
             
-            missions = []
-            for m in missions_data:
-                missions.append(MarketMission(
-                    mission_id=m["mission_id"],
-                    title=m["title"],
-                    description=m["description"],
-                    task_type=m["task_type"],
-                    items=m["items"],
-                    correct_items=m["correct_items"],
-                    points=m["points"],
-                    hint=m["hint"],
-                    intelligence_type=m.get("intelligence_type", "logical_mathematical")
-                ))
-            return missions
-        except json.JSONDecodeError as e:
-            print(f"\n❌ Error parseando mercadito: {str(e)}")
-            print(f"Respuesta cruda:\n{raw_response}")
+            return self.repairer.repair_market(missions_data, topic, difficulty, age_range)
+        except (json.JSONDecodeError, JsonExtractionError) as e:
+            logger.warning("Error parseando mercadito: %s; respuesta: %s", e, Truncated(raw_response))
             raise ValueError(f"Error al parsear respuesta de IA para mercadito: {str(e)}")
 
 
@@ -408,10 +669,29 @@ Genera {Config.MARKET_MISSIONS_COUNT} misiones en este formato exacto."""
         
         percentage = (score / max_score * 100) if max_score > 0 else 0
         
-        prompt = f"""Eres un tutor amigable para niños.
+        if self.feedback_cache is None:
+            return self._generate_feedback_variants(topic, game_type, percentage, percentage, 1)[0]
+
+        low, high = self.feedback_cache.bucket(percentage)
+        return self.feedback_cache.get_or_generate(
+            self.feedback_cache.make_key(game_type.value, percentage, topic),
+            lambda count: self._generate_feedback_variants(topic, game_type, low, high, count)
+        )
+
+    def _generate_feedback_variants(self, topic: str, game_type: GameType,
+                                    low: float, high: float, count: int) -> List[str]:
+        """Pide a la IA ``count`` mensajes distintos para un rango de porcentaje"""
+        
+        if low == high:
+            result = f"Obtuvo {low:.1f}% de los puntos."
+        else:
+            result = f"Obtuvo entre {low:.0f}% y {high:.0f}% de los puntos."
+
+        if count == 1:
+            prompt = f"""Eres un tutor amigable para niños.
 
 El estudiante jugó un juego de {game_type.value} sobre "{topic}".
-Obtuvo {score} de {max_score} puntos ({percentage:.1f}%).
+{result}
 
 Genera un mensaje motivador y educativo (2-3 oraciones) que:
 1. Felicite o anime según el puntaje
@@ -419,15 +699,36 @@ Genera un mensaje motivador y educativo (2-3 oraciones) que:
 3. Dé una recomendación breve para mejorar o profundizar
 
 Sé amigable, usa emojis y lenguaje para niños."""
+            return [self._chat(prompt, temperature=0.8, max_tokens=200, system=None).strip()]
 
-        response = self.client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=self.model,
-            temperature=0.8,
-            max_tokens=200,
-        )
-        
-        return response.choices[0].message.content.strip()
+        prompt = f"""Eres un tutor amigable para niños.
+
+El estudiante jugó un juego de {game_type.value} sobre "{topic}".
+{result}
+
+Genera {count} mensajes DISTINTOS, motivadores y educativos (2-3 oraciones cada uno) que:
+1. Feliciten o animen según el puntaje
+2. Resalten algo positivo
+3. Den una recomendación breve para mejorar o profundizar
+
+Sé amigable, usa emojis y lenguaje para niños. No menciones un puntaje exacto.
+
+Responde SOLO con un array JSON de {count} strings:
+["mensaje 1", "mensaje 2"]"""
+
+        raw_response = self._chat(prompt, temperature=0.9, max_tokens=160 * count)
+        try:
+            variants = extract_json(raw_response, prefer="array", partial=True)
+        except (json.JSONDecodeError, JsonExtractionError):
+            variants = []
+        if isinstance(variants, dict):
+            variants = as_item_list(variants, "message")
+        messages = [v.strip() for v in variants if isinstance(v, str) and v.strip()][:count]
+        if messages:
+            return messages
+        # El texto crudo suele traer corchetes y comillas: no se muestra al niño, se pide un solo mensaje
+        logger.warning("Variantes de feedback sin mensajes válidos; se pide un solo mensaje")
+        return self._generate_feedback_variants(topic, game_type, low, high, 1)
     
     def analyze_intelligence_profile(self, user_stats: Dict) -> Dict[str, Any]:
         """Analiza las inteligencias múltiples del usuario"""
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import threading
+import httpx
+from groq import AsyncGroq
+from typing import Dict, Any, List, Optional, Coroutine
+from models.game import GameContent, GameType, DifficultyLevel
+from config import Config
+from services.ai_service import AIService, JSON_SYSTEM_PROMPT, groq_timeout
+from services.content_cache import make_cache_key
+from services.groq_scheduler import estimate_tokens, record_usage
+from services.llm_transport import build_transport
+from services.model_router import track_models, models_label
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAIService(AIService):
+    """Variante asíncrona de AIService sobre el cliente AsyncGroq.
+
+    Mantiene la API síncrona de AIService y agrega métodos ``async``. Las
+    corrutinas se ejecutan en un event loop propio (en un hilo aparte), de
+    modo que las vistas síncronas de Flask pueden usar ``run()``.
+    """
+
+    def __init__(self, http_client: Optional[httpx.Client] = None,
+                 async_http_client: Optional[httpx.AsyncClient] = None):
+        super().__init__(http_client)
+        self.async_client = AsyncGroq(
+            api_key=Config.GROQ_API_KEY,
+            http_client=async_http_client,
+            timeout=groq_timeout()
+        ) if self.client is not None else None
+        self.transport = build_transport(self.client, self.async_client)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    # ========== EVENT LOOP ==========
+
+    def run(self, coro: Coroutine) -> Any:
+        """Ejecuta una corrutina en el event loop del servicio y espera el resultado"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-ai-service",
+                    daemon=True
+                ).start()
+            return self._loop
+
+    # ========== LLAMADAS A LA IA ==========
+
+    async def _achat(self, prompt: str, temperature: float, max_tokens: int,
+                     system: Optional[str] = JSON_SYSTEM_PROMPT,
+                     response_format: Optional[Dict[str, str]] = None) -> str:
+        """Versión asíncrona de _chat"""
+        async def call(model: str) -> str:
+            params = self._chat_params(prompt, temperature, max_tokens, system, response_format, model)
+            if self.scheduler is None:
+                response = await self.transport.acreate(**params)
+            else:
+                response = await self.scheduler.acall(
+                    lambda: self.transport.acreate(**params),
+                    estimate_tokens(params["messages"], max_tokens)
+                )
+            record_usage(response)
+            return response.choices[0].message.content
+
+        text, _ = await self.router.acomplete(call, self._response_validator(system, response_format))
+        return text
+
+    async def agenerate_game_content(self, topic: str, game_type: GameType,
+                                     difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+                                     age_range: str = "8-14", fresh: bool = False) -> GameContent:
+        """Versión asíncrona de generate_game_content (comparte caché y parseo)"""
+        if not fresh:
+            cached = await asyncio.to_thread(self.get_cached_content, topic, game_type, difficulty, age_range)
+            if cached is not None:
+                return cached
+
+        async def generate() -> GameContent:
+            prompt, params = self._content_request(topic, game_type, difficulty, age_range)
+            with track_models() as models:
+                raw_response = await self._achat(prompt, **params)
+            # La reparación puede hacer llamadas síncronas: fuera del event loop
+            content = await asyncio.to_thread(self._parse_content, raw_response, topic, game_type, difficulty, age_range)
+            content.generated_by = models_label(models)
+            await asyncio.to_thread(self.cache_content, content)
+            await asyncio.to_thread(self.bank_content, content)
+            return content
+
+        if fresh:
+            return await generate()
+        content, _ = await self.content_flights.ado(
+            make_cache_key(topic, game_type, difficulty, age_range), generate
+        )
+        return content
+
+    async def generate_bundle(self, topic: str,
+                              difficulty: DifficultyLevel = DifficultyLevel.MEDIUM,
+                              age_range: str = "8-14",
+                              game_types: Optional[List[GameType]] = None,
+                              fresh: bool = False) -> Dict[str, Any]:
+        """Genera en paralelo el contenido de varios juegos para un mismo tema.
+
+        Devuelve {"contents": {tipo: GameContent}, "errors": {tipo: mensaje}}.
+        """
+        game_types = game_types or [GameType.TRIVIA, GameType.ADVENTURE, GameType.MARKET]
+        results = await asyncio.gather(
+            *(self.agenerate_game_content(topic, game_type, difficulty, age_range, fresh) for game_type in game_types),
+            return_exceptions=True
+        )
+
+        contents, errors = {}, {}
+        for game_type, result in zip(game_types, results):
+            if isinstance(result, Exception):
+                logger.error("Error generando %s del paquete: %s", game_type.value, result)
+                errors[game_type.value] = str(result)
+            else:
+                contents[game_type.value] = result
+        return {"contents": contents, "errors": errors}
@@ -0,0 +1,248 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from models.game import GameContent, GameType, DifficultyLevel
+from services.topic_index import fold_topic
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_topic(topic: str) -> str:
+    """Normaliza el tema para usarlo como parte de la llave de caché, pool y banco.
+
+    Usa la forma plegada del índice de temas: cada worker (y batch_generate)
+    puede haber elegido otra forma canónica ("la Fotosíntesis" o
+    "fotosintesis"), pero la llave es la misma.
+    """
+    return fold_topic(topic) or " ".join((topic or "").lower().split())
+
+
+def make_cache_key(topic: str, game_type: GameType, difficulty: DifficultyLevel, age_range: str) -> str:
+    """Llave de caché: (tema normalizado, tipo de juego, dificultad, rango de edad)"""
+    return "|".join([
+        normalize_topic(topic),
+        getattr(game_type, "value", game_type),
+        getattr(difficulty, "value", difficulty),
+        (age_range or "").strip()
+    ])
+
+
+class SQLiteContentStore:
+    """Capa persistente de caché en un archivo SQLite local"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS content_cache (
+                cache_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, expires_at FROM content_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if not row:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM content_cache WHERE cache_key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key: str, payload: str, ttl_seconds: int):
+        self.set_many([(key, payload)], ttl_seconds)
+
+    def set_many(self, items: List[Tuple[str, str]], ttl_seconds: int):
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO content_cache (cache_key, payload, expires_at) VALUES (?, ?, ?)",
+                [(key, payload, expires_at) for key, payload in items]
+            )
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM content_cache WHERE cache_key = ?", (key,))
+            self._conn.commit()
+
+
+class SupabaseContentStore:
+    """Capa persistente de caché en la tabla content_cache de Supabase"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key: str) -> Optional[str]:
+        response = self.client.table("content_cache")\
+            .select("payload, expires_at")\
+            .eq("cache_key", key)\
+            .gt("expires_at", datetime.now(timezone.utc).isoformat())\
+            .execute()
+        return response.data[0]["payload"] if response.data else None
+
+    def set(self, key: str, payload: str, ttl_seconds: int):
+        self.set_many([(key, payload)], ttl_seconds)
+
+    def set_many(self, items: List[Tuple[str, str]], ttl_seconds: int):
+        """Guarda varias entradas en una sola petición"""
+        expires_at = (datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)).isoformat()
+        self.client.table("content_cache").upsert([
+            {"cache_key": key, "payload": payload, "expires_at": expires_at}
+            for key, payload in items
+        ]).execute()
+
+    def delete(self, key: str):
+        self.client.table("content_cache").delete().eq("cache_key", key).execute()
+
+
+class ContentCache:
+    """Caché LRU en memoria con TTL para contenido generado, con capa persistente opcional"""
+
+    def __init__(self, max_entries: int = 500, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: int = 3600, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (payload, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_config(cls) -> "ContentCache":
+        """Construye la caché según la configuración (memory | sqlite | supabase)"""
+        store = None
+        backend = Config.CONTENT_CACHE_BACKEND
+        try:
+            if backend == "sqlite":
+                store = SQLiteContentStore(Config.CONTENT_CACHE_SQLITE_PATH)
+            elif backend == "supabase":
+                from supabase import create_client
+                store = SupabaseContentStore(create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY))
+        except Exception as e:
+            logger.warning("Caché persistente deshabilitada (%s): %s", backend, e)
+            store = None
+
+        return cls(
+            max_entries=Config.CONTENT_CACHE_MAX_ENTRIES,
+            max_bytes=Config.CONTENT_CACHE_MAX_BYTES,
+            ttl_seconds=Config.CONTENT_CACHE_TTL_SECONDS,
+            store=store
+        )
+
+    def get(self, key: str) -> Optional[GameContent]:
+        """Busca contenido en memoria y luego en la capa persistente"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                payload, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return GameContent.model_validate_json(payload)
+                self._remove(key)
+                self.expirations += 1
+
+        payload = self._store_get(key)
+        if payload is not None:
+            with self._lock:
+                self.persistent_hits += 1
+                self._put(key, payload, now + self.ttl_seconds)
+            return GameContent.model_validate_json(payload)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, content: GameContent):
+        """Guarda contenido en memoria y en la capa persistente"""
+        payload = content.model_dump_json()
+        with self._lock:
+            self._put(key, payload, time.time() + self.ttl_seconds)
+        if self.store is not None:
+            try:
+                self.store.set(key, payload, self.ttl_seconds)
+            except Exception as e:
+                logger.warning("Error guardando en caché persistente: %s", e)
+
+    def invalidate(self, key: str):
+        """Elimina una llave de ambas capas"""
+        with self._lock:
+            self._remove(key)
+        if self.store is not None:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                logger.warning("Error invalidando caché persistente: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos, fallos y desalojos"""
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+                "persistent_backend": type(self.store).__name__ if self.store else None
+            }
+
+    def _store_get(self, key: str) -> Optional[str]:
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.warning("Error leyendo caché persistente: %s", e)
+            return None
+
+    def _put(self, key: str, payload: str, expires_at: float):
+        # Debe llamarse con el lock tomado
+        self._remove(key)
+        self._entries[key] = (payload, expires_at)
+        self._bytes += len(payload)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        # Debe llamarse con el lock tomado
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+
+_shared_cache: Optional[ContentCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> ContentCache:
+    """Caché compartida por todas las instancias de AIService del proceso"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ContentCache.from_config()
+        return _shared_cache
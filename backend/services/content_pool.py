@@ -0,0 +1,334 @@
+import heapq
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from models.game import GameContent, GameType, DifficultyLevel
+from services.content_cache import make_cache_key
+from services.groq_scheduler import Priority, groq_context
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ContentPool:
+    """Pool de contenido pre-generado para las combinaciones de tema más pedidas"""
+
+    def __init__(self, ai_service, db=None,
+                 depth: int = 3,
+                 refill_concurrency: int = 2,
+                 half_life_seconds: float = 3600,
+                 max_keys: int = 50,
+                 refill_interval_seconds: float = 15,
+                 max_refills_per_minute: int = 10,
+                 item_ttl_seconds: float = 6 * 3600,
+                 max_tracked_keys: int = 5000,
+                 min_popularity: float = 0.05):
+        self.ai_service = ai_service
+        self.db = db
+        self.depth = depth
+        self.refill_concurrency = refill_concurrency
+        self.half_life_seconds = half_life_seconds
+        self.max_keys = max_keys
+        self.refill_interval_seconds = refill_interval_seconds
+        self.max_refills_per_minute = max_refills_per_minute
+        self.item_ttl_seconds = item_ttl_seconds
+        # Las llaves salen de temas que escribe el cliente: se olvidan las que ya no se piden
+        self.max_tracked_keys = max_tracked_keys
+        self.min_popularity = min_popularity
+
+        self._lock = threading.Lock()
+        self._pools: Dict[str, deque] = {}             # key -> deque[(content, created_at)]
+        self._params: Dict[str, Tuple] = {}            # key -> (topic, game_type, difficulty, age_range)
+        self._popularity: Dict[str, Tuple[float, float]] = {}  # key -> (score, last_update)
+        self._inflight: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._rate_lock = threading.Lock()
+        self._next_refill_at = 0.0
+
+        self.served_from_bank = 0
+        self.served_from_cache = 0
+        self.served_from_pool = 0
+        self.generated_live = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self.expired = 0
+
+    @classmethod
+    def from_config(cls, ai_service, db=None) -> "ContentPool":
+        return cls(
+            ai_service,
+            db=db,
+            depth=Config.CONTENT_POOL_DEPTH,
+            refill_concurrency=Config.CONTENT_POOL_REFILL_CONCURRENCY,
+            half_life_seconds=Config.CONTENT_POOL_HALF_LIFE_SECONDS,
+            max_keys=Config.CONTENT_POOL_MAX_KEYS,
+            refill_interval_seconds=Config.CONTENT_POOL_REFILL_INTERVAL_SECONDS,
+            max_refills_per_minute=Config.CONTENT_POOL_MAX_REFILLS_PER_MINUTE,
+            item_ttl_seconds=Config.CONTENT_POOL_ITEM_TTL_SECONDS,
+            max_tracked_keys=Config.CONTENT_POOL_MAX_TRACKED_KEYS
+        )
+
+    # ========== CICLO DE VIDA ==========
+
+    def start(self):
+        """Inicia el hilo de reposición en segundo plano"""
+        if self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.refill_concurrency,
+                                            thread_name_prefix="content-pool")
+        self._thread = threading.Thread(target=self._run, name="content-pool-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        self.seed_from_sessions()
+        self._schedule_refills()
+        while not self._stop.wait(self.refill_interval_seconds):
+            self._schedule_refills()
+
+    # ========== POPULARIDAD ==========
+
+    def record_request(self, topic: str, game_type: GameType, difficulty: DifficultyLevel,
+                       age_range: str, weight: float = 1.0, at: Optional[float] = None) -> str:
+        """Suma popularidad a una combinación con decaimiento exponencial"""
+        key = make_cache_key(topic, game_type, difficulty, age_range)
+        now = time.time()
+        at = now if at is None else at
+        with self._lock:
+            score, last = self._popularity.get(key, (0.0, now))
+            score = self._decayed(score, last, now) + weight * self._decay_factor(now - at)
+            self._popularity[key] = (score, now)
+            self._params.setdefault(key, (topic, game_type, difficulty, age_range))
+            overflow = len(self._popularity) > 2 * self.max_tracked_keys
+        if overflow:
+            # Muchos temas nuevos entre dos reposiciones: no esperar al hilo de fondo
+            self._prune_keys()
+        return key
+
+    def seed_from_sessions(self, limit: int = 500):
+        """Carga la popularidad inicial a partir de las sesiones recientes"""
+        if self.db is None:
+            return
+        try:
+            rows = self.db.get_recent_session_keys(limit)
+        except Exception as e:
+            logger.warning("No se pudo sembrar el pool de contenido: %s", e)
+            return
+
+        for row in rows:
+            try:
+                game_type = GameType(row["game_type"])
+                difficulty = DifficultyLevel(row.get("difficulty") or "medium")
+            except ValueError:
+                continue
+            started_at = self._parse_timestamp(row.get("started_at"))
+            self.record_request(row["topic"], game_type, difficulty,
+                                row.get("age_range") or "8-14", at=started_at)
+        logger.info("Pool de contenido sembrado con %s sesiones recientes", len(rows))
+
+    def top_keys(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            ranked = heapq.nlargest(
+                self.max_keys,
+                self._popularity.items(),
+                key=lambda kv: self._decayed(kv[1][0], kv[1][1], now)
+            )
+        return [key for key, _ in ranked]
+
+    def _prune_keys(self) -> int:
+        """Olvida las combinaciones que casi no se piden y, si aún sobran, las menos populares"""
+        now = time.time()
+        with self._lock:
+            scores = {key: self._decayed(score, last, now) for key, (score, last) in self._popularity.items()}
+            drop = [key for key, score in scores.items() if score < self.min_popularity]
+            excess = len(scores) - len(drop) - self.max_tracked_keys
+            if excess > 0:
+                kept = (key for key, score in scores.items() if score >= self.min_popularity)
+                drop.extend(heapq.nsmallest(excess, kept, key=scores.get))
+            dropped = 0
+            for key in drop:
+                if self._inflight.get(key):
+                    continue  # _refill_one todavía necesita sus parámetros
+                self._popularity.pop(key, None)
+                self._params.pop(key, None)
+                self._pools.pop(key, None)
+                self._inflight.pop(key, None)
+                dropped += 1
+        if dropped:
+            logger.debug("Pool de contenido: %s combinaciones olvidadas", dropped)
+        return dropped
+
+    def _decay_factor(self, elapsed: float) -> float:
+        if self.half_life_seconds <= 0:
+            return 1.0
+        return math.pow(0.5, max(elapsed, 0.0) / self.half_life_seconds)
+
+    def _decayed(self, score: float, last: float, now: float) -> float:
+        return score * self._decay_factor(now - last)
+
+    @staticmethod
+    def _parse_timestamp(value) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.timestamp()
+        except ValueError:
+            return None
+
+    # ========== SERVIR CONTENIDO ==========
+
+    def acquire(self, topic: str, game_type: GameType, difficulty: DifficultyLevel,
+                age_range: str, fresh: bool = False, user_id: Optional[str] = None) -> Tuple[GameContent, str]:
+        """Devuelve (contenido, origen) buscando en el banco de preguntas, en el pool, en caché y al final en vivo"""
+        key = self.record_request(topic, game_type, difficulty, age_range)
+
+        if user_id:
+            banked = self.ai_service.assemble_from_bank(topic, game_type, difficulty, age_range, user_id)
+            if banked is not None:
+                with self._lock:
+                    self.served_from_bank += 1
+                return banked, "bank"
+
+        # El pool va antes que la caché: cada variante pre-generada se entrega una vez,
+        # y la caché solo responde mientras el pool de esa combinación está vacío
+        content = self._pop(key)
+        if content is not None:
+            with self._lock:
+                self.served_from_pool += 1
+            self.ai_service.cache_content(content)
+            self._schedule_key(key)
+            return content, "pool"
+
+        if not fresh:
+            cached = self.ai_service.get_cached_content(topic, game_type, difficulty, age_range)
+            if cached is not None:
+                with self._lock:
+                    self.served_from_cache += 1
+                return cached, "cache"
+
+        content = self.ai_service.generate_game_content(
+            topic=topic,
+            game_type=game_type,
+            difficulty=difficulty,
+            age_range=age_range,
+            fresh=fresh
+        )
+        with self._lock:
+            self.generated_live += 1
+        self._schedule_key(key)
+        return content, "live"
+
+    def _pop(self, key: str) -> Optional[GameContent]:
+        now = time.time()
+        with self._lock:
+            items = self._pools.get(key)
+            while items:
+                content, created_at = items.popleft()
+                if now - created_at <= self.item_ttl_seconds:
+                    return content
+                self.expired += 1
+        return None
+
+    # ========== REPOSICIÓN ==========
+
+    def _schedule_refills(self):
+        self._prune_expired()
+        self._prune_keys()
+        for key in self.top_keys():
+            self._schedule_key(key)
+
+    def _schedule_key(self, key: str):
+        if self._executor is None or self._stop.is_set():
+            return
+        with self._lock:
+            missing = self.depth - len(self._pools.get(key, ())) - self._inflight.get(key, 0)
+            if missing <= 0:
+                return
+            self._inflight[key] = self._inflight.get(key, 0) + missing
+        for _ in range(missing):
+            self._executor.submit(self._refill_one, key)
+
+    def _refill_one(self, key: str):
+        try:
+            self._wait_for_rate_limit()
+            if self._stop.is_set():
+                return
+            topic, game_type, difficulty, age_range = self._params[key]
+            # La variante nueva queda solo en el pool (no en la caché) hasta que se entregue
+            with groq_context(Priority.BACKGROUND, user_id="content-pool"):
+                content = self.ai_service.generate_variant(topic, game_type, difficulty, age_range)
+            with self._lock:
+                self._pools.setdefault(key, deque()).append((content, time.time()))
+                self.refills += 1
+        except Exception as e:
+            with self._lock:
+                self.refill_errors += 1
+            logger.warning("Error reponiendo pool para '%s': %s", key, e)
+        finally:
+            with self._lock:
+                self._inflight[key] = max(self._inflight.get(key, 1) - 1, 0)
+
+    def _wait_for_rate_limit(self):
+        """Espacia las generaciones en segundo plano para no agotar el límite de Groq"""
+        if self.max_refills_per_minute <= 0:
+            return
+        interval = 60.0 / self.max_refills_per_minute
+        with self._rate_lock:
+            now = time.time()
+            wait = self._next_refill_at - now
+            self._next_refill_at = max(now, self._next_refill_at) + interval
+        if wait > 0:
+            self._stop.wait(wait)
+
+    def _prune_expired(self):
+        now = time.time()
+        with self._lock:
+            for items in self._pools.values():
+                while items and now - items[0][1] > self.item_ttl_seconds:
+                    items.popleft()
+                    self.expired += 1
+
+    # ========== MÉTRICAS ==========
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        top = self.top_keys()[:10]
+        with self._lock:
+            served = self.served_from_bank + self.served_from_cache + self.served_from_pool + self.generated_live
+            return {
+                "depth": self.depth,
+                "tracked_keys": len(self._popularity),
+                "ready_items": sum(len(items) for items in self._pools.values()),
+                "inflight": sum(self._inflight.values()),
+                "served_from_bank": self.served_from_bank,
+                "served_from_cache": self.served_from_cache,
+                "served_from_pool": self.served_from_pool,
+                "generated_live": self.generated_live,
+                "pool_rate": round(self.served_from_pool / served, 4) if served else 0.0,
+                "refills": self.refills,
+                "refill_errors": self.refill_errors,
+                "expired": self.expired,
+                "top_keys": [
+                    {
+                        "key": key,
+                        "popularity": round(self._decayed(*self._popularity[key], now), 3),
+                        "ready": len(self._pools.get(key, ()))
+                    }
+                    for key in top
+                ]
+            }
@@ -0,0 +1,366 @@
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from models.game import TriviaQuestion, AdventureStory, AdventureScene, MarketMission, DifficultyLevel, GameType
+from config import Config
+from services.fanout_generation import MARKET_TASKS, TRIVIA_FOCUSES
+from services.groq_scheduler import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+TRIVIA_REQUIRED = ("question", "options", "correct_answer", "explanation")
+MARKET_REQUIRED = ("title", "description", "task_type", "items", "correct_items", "points", "hint")
+
+# Errores al construir el modelo aunque las reglas semánticas pasen
+BUILD_ERRORS = (KeyError, TypeError, ValueError, ValidationError)
+
+
+def _as_int(value: Any) -> Optional[int]:
+    """Entero a partir de 2 o "2" (como lo acepta pydantic); None si no lo es"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    return None
+
+
+def _missing(data: Dict[str, Any], keys: Tuple[str, ...]) -> List[str]:
+    return [f"missing_{key}" for key in keys if data.get(key) in (None, "", [])]
+
+
+def trivia_problems(q: Any) -> List[str]:
+    """Reglas que debe cumplir una pregunta de trivia (lista vacía si es válida)"""
+    if not isinstance(q, dict):
+        return ["not_object"]
+    problems = _missing(q, TRIVIA_REQUIRED)
+    options = q.get("options")
+    if options is not None and (not isinstance(options, list) or not 3 <= len(options) <= 4):
+        problems.append("options_count")
+    if q.get("correct_answer") is not None:
+        answer = _as_int(q["correct_answer"])
+        if answer is None or not isinstance(options, list) or not 0 <= answer < len(options):
+            problems.append("correct_answer_out_of_range")
+    return problems
+
+
+def market_problems(m: Any) -> List[str]:
+    """Reglas que debe cumplir una misión del mercadito (lista vacía si es válida)"""
+    if not isinstance(m, dict):
+        return ["not_object"]
+    problems = _missing(m, MARKET_REQUIRED)
+    items = m.get("items")
+    if items is not None and (not isinstance(items, list)
+                              or not all(isinstance(i, dict) and i.get("id") not in (None, "") for i in items)):
+        problems.append("items_without_id")
+    correct = m.get("correct_items")
+    if correct and isinstance(items, list) and "items_without_id" not in problems:
+        ids = {str(i["id"]) for i in items}
+        if not isinstance(correct, list) or not {str(c) for c in correct} <= ids:
+            problems.append("correct_items_not_in_items")
+    if m.get("points") is not None and _as_int(m["points"]) is None:
+        problems.append("points_not_int")
+    return problems
+
+
+def scene_problems(scene: Any) -> List[str]:
+    """Reglas de estructura de una escena (los next_scene se revisan aparte)"""
+    if not isinstance(scene, dict):
+        return ["not_object"]
+    problems = _missing(scene, ("description", "choices"))
+    choices = scene.get("choices")
+    if choices and (not isinstance(choices, list)
+                    or not all(isinstance(c, dict) and c.get("text") for c in choices)):
+        problems.append("choices_invalid")
+    return problems
+
+
+class RepairStats:
+    """Contadores de validación y reparación compartidos por el proceso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses_checked = 0
+        self.responses_with_errors = 0
+        self.responses_repaired = 0
+        self.responses_rejected = 0
+        self.items_checked = 0
+        self.items_broken = 0
+        self.items_regenerated = 0
+        self.items_fixed_locally = 0
+        self.items_dropped = 0
+        self.repair_tokens = 0
+        self.tokens_saved = 0
+        self.problems: Counter = Counter()
+
+    def record(self, checked: int, broken: List[List[str]], regenerated: int = 0, fixed_locally: int = 0,
+               dropped: int = 0, repair_tokens: int = 0, full_tokens: int = 0, rejected: bool = False):
+        with self._lock:
+            self.responses_checked += 1
+            self.items_checked += checked
+            self.items_broken += len(broken)
+            for problems in broken:
+                self.problems.update(problems)
+            self.items_regenerated += regenerated
+            self.items_fixed_locally += fixed_locally
+            self.items_dropped += dropped
+            self.repair_tokens += repair_tokens
+            if not broken and not fixed_locally:
+                return
+            self.responses_with_errors += 1
+            if rejected:
+                self.responses_rejected += 1
+                return
+            self.responses_repaired += 1
+            # Lo que habría costado repetir la generación completa
+            self.tokens_saved += max(0, full_tokens - repair_tokens)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            with_errors = self.responses_with_errors
+            return {
+                "responses_checked": self.responses_checked,
+                "responses_with_errors": with_errors,
+                "responses_repaired": self.responses_repaired,
+                "responses_rejected": self.responses_rejected,
+                "repair_rate": round(self.responses_repaired / with_errors, 4) if with_errors else 0.0,
+                "items_checked": self.items_checked,
+                "items_broken": self.items_broken,
+                "items_regenerated": self.items_regenerated,
+                "items_fixed_locally": self.items_fixed_locally,
+                "items_dropped": self.items_dropped,
+                "repair_tokens_estimated": self.repair_tokens,
+                "tokens_saved_estimated": self.tokens_saved,
+                "problems": dict(self.problems.most_common())
+            }
+
+
+class ContentRepairer:
+    """Valida cada elemento generado por la IA y regenera solo los que fallan.
+
+    En lugar de descartar todo el juego porque una pregunta no trae
+    ``explanation`` o una misión marca como correcto un producto que no
+    existe, se conservan los elementos válidos y se pide cada elemento roto
+    con el prompt pequeño de la generación en paralelo. Los errores que se
+    pueden corregir sin la IA (un ``next_scene`` que apunta a una escena que
+    no existe) se corrigen en el momento. Si hay más de ``max_items``
+    elementos rotos sale más barato repetir la generación completa y se
+    lanza ValueError como antes.
+    """
+
+    def __init__(self, ai_service, max_items: int = 3, stats: Optional[RepairStats] = None):
+        self.ai = ai_service
+        self.max_items = max_items
+        self._stats = stats or get_shared_repair_stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_items": self.max_items, **self._stats.snapshot()}
+
+    # ========== TRIVIA ==========
+
+    def repair_trivia(self, items: List[Any], topic: str, difficulty: DifficultyLevel,
+                      age_range: str) -> List[TriviaQuestion]:
+        total = max(len(items), Config.TRIVIA_QUESTIONS_COUNT)
+        valid, broken = self._split(items, total, trivia_problems,
+                                    lambda q: self.ai._build_trivia_question(q, difficulty))
+
+        def task(position: int) -> Tuple[Callable[[], Any], int]:
+            intelligence, focus = TRIVIA_FOCUSES[position % len(TRIVIA_FOCUSES)]
+            prompt = self.ai.fanout._trivia_item_prompt(topic, difficulty, age_range,
+                                                        position + 1, total, intelligence, focus)
+
+            def run() -> Tuple[int, TriviaQuestion]:
+                data = self._request_item(prompt, 350, 0.8, trivia_problems)
+                return position, self.ai._build_trivia_question(data, difficulty)
+            return run, self._cost(prompt, 350, 0.8)
+
+        questions = self._repair(GameType.TRIVIA, topic, difficulty, age_range, len(items),
+                                 valid, broken, task)
+        return [question for _, question in questions]
+
+    # ========== MERCADITO ==========
+
+    def repair_market(self, items: List[Any], topic: str, difficulty: DifficultyLevel,
+                      age_range: str) -> List[MarketMission]:
+        total = max(len(items), Config.MARKET_MISSIONS_COUNT)
+        for m in items:
+            # Los ids numéricos en correct_items se aceptan como texto (["1"] en lugar de [1])
+            if isinstance(m, dict) and isinstance(m.get("correct_items"), list):
+                m["correct_items"] = [str(c) for c in m["correct_items"]]
+        valid, broken = self._split(items, total, market_problems, self._build_mission)
+
+        def task(position: int) -> Tuple[Callable[[], Any], int]:
+            original = items[position] if position < len(items) and isinstance(items[position], dict) else {}
+            task_type = original.get("task_type")
+            if task_type not in MARKET_TASKS:
+                task_type = MARKET_TASKS[position % len(MARKET_TASKS)]
+            prompt = self.ai.fanout._market_item_prompt(topic, difficulty, age_range, position + 1, task_type)
+
+            def run() -> Tuple[int, MarketMission]:
+                data = self._request_item(prompt, 700, 0.7, market_problems)
+                data["correct_items"] = [str(c) for c in data["correct_items"]]
+                data["mission_id"] = position + 1
+                return position, self._build_mission(data)
+            return run, self._cost(prompt, 700, 0.7)
+
+        missions = [mission for _, mission in self._repair(GameType.MARKET, topic, difficulty, age_range,
+                                                           len(items), valid, broken, task)]
+        if broken:
+            for number, mission in enumerate(missions, start=1):
+                mission.mission_id = number
+        return missions
+
+    def _build_mission(self, m: Dict[str, Any]) -> MarketMission:
+        m.setdefault("mission_id", 0)
+        return self.ai._build_market_mission(m)
+
+    # ========== AVENTURA ==========
+
+    def repair_adventure(self, story_data: Dict[str, Any], topic: str, difficulty: DifficultyLevel,
+                         age_range: str) -> AdventureStory:
+        raw_scenes = story_data["scenes"]
+        total = len(raw_scenes)
+        valid, broken = self._split(raw_scenes, total, scene_problems, self._build_scene)
+
+        # Esquema con lo que sí llegó, para que la escena regenerada encaje en la historia
+        outline = {"title": story_data.get("title", ""), "introduction": story_data.get("introduction", "")}
+        outline_scenes = []
+        for scene in raw_scenes:
+            scene = scene if isinstance(scene, dict) else {}
+            summary = str(scene.get("description") or "").split(". ")[0]
+            outline_scenes.append({
+                "summary": summary or f"Continúa la aventura sobre {topic}",
+                "learning_point": scene.get("learning_point", "")
+            })
+
+        def task(position: int) -> Tuple[Callable[[], Any], int]:
+            prompt = self.ai.fanout._adventure_scene_prompt(topic, age_range, outline, outline_scenes, position)
+
+            def run() -> Tuple[int, AdventureScene]:
+                data = self._request_item(prompt, 600, 0.7, scene_problems)
+                data["scene_number"] = position + 1
+                data.setdefault("learning_point", outline_scenes[position]["learning_point"])
+                scene = self.ai._build_adventure_scene(data)
+                next_scene = position + 2 if position + 1 < total else 0
+                for choice in scene.choices:
+                    choice["next_scene"] = next_scene
+                return position, scene
+            return run, self._cost(prompt, 600, 0.7)
+
+        fixed = self._fix_scene_links([scene for _, scene in valid], total)
+        scenes = self._repair(GameType.ADVENTURE, topic, difficulty, age_range, total, valid, broken, task,
+                              fixed=[["next_scene_dangling"]] * fixed)
+        return AdventureStory(
+            title=story_data.get("title", "Aventura educativa"),
+            introduction=story_data.get("introduction", ""),
+            scenes=[scene for _, scene in scenes],
+            conclusion=story_data.get("conclusion", ""),
+            total_scenes=story_data.get("total_scenes", len(scenes))
+        )
+
+    def _build_scene(self, scene_data: Dict[str, Any]) -> AdventureScene:
+        return self.ai._build_adventure_scene(scene_data)
+
+    @staticmethod
+    def _fix_scene_links(scenes: List[AdventureScene], total: int) -> int:
+        """Corrige los next_scene que no apuntan a una escena existente (0 = fin); devuelve cuántas escenas tocó"""
+        fixed = 0
+        for scene in scenes:
+            default = scene.scene_number + 1 if 0 < scene.scene_number < total else 0
+            broken = False
+            for choice in scene.choices:
+                target = _as_int(choice.get("next_scene", default))
+                if target is None or not 0 <= target <= total:
+                    choice["next_scene"] = default
+                    broken = True
+            fixed += broken
+        return fixed
+
+    # ========== COMÚN ==========
+
+    def _split(self, items: List[Any], total: int, check: Callable[[Any], List[str]],
+               build: Callable[[Dict[str, Any]], Any]) -> Tuple[List[Tuple[int, Any]], List[Tuple[int, List[str]]]]:
+        """Separa los elementos válidos (ya construidos) de los rotos, con su posición"""
+        valid, broken = [], []
+        for position in range(total):
+            if position >= len(items):
+                broken.append((position, ["missing_item"]))  # respuesta truncada
+                continue
+            problems = check(items[position])
+            if not problems:
+                try:
+                    valid.append((position, build(items[position])))
+                    continue
+                except BUILD_ERRORS:
+                    problems = ["schema"]
+            broken.append((position, problems))
+        return valid, broken
+
+    def _repair(self, game_type: GameType, topic: str, difficulty: DifficultyLevel, age_range: str,
+                checked: int, valid: List[Tuple[int, Any]], broken: List[Tuple[int, List[str]]],
+                task: Callable[[int], Tuple[Callable[[], Any], int]],
+                fixed: Optional[List[List[str]]] = None) -> List[Tuple[int, Any]]:
+        """Regenera en paralelo los elementos rotos y los mezcla con los válidos en su posición"""
+        fixed = fixed or []
+        fixed_locally = len(fixed)
+        reported = [problems for _, problems in broken] + fixed
+        if not broken:
+            self._stats.record(checked, reported, fixed_locally=fixed_locally)
+            return valid
+
+        if len(broken) > self.max_items:
+            self._stats.record(checked, reported, fixed_locally=fixed_locally, rejected=True)
+            raise ValueError(f"La respuesta de {game_type.value} tiene {len(broken)} elementos inválidos")
+
+        logger.info("Reparando %s elemento(s) de %s: %s", len(broken), game_type.value,
+                    ", ".join(sorted({p for _, problems in broken for p in problems})))
+        runs, repair_tokens = [], 0
+        for position, _ in broken:
+            run, cost = task(position)
+            runs.append(run)
+            repair_tokens += cost
+        repaired = self.ai.fanout._fanout(runs, needed=len(runs))
+
+        merged = sorted(valid + repaired, key=lambda pair: pair[0])
+        dropped = len(broken) - len(repaired)
+        if not merged:
+            self._stats.record(checked, reported, len(repaired), fixed_locally, dropped, repair_tokens, rejected=True)
+            raise ValueError(f"No se pudo reparar ningún elemento de {game_type.value}")
+        if dropped:
+            logger.warning("%s elemento(s) de %s no se pudieron reparar; se omiten", dropped, game_type.value)
+        self._stats.record(checked, reported, len(repaired), fixed_locally, dropped, repair_tokens,
+                           self._full_cost(topic, game_type, difficulty, age_range))
+        return merged
+
+    def _request_item(self, prompt: str, max_tokens: int, temperature: float,
+                      check: Callable[[Any], List[str]]) -> Dict[str, Any]:
+        data = self.ai.fanout._chat_object(prompt, max_tokens=max_tokens, temperature=temperature)
+        problems = check(data)
+        if problems:
+            raise ValueError(f"El elemento regenerado sigue siendo inválido: {', '.join(problems)}")
+        return data
+
+    def _cost(self, prompt: str, max_tokens: int, temperature: float) -> int:
+        params = self.ai._chat_params(prompt, temperature=temperature, max_tokens=max_tokens)
+        return estimate_tokens(params["messages"], max_tokens)
+
+    def _full_cost(self, topic: str, game_type: GameType, difficulty: DifficultyLevel, age_range: str) -> int:
+        """Tokens estimados de repetir la generación completa"""
+        prompt, params = self.ai._content_request(topic, game_type, difficulty, age_range)
+        return estimate_tokens(self.ai._chat_params(prompt, **params)["messages"], params["max_tokens"])
+
+
+_shared_stats: Optional[RepairStats] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_repair_stats() -> RepairStats:
+    """Estadísticas compartidas por todas las instancias de AIService del proceso"""
+    global _shared_stats
+    with _shared_lock:
+        if _shared_stats is None:
+            _shared_stats = RepairStats()
+        return _shared_stats
@@ -0,0 +1,303 @@
+import contextvars
+import logging
+import re
+import threading
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Any, Dict
+from models.game import TriviaQuestion, AdventureStory, AdventureScene, MarketMission, DifficultyLevel
+from services.json_parsing import JsonExtractionError, extract_json
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Enfoques para que las llamadas en paralelo no repitan la misma pregunta
+TRIVIA_FOCUSES = [
+    ("naturalistic", "observación de la naturaleza y seres vivos"),
+    ("logical_mathematical", "causa y efecto, números o razonamiento"),
+    ("linguistic", "vocabulario y significado de conceptos"),
+    ("spatial", "lugares, mapas, formas o imágenes mentales"),
+    ("interpersonal", "situaciones con familia, amigos o comunidad"),
+]
+
+MARKET_TASKS = ["selection", "math", "classification", "matching"]
+
+
+def _normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+class FanoutGenerator:
+    """Genera contenido con varias llamadas pequeñas en paralelo en lugar de una grande.
+
+    Trivia y mercadito piden un elemento por llamada (con llamadas extra para
+    recortar la latencia de cola); la aventura pide primero un esquema y
+    luego el cuerpo de cada escena en paralelo. El resultado se fusiona,
+    se deduplica y se renumera con la misma forma que la generación normal.
+
+    Cada juego tiene como máximo ``max_workers`` llamadas en curso; el
+    executor es compartido y alcanza para ``concurrent_games`` juegos a la
+    vez, así un juego no espera a que terminen las llamadas de otro.
+    """
+
+    def __init__(self, ai_service, max_workers: int = 6, extra_calls: int = 1, concurrent_games: int = 8):
+        self.ai = ai_service
+        self.max_workers = max_workers
+        self.extra_calls = extra_calls
+        self.concurrent_games = concurrent_games
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers * max(self.concurrent_games, 1),
+                                                    thread_name_prefix="ai-fanout")
+            return self._executor
+
+    def _fanout(self, tasks: List[Callable[[], Any]], needed: int,
+                dedupe_key: Optional[Callable[[Any], str]] = None) -> List[Any]:
+        """Ejecuta las tareas en paralelo y junta resultados válidos hasta tener ``needed``.
+
+        Hay a lo sumo ``max_workers`` tareas en curso; cada una que termina deja
+        salir a la siguiente. Al juntar ``needed`` ya no se lanzan más, pero las
+        que están en curso (normalmente la llamada extra) no se pueden detener:
+        Groq las cobra igual y su resultado se descarta.
+        """
+        executor = self._get_executor()
+        queued = iter(tasks)
+        running = set()
+
+        def launch(limit: int):
+            for task in queued:
+                # Cada tarea conserva la prioridad y el usuario de la petición original
+                running.add(executor.submit(contextvars.copy_context().run, task))
+                if len(running) >= limit:
+                    break
+
+        results, seen = [], set()
+        launch(self.max_workers)
+        while running and len(results) < needed:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.discard(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning("Llamada en paralelo fallida: %s", e)
+                    continue
+                if result is None:
+                    continue
+                if dedupe_key is not None:
+                    key = dedupe_key(result)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                results.append(result)
+            if len(results) < needed:
+                launch(self.max_workers)
+        return results[:needed]
+
+    def _chat_object(self, prompt: str, max_tokens: int, temperature: float = 0.8) -> Dict[str, Any]:
+        raw_response = self.ai._chat(
+            prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"}
+        )
+        data = extract_json(raw_response, partial=True)
+        if isinstance(data, list):
+            data = data[0] if data else {}
+        if not isinstance(data, dict):
+            raise JsonExtractionError("Se esperaba un objeto JSON")
+        return data
+
+    # ========== TRIVIA ==========
+
+    def generate_trivia(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[TriviaQuestion]:
+        total = Config.TRIVIA_QUESTIONS_COUNT
+        calls = total + self.extra_calls
+
+        def task(index: int) -> TriviaQuestion:
+            intelligence, focus = TRIVIA_FOCUSES[index % len(TRIVIA_FOCUSES)]
+            data = self._chat_object(
+                self._trivia_item_prompt(topic, difficulty, age_range, index + 1, calls, intelligence, focus),
+                max_tokens=350
+            )
+            return self.ai._build_trivia_question(data, difficulty)
+
+        questions = self._fanout(
+            [lambda i=i: task(i) for i in range(calls)],
+            needed=total,
+            dedupe_key=lambda q: _normalize_text(q.question)
+        )
+        if not questions:
+            raise ValueError("No se pudo generar ninguna pregunta de trivia")
+        if len(questions) < total:
+            logger.warning("Trivia en paralelo: %s de %s preguntas válidas", len(questions), total)
+        return questions
+
+    def _trivia_item_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str,
+                            number: int, total: int, intelligence: str, focus: str) -> str:
+        return f"""Eres un experto educador creando UNA pregunta de trivia para niños de {age_range} años en Perú.
+
+Tema: {topic}
+Nivel: {difficulty.value}
+Esta es la pregunta {number} de {total}; enfócala en: {focus}.
+
+IMPORTANTE: Usa ejemplos y contexto local de Perú.
+
+Responde SOLO con este objeto JSON:
+{{
+    "question": "La pregunta clara y directa",
+    "options": ["opción 1", "opción 2", "opción 3", "opción 4"],
+    "correct_answer": 0-3 (índice de la respuesta correcta),
+    "explanation": "Por qué esta es la respuesta correcta",
+    "difficulty": "{difficulty.value}",
+    "intelligence_type": "{intelligence}"
+}}"""
+
+    # ========== MERCADITO ==========
+
+    def generate_market(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> List[MarketMission]:
+        total = Config.MARKET_MISSIONS_COUNT
+        calls = total + self.extra_calls
+
+        def task(index: int) -> MarketMission:
+            task_type = MARKET_TASKS[index % len(MARKET_TASKS)]
+            data = self._chat_object(
+                self._market_item_prompt(topic, difficulty, age_range, index + 1, task_type),
+                max_tokens=700,
+                temperature=0.7
+            )
+            data["mission_id"] = index + 1
+            return self.ai._build_market_mission(data)
+
+        missions = self._fanout(
+            [lambda i=i: task(i) for i in range(calls)],
+            needed=total,
+            dedupe_key=lambda m: _normalize_text(m.title + " " + m.description)
+        )
+        if not missions:
+            raise ValueError("No se pudo generar ninguna misión del mercadito")
+
+        # Renumerar en el orden final
+        for number, mission in enumerate(missions, start=1):
+            mission.mission_id = number
+        return missions
+
+    def _market_item_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str,
+                            number: int, task_type: str) -> str:
+        return f"""Eres un diseñador de juegos educativos para niños de {age_range} años en Perú.
+
+Tema: {topic}
+Nivel: {difficulty.value}
+Diseña UNA misión (la número {number}) de tipo "{task_type}" en un mercado peruano (productos y monedas locales).
+
+Responde SOLO con este objeto JSON, sin comentarios:
+{{
+    "mission_id": {number},
+    "title": "título de la misión",
+    "description": "qué debe hacer el niño",
+    "task_type": "{task_type}",
+    "items": [
+      {{"id": "item1", "name": "Manzana", "price": 2, "category": "fruta", "image": "🍎"}},
+      {{"id": "item2", "name": "Papa", "price": 3, "category": "verdura", "image": "🥔"}}
+    ],
+    "correct_items": ["item1"],
+    "points": 10,
+    "hint": "pista útil",
+    "intelligence_type": "logical_mathematical"
+}}"""
+
+    # ========== AVENTURA ==========
+
+    def generate_adventure(self, topic: str, difficulty: DifficultyLevel, age_range: str) -> AdventureStory:
+        total = Config.ADVENTURE_SCENES_COUNT
+        outline = self._chat_object(
+            self._adventure_outline_prompt(topic, difficulty, age_range, total),
+            max_tokens=700,
+            temperature=0.7
+        )
+        outline_scenes = [s for s in outline.get("scenes", []) if isinstance(s, dict)][:total]
+        if len(outline_scenes) < total:
+            raise ValueError(f"El esquema de la aventura tiene {len(outline_scenes)} de {total} escenas")
+
+        def task(index: int) -> AdventureScene:
+            data = self._chat_object(
+                self._adventure_scene_prompt(topic, age_range, outline, outline_scenes, index),
+                max_tokens=600,
+                temperature=0.7
+            )
+            data["scene_number"] = index + 1
+            data.setdefault("learning_point", outline_scenes[index].get("learning_point", ""))
+            return self.ai._build_adventure_scene(data)
+
+        scenes = self._fanout([lambda i=i: task(i) for i in range(total)], needed=total)
+        by_number = {scene.scene_number: scene for scene in scenes}
+        for number in range(1, total + 1):
+            if number not in by_number:
+                # Reintentar solo la escena que faltó
+                by_number[number] = task(number - 1)
+
+        ordered = [by_number[number] for number in range(1, total + 1)]
+        for scene in ordered:
+            next_scene = scene.scene_number + 1 if scene.scene_number < total else 0
+            for choice in scene.choices:
+                choice["next_scene"] = next_scene
+
+        return AdventureStory(
+            title=outline.get("title", f"Aventura educativa sobre {topic}"),
+            introduction=outline.get("introduction", ""),
+            scenes=ordered,
+            conclusion=outline.get("conclusion", ""),
+            total_scenes=total
+        )
+
+    def _adventure_outline_prompt(self, topic: str, difficulty: DifficultyLevel, age_range: str, total: int) -> str:
+        return f"""Eres un escritor de cuentos educativos interactivos para niños de {age_range} años en Perú.
+
+Tema educativo: {topic}
+Nivel: {difficulty.value}
+Contexto: Perú (usa lugares, animales, costumbres peruanas)
+
+Escribe SOLO el ESQUEMA de una aventura interactiva con EXACTAMENTE {total} escenas.
+
+Responde SOLO con este objeto JSON:
+{{
+    "title": "Título atractivo",
+    "introduction": "Introducción que engancha (2-3 oraciones)",
+    "scenes": [
+        {{"scene_number": 1, "summary": "Qué pasa en la escena (1 oración)", "learning_point": "Qué aprende aquí"}}
+    ],
+    "conclusion": "Final de la aventura (2-3 oraciones)"
+}}"""
+
+    def _adventure_scene_prompt(self, topic: str, age_range: str, outline: Dict[str, Any],
+                                outline_scenes: List[Dict[str, Any]], index: int) -> str:
+        plan = "\n".join(
+            f"{i + 1}. {scene.get('summary', '')}" for i, scene in enumerate(outline_scenes)
+        )
+        current = outline_scenes[index]
+        return f"""Eres un escritor de cuentos educativos interactivos para niños de {age_range} años en Perú.
+
+Aventura: {outline.get('title', '')}
+Tema educativo: {topic}
+Introducción: {outline.get('introduction', '')}
+Esquema completo:
+{plan}
+
+Escribe SOLO la escena {index + 1}: "{current.get('summary', '')}"
+Lo que aprende: {current.get('learning_point', '')}
+
+Responde SOLO con este objeto JSON:
+{{
+    "scene_number": {index + 1},
+    "description": "Descripción de la escena",
+    "choices": [
+        {{"text": "Opción correcta", "is_correct": true, "points": 10, "feedback": "¡Muy bien! Explicación"}},
+        {{"text": "Opción incorrecta", "is_correct": false, "points": 5, "feedback": "Intenta de nuevo. Explicación"}}
+    ],
+    "learning_point": "{current.get('learning_point', 'Qué aprende aquí')}"
+}}"""
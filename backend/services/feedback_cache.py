@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from config import Config
+from services.content_cache import normalize_topic
+from services.single_flight import SingleFlight
+
+
+class FeedbackCache:
+    """Caché de mensajes de feedback por (tipo de juego, rango de porcentaje, tema).
+
+    Cada llave guarda varias variantes generadas de una vez y las entrega
+    rotando, para que los mensajes no se repitan seguidos. Las llaves expiran
+    a los ``ttl_seconds`` y se descartan por LRU al pasar ``max_keys``.
+    """
+
+    def __init__(self, variants: int = 4, ttl_seconds: int = 24 * 3600,
+                 bucket_size: int = 20, max_keys: int = 2000):
+        self.variants = max(1, variants)
+        self.ttl_seconds = ttl_seconds
+        self.bucket_size = max(1, min(100, bucket_size))
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()  # key -> {variants, next, expires_at}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.generations = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls) -> "FeedbackCache":
+        return cls(
+            variants=Config.FEEDBACK_CACHE_VARIANTS,
+            ttl_seconds=Config.FEEDBACK_CACHE_TTL_SECONDS,
+            bucket_size=Config.FEEDBACK_CACHE_BUCKET_SIZE,
+            max_keys=Config.FEEDBACK_CACHE_MAX_KEYS
+        )
+
+    def bucket(self, percentage: float) -> Tuple[int, int]:
+        """Rango (mínimo, máximo) de porcentaje al que pertenece el puntaje"""
+        percentage = max(0.0, min(99.99, percentage))  # el 100% cae en el último rango
+        low = int(percentage // self.bucket_size) * self.bucket_size
+        high = 100 if low + self.bucket_size >= 100 else low + self.bucket_size - 1
+        return low, high
+
+    def make_key(self, game_type: str, percentage: float, topic: str) -> str:
+        low, _ = self.bucket(percentage)
+        return f"{game_type}|{low}|{normalize_topic(topic)}"
+
+    def get_or_generate(self, key: str, generate: Callable[[int], List[str]]) -> str:
+        """Devuelve la siguiente variante de la llave; si no hay, llama a ``generate(variantes)``"""
+        message = self._next_variant(key)
+        if message is not None:
+            return message
+
+        def fill() -> List[str]:
+            with self._lock:
+                self.misses += 1
+            variants = [v.strip() for v in generate(self.variants) if v and v.strip()]
+            if not variants:
+                raise ValueError("La IA no devolvió mensajes de feedback")
+            with self._lock:
+                self.generations += 1
+                self._entries[key] = {
+                    "variants": variants,
+                    "next": 1 % len(variants),  # la primera variante es para quien generó
+                    "expires_at": time.monotonic() + self.ttl_seconds
+                }
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            return variants
+
+        variants, shared = self._flights.do(key, fill)
+        if shared:
+            # Quien esperaba a otra generación toma la siguiente variante en la rotación
+            message = self._next_variant(key)
+            if message is not None:
+                return message
+        return variants[0]
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "keys": len(self._entries),
+                "variants_per_key": self.variants,
+                "bucket_size": self.bucket_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "generations": self.generations,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _next_variant(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            variants = entry["variants"]
+            message = variants[entry["next"] % len(variants)]
+            entry["next"] = (entry["next"] + 1) % len(variants)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return message
+
+
+_shared_feedback_cache: Optional[FeedbackCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_feedback_cache() -> FeedbackCache:
+    """Caché de feedback compartida por todas las instancias de AIService del proceso"""
+    global _shared_feedback_cache
+    with _shared_lock:
+        if _shared_feedback_cache is None:
+            _shared_feedback_cache = FeedbackCache.from_config()
+        return _shared_feedback_cache
@@ -0,0 +1,151 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+from models.game import GameType
+from config import Config
+from services.groq_scheduler import Priority, groq_context
+
+logger = logging.getLogger(__name__)
+
+# Estados del feedback de una sesión
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+def template_feedback(topic: str, score: int, max_score: int) -> str:
+    """Mensaje inmediato (sin IA) según el porcentaje obtenido"""
+    percentage = (score / max_score * 100) if max_score > 0 else 0
+    if percentage >= 80:
+        return f"¡Excelente trabajo! 🌟 Sabes mucho sobre {topic}. ¡Sigue así!"
+    if percentage >= 60:
+        return f"¡Muy bien! 👏 Aprendiste cosas nuevas sobre {topic}. Un poco más de práctica y serás un experto."
+    return f"¡Buen intento! 💪 Cada juego te ayuda a aprender más sobre {topic}. ¡Inténtalo de nuevo!"
+
+
+class _FeedbackJob:
+    """Feedback en curso de una sesión"""
+
+    def __init__(self, placeholder: str):
+        self.status = PENDING
+        self.feedback: Optional[str] = None
+        self.placeholder = placeholder
+        self.done = threading.Event()
+        self.created_at = time.monotonic()
+
+
+class FeedbackWorker:
+    """Genera el feedback de la IA en segundo plano y lo guarda en la sesión.
+
+    ``submit`` devuelve enseguida un ticket (el id de la sesión) con un
+    mensaje de plantilla; el feedback real se consulta con ``get`` o se
+    espera con ``wait`` (para SSE). Los trabajos terminados se conservan
+    en memoria ``retention_seconds``; después se leen desde la sesión.
+    """
+
+    def __init__(self, ai_service, db, max_workers: int = 4, retention_seconds: float = 600):
+        self.ai = ai_service
+        self.db = db
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feedback")
+        self._jobs: Dict[str, _FeedbackJob] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, ai_service, db) -> "FeedbackWorker":
+        return cls(
+            ai_service,
+            db,
+            max_workers=Config.FEEDBACK_WORKERS,
+            retention_seconds=Config.FEEDBACK_RETENTION_SECONDS
+        )
+
+    def submit(self, session_id: str, topic: str, score: int, max_score: int,
+               game_type: GameType, answers: List[Dict], user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Encola la generación del feedback y devuelve el ticket con el mensaje provisional"""
+        placeholder = template_feedback(topic, score, max_score)
+        job = _FeedbackJob(placeholder)
+        with self._lock:
+            self._prune()
+            self._jobs[session_id] = job
+        self._executor.submit(self._run, session_id, job, topic, score, max_score, game_type, answers, user_id)
+        return {"ticket": session_id, "status": job.status, "placeholder": placeholder}
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Estado actual del feedback de una sesión (None si no existe)"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+        if job is not None:
+            return self._describe(session_id, job)
+
+        session = self.db.get_game_session(session_id)
+        if not session:
+            return None
+        status = session.get("feedback_status") or (READY if session.get("feedback") else None)
+        if status is None:
+            return None
+        return {
+            "ticket": session_id,
+            "status": status,
+            "feedback": session.get("feedback"),
+            "placeholder": None
+        }
+
+    def wait(self, session_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Espera hasta ``timeout`` segundos a que el feedback esté listo"""
+        with self._lock:
+            job = self._jobs.get(session_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return self.get(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "tracked": len(statuses),
+            "pending": statuses.count(PENDING),
+            "ready": statuses.count(READY),
+            "failed": statuses.count(FAILED)
+        }
+
+    def _run(self, session_id: str, job: _FeedbackJob, topic: str, score: int, max_score: int,
+             game_type: GameType, answers: List[Dict], user_id: Optional[str]):
+        try:
+            with groq_context(Priority.FEEDBACK, user_id):
+                job.feedback = self.ai.generate_feedback(
+                    topic=topic,
+                    score=score,
+                    max_score=max_score,
+                    game_type=game_type,
+                    answers=answers
+                )
+            job.status = READY
+        except Exception as e:
+            logger.error("Error generando feedback de la sesión %s: %s", session_id, e)
+            job.feedback = job.placeholder
+            job.status = FAILED
+        finally:
+            job.done.set()
+
+        try:
+            self.db.update_session_feedback(session_id, job.feedback, job.status)
+        except Exception as e:
+            logger.warning("No se pudo guardar el feedback de la sesión %s: %s", session_id, e)
+
+    def _describe(self, session_id: str, job: _FeedbackJob) -> Dict[str, Any]:
+        return {
+            "ticket": session_id,
+            "status": job.status,
+            "feedback": job.feedback,
+            "placeholder": job.placeholder
+        }
+
+    def _prune(self):
+        """Olvida los trabajos terminados hace más de retention_seconds"""
+        limit = time.monotonic() - self.retention_seconds
+        for session_id in [sid for sid, job in self._jobs.items()
+                           if job.done.is_set() and job.created_at < limit]:
+            del self._jobs[session_id]
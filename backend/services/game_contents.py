@@ -0,0 +1,60 @@
+import base64
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def canonical_json(content: Dict[str, Any]) -> str:
+    """JSON con llaves ordenadas y sin espacios: el mismo contenido da siempre el mismo texto"""
+    return json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def content_hash(content: Dict[str, Any]) -> str:
+    """Llave de game_contents: sha256 del JSON canónico"""
+    return hashlib.sha256(canonical_json(content).encode("utf-8")).hexdigest()
+
+
+def pack_content(content: Dict[str, Any]) -> str:
+    """JSON canónico comprimido con zlib, en base64 para guardarlo en una columna TEXT"""
+    return base64.b64encode(zlib.compress(canonical_json(content).encode("utf-8"), 6)).decode("ascii")
+
+
+def unpack_content(payload: str) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(base64.b64decode(payload)).decode("utf-8"))
+
+
+class ContentLRU:
+    """Contenidos recientes del proceso por content_id.
+
+    El contenido de un content_id no cambia nunca, así que no hace falta
+    invalidar: sirve para no volver a subir un contenido ya guardado y para
+    completar las sesiones que devuelven los UPDATE sin leer game_contents.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, content_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            content = self._items.get(content_id)
+            if content is not None:
+                self._items.move_to_end(content_id)
+            return content
+
+    def put(self, content_id: str, content: Dict[str, Any]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[content_id] = content
+            self._items.move_to_end(content_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __contains__(self, content_id: str) -> bool:
+        with self._lock:
+            return content_id in self._items
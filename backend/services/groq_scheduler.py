@@ -0,0 +1,364 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from groq import RateLimitError
+from config import Config
+
+
+class Priority(IntEnum):
+    """Prioridad de una llamada a Groq (menor número = se atiende antes)"""
+    INTERACTIVE = 0   # inicio de un juego con el niño esperando
+    FEEDBACK = 1      # feedback después de enviar respuestas
+    BACKGROUND = 2    # pre-generación del pool, lotes
+
+
+class SchedulerError(Exception):
+    """Error del planificador de llamadas a Groq"""
+
+
+class RateLimitedError(SchedulerError):
+    """Groq siguió respondiendo 429 después de todos los reintentos"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueTimeoutError(SchedulerError):
+    """La llamada esperó en la cola más que el máximo permitido"""
+
+
+_priority_var: contextvars.ContextVar = contextvars.ContextVar("groq_priority", default=Priority.INTERACTIVE)
+_user_var: contextvars.ContextVar = contextvars.ContextVar("groq_user", default=None)
+_usage_var: contextvars.ContextVar = contextvars.ContextVar("groq_usage", default=None)
+
+
+@contextmanager
+def groq_context(priority: Optional[Priority] = None, user_id: Optional[str] = None):
+    """Fija prioridad y usuario para las llamadas a Groq hechas dentro del bloque.
+
+    Se guarda en contextvars: los hilos de un ThreadPoolExecutor no lo
+    heredan, hay que enviar las tareas con ``contextvars.copy_context().run``.
+    """
+    tokens = []
+    if priority is not None:
+        tokens.append((_priority_var, _priority_var.set(priority)))
+    if user_id is not None:
+        tokens.append((_user_var, _user_var.set(user_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class TokenUsage:
+    """Tokens consumidos por las llamadas hechas dentro de track_usage()"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.prompt_tokens + self.completion_tokens
+            }
+
+
+@contextmanager
+def track_usage():
+    """Suma el uso de tokens informado por Groq en las llamadas hechas dentro del bloque"""
+    usage = TokenUsage()
+    token = _usage_var.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_var.reset(token)
+
+
+def record_usage(response: Any):
+    """Registra el ``usage`` de una respuesta de Groq en el track_usage() activo"""
+    usage = _usage_var.get()
+    reported = getattr(response, "usage", None)
+    if usage is not None and reported is not None:
+        usage.add(getattr(reported, "prompt_tokens", 0) or 0, getattr(reported, "completion_tokens", 0) or 0)
+
+
+class TokenBucket:
+    """Cubeta de fichas que se rellena a ``per_minute`` por minuto hasta ``capacity``"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya ``amount`` fichas (0 si ya las hay)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def available(self, now: float) -> float:
+        self._refill(now)
+        return self.tokens
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Devuelve (delta > 0) o cobra (delta < 0) fichas una vez conocido el consumo real"""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class _Ticket:
+    __slots__ = ("key", "tokens", "enqueued_at")
+
+    def __init__(self, key: tuple, tokens: int):
+        self.key = key
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Ticket") -> bool:
+        return self.key < other.key
+
+
+class GroqScheduler:
+    """Planificador central de llamadas salientes a Groq.
+
+    Cada llamada espera su turno en una cola con prioridad; dentro de una
+    misma prioridad los usuarios se alternan (cola justa por etiquetas
+    virtuales), así un usuario con muchas peticiones no bloquea a los demás.
+    Una llamada sale solo si hay cupo en las cubetas de peticiones por
+    minuto (RPM) y tokens por minuto (TPM). Los 429 se reintentan con
+    espera exponencial con jitter.
+    """
+
+    def __init__(self, rpm: int = 30, tpm: int = 12000, max_retries: int = 3,
+                 retry_base_seconds: float = 1.0, retry_max_seconds: float = 20.0,
+                 queue_timeout_seconds: float = 30.0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._cond = threading.Condition()
+        self._queue: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._user_tags: Dict[Any, float] = {}
+
+        self.dispatched = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.tokens_used = 0
+        self._waits: Dict[Priority, Deque[float]] = {p: deque(maxlen=500) for p in Priority}
+
+    @classmethod
+    def from_config(cls) -> "GroqScheduler":
+        return cls(
+            rpm=Config.GROQ_RPM_LIMIT,
+            tpm=Config.GROQ_TPM_LIMIT,
+            max_retries=Config.GROQ_MAX_RETRIES,
+            retry_base_seconds=Config.GROQ_RETRY_BASE_SECONDS,
+            queue_timeout_seconds=Config.GROQ_QUEUE_TIMEOUT_SECONDS
+        )
+
+    # ========== LLAMADAS ==========
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int) -> Any:
+        """Ejecuta ``fn`` (una llamada a Groq) respetando cola, límites y reintentos"""
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimated_tokens)
+            try:
+                result = fn()
+            except RateLimitError as e:
+                delay = self._on_rate_limited(e, attempt)
+                time.sleep(delay)
+                continue
+            self._settle(result, estimated_tokens)
+            return result
+        raise self._exhausted()
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Any:
+        """Versión asíncrona de call(); la espera en la cola ocurre en un hilo aparte"""
+        for attempt in range(self.max_retries + 1):
+            await asyncio.to_thread(self._acquire, estimated_tokens)  # to_thread copia el contexto
+            try:
+                result = await fn()
+            except RateLimitError as e:
+                delay = self._on_rate_limited(e, attempt)
+                await asyncio.sleep(delay)
+                continue
+            self._settle(result, estimated_tokens)
+            return result
+        raise self._exhausted()
+
+    def _acquire(self, estimated_tokens: int):
+        """Espera el turno en la cola y el cupo en las cubetas"""
+        priority = _priority_var.get()
+        user_id = _user_var.get()
+        deadline = time.monotonic() + self.queue_timeout_seconds
+
+        with self._cond:
+            # Etiqueta virtual: cada petición de un usuario va detrás de la anterior del mismo usuario
+            tag = max(self._virtual_time, self._user_tags.get(user_id, 0.0)) + 1
+            self._user_tags[user_id] = tag
+            ticket = _Ticket((int(priority), tag, next(self._seq)), estimated_tokens)
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        self.timeouts += 1
+                        raise QueueTimeoutError("La cola de llamadas a la IA está saturada")
+                    if self._queue[0] is ticket:
+                        wait = max(self.requests.wait_time(1, now),
+                                   self.tokens.wait_time(estimated_tokens, now))
+                        if wait == 0:
+                            heapq.heappop(self._queue)
+                            self.requests.take(1)
+                            self.tokens.take(estimated_tokens)
+                            self._virtual_time = max(self._virtual_time, tag - 1)
+                            self.dispatched += 1
+                            self._waits[Priority(priority)].append(now - ticket.enqueued_at)
+                            self._prune_user_tags()
+                            return
+                        self._cond.wait(min(wait, deadline - now))
+                    else:
+                        self._cond.wait(deadline - now)
+            except BaseException:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                self._cond.notify_all()
+
+    def _settle(self, result: Any, estimated_tokens: int):
+        """Ajusta la cubeta de tokens con el consumo real informado por Groq"""
+        usage = getattr(result, "usage", None)
+        used = getattr(usage, "total_tokens", None) if usage is not None else None
+        with self._cond:
+            if used is None:
+                self.tokens_used += estimated_tokens
+                return
+            self.tokens_used += used
+            self.tokens.adjust(estimated_tokens - used)
+            self._cond.notify_all()
+
+    def _on_rate_limited(self, error: RateLimitError, attempt: int) -> float:
+        with self._cond:
+            self.rate_limited += 1
+            if attempt < self.max_retries:
+                self.retries += 1
+            # Groq ya rechazó: vaciar la cubeta para que el resto también espere
+            self.requests.tokens = 0
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** attempt))
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return random.uniform(delay / 2, delay)  # jitter
+
+    def _exhausted(self) -> RateLimitedError:
+        retry_after = min(self.retry_max_seconds, self.retry_base_seconds * (2 ** self.max_retries))
+        return RateLimitedError("Groq está limitando las peticiones; intenta de nuevo en unos segundos", retry_after)
+
+    def _prune_user_tags(self):
+        """Las etiquetas ya alcanzadas por el tiempo virtual no aportan nada"""
+        if len(self._user_tags) > 1000:
+            self._user_tags = {u: t for u, t in self._user_tags.items() if t > self._virtual_time}
+
+    # ========== MÉTRICAS ==========
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = {p.name.lower(): 0 for p in Priority}
+            for ticket in self._queue:
+                depth[Priority(ticket.key[0]).name.lower()] += 1
+            now = time.monotonic()
+            waits = {p.name.lower(): _wait_summary(list(samples)) for p, samples in self._waits.items()}
+            return {
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_priority": depth,
+                "wait_seconds": waits,
+                "dispatched": self.dispatched,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "timeouts": self.timeouts,
+                "tokens_used": self.tokens_used,
+                "requests_available": round(self.requests.available(now), 2),
+                "tokens_available": round(self.tokens.available(now))
+            }
+
+
+def _wait_summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "max": round(ordered[-1], 3)
+    }
+
+
+def _retry_after_seconds(error: RateLimitError) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: int) -> int:
+    """Estimación conservadora: ~4 caracteres por token de entrada más el máximo de salida"""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
+
+
+_shared_scheduler: Optional[GroqScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_scheduler() -> GroqScheduler:
+    """Planificador compartido por todas las instancias de AIService del proceso"""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = GroqScheduler.from_config()
+        return _shared_scheduler
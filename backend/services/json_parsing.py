@@ -0,0 +1,238 @@
+import json
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+_decoder = json.JSONDecoder(strict=False)
+
+# Caracteres relevantes fuera de cadenas; para buscar cortes seguros también las comas
+_SCAN = re.compile(r'["{}\[\]/]')
+_SCAN_CUTS = re.compile(r'["{}\[\]/,]')
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_CLOSERS = {"{": "}", "[": "]"}
+# Pilas en las que se está entre elementos: el array de nivel superior o el que envuelve un objeto
+_ITEM_LEVELS = ("[", "{[")
+
+
+class JsonExtractionError(ValueError):
+    """No se encontró un valor JSON completo en la respuesta"""
+
+
+def extract_json(text: str, prefer: str = "auto", partial: bool = False) -> Any:
+    """Encuentra el valor JSON de nivel superior en una respuesta de la IA y lo devuelve parseado.
+
+    Intenta decodificar directamente desde cada posible inicio; si falla,
+    recorre el texto respetando cadenas y corchetes balanceados, elimina los
+    comentarios // que estén fuera de cadenas e ignora fences de markdown o
+    texto alrededor. ``prefer`` puede ser "object", "array" o "auto".
+    Con ``partial=True`` una respuesta truncada se cierra en el último
+    elemento completo de la lista (el array de nivel superior o el que
+    envuelve un objeto, como {"scenes": [...]}) en lugar de fallar; los
+    elementos a medias se descartan enteros.
+    """
+    openers = {"object": "{", "array": "["}.get(prefer, "{[")
+    pos = 0
+    last_error: Optional[ValueError] = None
+    while True:
+        start = _find_opener(text, openers, pos)
+        if start < 0:
+            break
+
+        # Caso común: JSON válido desde aquí (el resto del texto se ignora)
+        try:
+            return _decoder.raw_decode(text, start)[0]
+        except ValueError:
+            pass
+
+        end, comments, stack, safe_cut = _scan_value(text, start, track_cuts=partial)
+        if end is not None:
+            try:
+                return _decoder.decode(_without_comments(text, start, end, comments))
+            except ValueError as e:
+                last_error = e
+                pos = end
+                continue
+        if stack is None:
+            # Corchetes desbalanceados: probar con el siguiente inicio
+            pos = start + 1
+            continue
+        # Se acabó el texto con corchetes abiertos (respuesta truncada)
+        if partial and safe_cut is not None:
+            cut, open_stack = safe_cut
+            repaired = _without_comments(text, start, cut, comments).rstrip().rstrip(",")
+            repaired += "".join(_CLOSERS[c] for c in reversed(open_stack))
+            return _decoder.decode(repaired)
+        raise JsonExtractionError("JSON incompleto en la respuesta de la IA")
+
+    if last_error is not None:
+        raise last_error
+    raise JsonExtractionError("No se encontró JSON en la respuesta de la IA")
+
+
+def _find_opener(text: str, openers: str, pos: int) -> int:
+    indexes = [i for i in (text.find(c, pos) for c in openers) if i >= 0]
+    return min(indexes) if indexes else -1
+
+
+def _scan_value(text: str, start: int, track_cuts: bool):
+    """Recorre un valor desde su corchete de apertura.
+
+    Devuelve (fin, comentarios, pila, corte_seguro). ``fin`` es None si el
+    valor no cierra; la pila es None si los corchetes no coinciden. Los
+    cortes seguros solo se anotan entre elementos del array de nivel
+    superior (tras cualquier elemento) o del array dentro del objeto de
+    nivel superior (solo tras un objeto o array completo: así un objeto
+    suelto truncado no se corta dentro de su lista "options").
+    """
+    scan = _SCAN_CUTS if track_cuts else _SCAN
+    stack = ""  # cadena inmutable: guardar un corte no requiere copiarla
+    comments: List[Tuple[int, int]] = []
+    safe_cut: Optional[Tuple[int, str]] = None
+    pos = start
+    length = len(text)
+    while pos < length:
+        m = scan.search(text, pos)
+        if m is None:
+            break
+        i = m.start()
+        ch = text[i]
+        if ch == '"':
+            sm = _STRING.match(text, i)
+            if sm is None:
+                break  # cadena sin cerrar
+            pos = sm.end()
+            continue
+        if ch == "/":
+            if text.startswith("//", i):
+                newline = text.find("\n", i)
+                end = length if newline < 0 else newline
+                comments.append((i, end))
+                pos = end
+            else:
+                pos = i + 1
+            continue
+        if ch == ",":
+            if stack == "[":
+                safe_cut = (i, stack)
+        elif ch == "{" or ch == "[":
+            stack += ch
+            if track_cuts and stack == "[":
+                safe_cut = (i + 1, stack)
+        else:
+            if not stack or _CLOSERS[stack[-1]] != ch:
+                return None, comments, None, None
+            stack = stack[:-1]
+            if not stack:
+                return i + 1, comments, stack, safe_cut
+            if track_cuts and stack in _ITEM_LEVELS:
+                safe_cut = (i + 1, stack)
+        pos = i + 1
+    return None, comments, stack, safe_cut
+
+
+def _without_comments(text: str, start: int, end: int, comments: List[Tuple[int, int]]) -> str:
+    if not comments:
+        return text[start:end]
+    parts = []
+    pos = start
+    for c_start, c_end in comments:
+        if c_start >= end:
+            break
+        parts.append(text[pos:c_start])
+        pos = c_end
+    if pos < end:
+        parts.append(text[pos:end])
+    return "".join(parts)
+
+
+def as_item_list(data: Any, marker_key: str) -> List[Any]:
+    """Normaliza la respuesta a una lista de elementos.
+
+    Acepta un array, un único objeto con ``marker_key`` o un objeto que
+    envuelve la lista (por ejemplo {"questions": [...]}).
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if marker_key in data:
+            return [data]
+        for value in data.values():
+            if isinstance(value, list) and value and isinstance(value[0], dict):
+                return value
+    return [data]
+
+
+class JsonItemStream:
+    """Extrae objetos JSON completos de una respuesta que llega por fragmentos.
+
+    Emite cada objeto que es elemento directo de un array y contiene
+    ``marker_key`` (por ejemplo "question" o "scene_number") apenas se cierra.
+    Respeta las cadenas y omite los comentarios // fuera de ellas.
+    """
+
+    def __init__(self, marker_key: str):
+        self.marker_key = marker_key
+        self.text: List[str] = []      # texto sin comentarios
+        self._length = 0
+        self._stack: List[tuple] = []  # (carácter de apertura, posición)
+        self._in_string = False
+        self._escape = False
+        self._in_comment = False
+        self._pending_slash = False
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Procesa un fragmento y devuelve los objetos que se completaron"""
+        completed = []
+        for ch in chunk:
+            if self._in_comment:
+                if ch == "\n":
+                    self._in_comment = False
+                    self._append(ch)
+                continue
+
+            if self._in_string:
+                self._append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if self._pending_slash:
+                self._pending_slash = False
+                if ch == "/":
+                    self._in_comment = True
+                    continue
+                self._append("/")
+
+            if ch == "/":
+                self._pending_slash = True
+                continue
+
+            self._append(ch)
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._stack.append((ch, self._length - 1))
+            elif ch in "}]" and self._stack:
+                opener, start = self._stack.pop()
+                if ch == "}" and opener == "{" and self._stack and self._stack[-1][0] == "[":
+                    item = self._parse_slice(start, self._length)
+                    if isinstance(item, dict) and self.marker_key in item:
+                        completed.append(item)
+        return completed
+
+    def full_text(self) -> str:
+        """Texto completo recibido (sin comentarios)"""
+        return "".join(self.text)
+
+    def _append(self, ch: str):
+        self.text.append(ch)
+        self._length += 1
+
+    def _parse_slice(self, start: int, end: int) -> Optional[Any]:
+        try:
+            return _decoder.decode("".join(self.text[start:end]))
+        except ValueError:
+            return None
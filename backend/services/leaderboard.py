@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_FIELDS = ("id", "username", "avatar", "total_score", "level")
+
+# Rangos de edad de los rankings por edad: mismos que score_age_bracket en database/schema.sql
+AGE_BRACKETS = {"5-7": (5, 7), "8-10": (8, 10), "11-13": (11, 13), "14-18": (14, 18)}
+UNKNOWN_AGE_BRACKET = "unknown"
+
+WINDOWS = ("week", "month", "all")
+
+
+def age_bracket(age: Optional[int]) -> str:
+    for label, (low, high) in AGE_BRACKETS.items():
+        if age is not None and low <= age <= high:
+            return label
+    return UNKNOWN_AGE_BRACKET
+
+
+def window_start(window: str, today: Optional[date] = None) -> Optional[date]:
+    """Primer día (UTC, como score_buckets) de la ventana: la semana desde el lunes,
+    el mes desde el día 1 (None para 'all')"""
+    today = today or datetime.utcnow().date()
+    if window == "week":
+        return today - timedelta(days=today.weekday())
+    if window == "month":
+        return today.replace(day=1)
+    return None
+
+
+def assign_ranks(rows: List[Dict[str, Any]], score_field: str = "total_score") -> List[Dict[str, Any]]:
+    """Agrega el puesto de competición a filas ya ordenadas por puntaje (1, 2, 2, 4)"""
+    for index, row in enumerate(rows):
+        tied = index > 0 and row[score_field] == rows[index - 1][score_field]
+        row['rank'] = rows[index - 1]['rank'] if tied else index + 1
+    return rows
+
+
+class Leaderboard:
+    """Ranking global en memoria.
+
+    Los usuarios se guardan en un arreglo ordenado de claves
+    (-total_score, id), así el top-N es un corte del arreglo y la posición
+    de un usuario se encuentra con bisect en O(log n). Se carga desde la
+    tabla ``users``, se actualiza cada vez que SupabaseService cambia un
+    puntaje en este proceso y se vuelve a cargar cada
+    ``reconcile_seconds`` para recoger los cambios de otros workers.
+
+    El puesto es de competición: con puntajes empatados comparten puesto
+    (1, 2, 2, 4); dentro de un empate se ordena por id.
+    """
+
+    def __init__(self, db, reconcile_seconds: float = 60, max_users: int = 100000,
+                 compact_hours: float = 24, keep_days: int = 62):
+        self.db = db
+        self.reconcile_seconds = reconcile_seconds
+        self.max_users = max_users
+        self.compact_hours = compact_hours
+        self.keep_days = keep_days
+        self.compacted_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[int, str]] = []      # ordenado: (-total_score, user_id)
+        self._users: Dict[str, Dict[str, Any]] = {}  # user_id -> campos públicos
+        self._loading = False
+        self._changed_while_loading: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.ready = threading.Event()
+        self.loaded_at: Optional[float] = None
+        self.reloads = 0
+        self.updates = 0
+
+    @classmethod
+    def from_config(cls, db) -> "Leaderboard":
+        return cls(
+            db,
+            reconcile_seconds=Config.LEADERBOARD_RECONCILE_SECONDS,
+            max_users=Config.LEADERBOARD_MAX_USERS,
+            compact_hours=Config.SCORE_BUCKETS_COMPACT_HOURS,
+            keep_days=Config.SCORE_BUCKETS_KEEP_DAYS
+        )
+
+    def start(self):
+        """Carga el ranking y lo reconcilia con la base en un hilo de fondo"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leaderboard-reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ========== CARGA Y ACTUALIZACIÓN ==========
+
+    def reload(self) -> int:
+        """Reemplaza el ranking con lo que hay en la base; devuelve cuántos usuarios tiene"""
+        with self._lock:
+            self._loading = True
+            self._changed_while_loading = {}
+        try:
+            rows = self.db.get_user_scores(limit=self.max_users)
+        except Exception:
+            with self._lock:
+                self._loading = False
+            raise
+
+        users = {row['id']: self._public(row) for row in rows}
+        keys = sorted((-users[uid]['total_score'], uid) for uid in users)
+        with self._lock:
+            self._users, self._keys = users, keys
+            # Lo que cambió mientras se leía la base es más nuevo que la lectura
+            for user in self._changed_while_loading.values():
+                self._apply(user)
+            self._loading = False
+            self._changed_while_loading = {}
+            self.loaded_at = time.time()
+            self.reloads += 1
+            count = len(self._keys)
+        self.ready.set()
+        return count
+
+    def apply(self, user: Dict[str, Any]):
+        """Registra el puntaje nuevo de un usuario (llamado por SupabaseService)"""
+        if not user or user.get('id') is None or user.get('total_score') is None:
+            return
+        with self._lock:
+            self.updates += 1
+            if self._loading:
+                self._changed_while_loading[user['id']] = {**self._changed_while_loading.get(user['id'], {}), **user}
+            self._apply(user)
+
+    def _apply(self, user: Dict[str, Any]):
+        # Debe llamarse con el lock tomado
+        user_id = user['id']
+        current = self._users.get(user_id)
+        if current is not None:
+            index = bisect.bisect_left(self._keys, (-current['total_score'], user_id))
+            if index < len(self._keys) and self._keys[index] == (-current['total_score'], user_id):
+                del self._keys[index]
+            merged = {**current, **{k: v for k, v in self._public(user).items() if v is not None}}
+        else:
+            if len(self._users) >= self.max_users:
+                return
+            merged = self._public(user)
+        self._users[user_id] = merged
+        bisect.insort(self._keys, (-merged['total_score'], user_id))
+
+    # ========== CONSULTAS ==========
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._entry(key) for key in self._keys[:max(0, limit)]]
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """Puesto del usuario (1 = primero) o None si no está en el ranking"""
+        with self._lock:
+            return self._rank(user_id)
+
+    def around(self, user_id: str, radius: int = 2) -> Optional[Dict[str, Any]]:
+        """Puesto del usuario y los ``radius`` usuarios antes y después de él"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            index = bisect.bisect_left(self._keys, (-user['total_score'], user_id))
+            start, end = max(0, index - radius), min(len(self._keys), index + radius + 1)
+            return {
+                "user": self._entry(self._keys[index]),
+                "total_users": len(self._keys),
+                "around": [self._entry(key) for key in self._keys[start:end]]
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready.is_set(),
+                "users": len(self._keys),
+                "loaded_at": self.loaded_at,
+                "reloads": self.reloads,
+                "updates": self.updates,
+                "reconcile_seconds": self.reconcile_seconds,
+                "buckets_compacted_at": self.compacted_at
+            }
+
+    # ========== INTERNOS ==========
+
+    def _rank(self, user_id: str) -> Optional[int]:
+        user = self._users.get(user_id)
+        if user is None:
+            return None
+        # Cuántos tienen estrictamente más puntos, más uno
+        return bisect.bisect_left(self._keys, (-user['total_score'], "")) + 1
+
+    def _entry(self, key: Tuple[int, str]) -> Dict[str, Any]:
+        user = self._users[key[1]]
+        return {**user, "rank": bisect.bisect_left(self._keys, (key[0], "")) + 1}
+
+    @staticmethod
+    def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+        user = {field: row.get(field) for field in PUBLIC_FIELDS}
+        if user['total_score'] is not None:
+            user['total_score'] = int(user['total_score'])
+        return user
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                count = self.reload()
+                logger.debug("Ranking recargado: %s usuarios", count)
+            except Exception as e:
+                logger.warning("No se pudo cargar el ranking: %s", e)
+            self._compact_if_due()
+            if self._stop.wait(self.reconcile_seconds):
+                break
+
+    def _compact_if_due(self):
+        """Junta los score_buckets diarios de meses viejos cada ``compact_hours`` (0 = nunca)"""
+        if not self.compact_hours:
+            return
+        if self.compacted_at is not None and time.time() - self.compacted_at < self.compact_hours * 3600:
+            return
+        self.compacted_at = time.time()
+        try:
+            rows = self.db.compact_score_buckets(self.keep_days)
+            if rows:
+                logger.info("score_buckets compactado: %s filas diarias pasadas a meses", rows)
+        except Exception as e:
+            logger.warning("No se pudo compactar score_buckets: %s", e)
@@ -0,0 +1,442 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Parámetros que identifican una llamada (la misma petición = la misma grabación)
+_KEY_PARAMS = ("messages", "model", "temperature", "max_tokens", "response_format")
+
+
+class CassetteMissError(LookupError):
+    """No hay grabación para la petición en modo replay"""
+
+
+# ========== RESPUESTAS CON LA FORMA DEL CLIENTE DE GROQ ==========
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+def make_completion(content: str, model: str, usage: Optional[Dict[str, int]] = None,
+                    messages: Optional[List[Dict[str, str]]] = None) -> _Obj:
+    """Respuesta compatible con ``response.choices[0].message.content`` y ``response.usage``"""
+    if usage is None:
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages or []) // 4
+        completion_tokens = max(1, len(content) // 4)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    return _Obj(
+        model=model,
+        choices=[_Obj(index=0, message=_Obj(role="assistant", content=content), finish_reason="stop")],
+        usage=_Obj(**usage)
+    )
+
+
+def _chunk(text: str) -> _Obj:
+    return _Obj(choices=[_Obj(index=0, delta=_Obj(content=text))])
+
+
+def _usage_dict(usage: Any) -> Optional[Dict[str, int]]:
+    if usage is None:
+        return None
+    return {k: getattr(usage, k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens")}
+
+
+def request_key(params: Dict[str, Any]) -> str:
+    """Hash estable de los parámetros relevantes de una llamada"""
+    relevant = {k: params.get(k) for k in _KEY_PARAMS}
+    canonical = json.dumps(relevant, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+# ========== LATENCIA SIMULADA ==========
+
+class LatencyModel:
+    """Latencia ~ (ttft + tokens / velocidad) * ruido lognormal, con colas lentas ocasionales"""
+
+    def __init__(self, ttft: float = 0.35, tokens_per_second: float = 250.0, sigma: float = 0.25,
+                 straggler_rate: float = 0.05, straggler_factor: float = 3.0, speedup: float = 1.0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.sigma = sigma
+        self.straggler_rate = straggler_rate
+        self.straggler_factor = straggler_factor
+        self.speedup = speedup
+
+    @classmethod
+    def from_config(cls) -> Optional["LatencyModel"]:
+        if Config.LLM_LATENCY_TTFT_SECONDS <= 0 and Config.LLM_LATENCY_TOKENS_PER_SECOND <= 0:
+            return None
+        return cls(
+            ttft=Config.LLM_LATENCY_TTFT_SECONDS,
+            tokens_per_second=Config.LLM_LATENCY_TOKENS_PER_SECOND or 250.0,
+            sigma=Config.LLM_LATENCY_SIGMA
+        )
+
+    def sample(self, completion_tokens: int, rng: random.Random = random) -> float:
+        """Segundos totales de una respuesta con ``completion_tokens`` tokens"""
+        seconds = (self.ttft + completion_tokens / self.tokens_per_second) * rng.lognormvariate(0, self.sigma)
+        if rng.random() < self.straggler_rate:
+            seconds *= self.straggler_factor
+        return seconds / self.speedup
+
+    def first_token(self, total: float, completion_tokens: int) -> float:
+        """Parte de ``total`` que corresponde a la espera hasta el primer token"""
+        base = self.ttft + completion_tokens / self.tokens_per_second
+        return total * (self.ttft / base) if base > 0 else 0.0
+
+
+# ========== TRANSPORTES ==========
+
+class LLMTransport(ABC):
+    """Interfaz de transporte: ``create``/``acreate`` reciben los mismos parámetros que Groq"""
+
+    @abstractmethod
+    def create(self, **params) -> Any:
+        """Llamada síncrona; con ``stream=True`` devuelve un iterador de fragmentos"""
+
+    async def acreate(self, **params) -> Any:
+        return await asyncio.to_thread(lambda: self.create(**params))
+
+
+class LiveTransport(LLMTransport):
+    """Llamadas reales al cliente de Groq"""
+
+    def __init__(self, client, async_client=None):
+        self.client = client
+        self.async_client = async_client
+
+    def create(self, **params) -> Any:
+        return self.client.chat.completions.create(**params)
+
+    async def acreate(self, **params) -> Any:
+        if self.async_client is None:
+            return await super().acreate(**params)
+        return await self.async_client.chat.completions.create(**params)
+
+
+class CassetteStore:
+    """Grabaciones comprimidas: un archivo ``<hash>.json.gz`` por petición con sus respuestas"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json.gz"
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        if not path.exists():
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    def append(self, key: str, request: Dict[str, Any], recording: Dict[str, Any]):
+        with self._lock:
+            cassette = self.load(key) or {"request": request, "responses": []}
+            cassette["responses"].append(recording)
+            tmp = self._path(key).with_suffix(".tmp")
+            with gzip.open(tmp, "wt", encoding="utf-8") as f:
+                json.dump(cassette, f, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+
+    def keys(self) -> List[str]:
+        return [p.name[:-len(".json.gz")] for p in self.directory.glob("*.json.gz")]
+
+
+class RecordingTransport(LLMTransport):
+    """Pasa las llamadas al transporte real y guarda petición, respuesta y latencias"""
+
+    def __init__(self, inner: LLMTransport, store: CassetteStore):
+        self.inner = inner
+        self.store = store
+
+    def create(self, **params) -> Any:
+        start = time.perf_counter()
+        if params.get("stream"):
+            return self._record_stream(params, start)
+        response = self.inner.create(**params)
+        self._save(params, response.choices[0].message.content, getattr(response, "model", params.get("model")),
+                   _usage_dict(getattr(response, "usage", None)), time.perf_counter() - start, None)
+        return response
+
+    async def acreate(self, **params) -> Any:
+        start = time.perf_counter()
+        response = await self.inner.acreate(**params)
+        self._save(params, response.choices[0].message.content, getattr(response, "model", params.get("model")),
+                   _usage_dict(getattr(response, "usage", None)), time.perf_counter() - start, None)
+        return response
+
+    def _record_stream(self, params: Dict[str, Any], start: float) -> Iterator[Any]:
+        parts, first = [], None
+        for chunk in self.inner.create(**params):
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first is None:
+                    first = time.perf_counter() - start
+                parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        self._save(params, "".join(parts), params.get("model"), None, time.perf_counter() - start, first)
+
+    def _save(self, params: Dict[str, Any], content: str, model: str, usage: Optional[Dict[str, int]],
+              latency: float, first_token: Optional[float]):
+        request = {k: params.get(k) for k in _KEY_PARAMS}
+        try:
+            self.store.append(request_key(params), request, {
+                "content": content,
+                "model": model,
+                "usage": usage,
+                "latency_seconds": round(latency, 4),
+                "first_token_seconds": round(first_token, 4) if first_token is not None else None,
+                "recorded_at": time.time()
+            })
+        except OSError as e:
+            logger.warning("No se pudo guardar la grabación de la llamada: %s", e)
+
+
+class _SimulatedTransport(LLMTransport):
+    """Base de replay y sintético: entrega texto con una latencia simulada"""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, seed: Optional[int] = None):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    @abstractmethod
+    def _respond(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Devuelve {"content", "model", "usage", "latency_seconds", "first_token_seconds"}"""
+
+    def create(self, **params) -> Any:
+        recording = self._respond(params)
+        total, first = self._delays(recording)
+        if params.get("stream"):
+            return self._stream(recording["content"], total, first)
+        if total > 0:
+            time.sleep(total)
+        return make_completion(recording["content"], recording.get("model") or params.get("model"),
+                               recording.get("usage"), params.get("messages"))
+
+    async def acreate(self, **params) -> Any:
+        recording = self._respond(params)
+        total, _ = self._delays(recording)
+        if total > 0:
+            await asyncio.sleep(total)
+        return make_completion(recording["content"], recording.get("model") or params.get("model"),
+                               recording.get("usage"), params.get("messages"))
+
+    def _delays(self, recording: Dict[str, Any]):
+        """(segundos totales, segundos hasta el primer token)"""
+        tokens = (recording.get("usage") or {}).get("completion_tokens") or len(recording["content"]) // 4
+        if self.latency is not None:
+            with self._rng_lock:
+                total = self.latency.sample(tokens, self.rng)
+            return total, self.latency.first_token(total, tokens)
+        total = recording.get("latency_seconds") or 0.0
+        first = recording.get("first_token_seconds")
+        return total, first if first is not None else total * 0.2
+
+    def _stream(self, content: str, total: float, first: float) -> Iterator[Any]:
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        per_piece = max(total - first, 0.0) / len(pieces)
+        if first > 0:
+            time.sleep(first)
+        for piece in pieces:
+            if per_piece > 0:
+                time.sleep(per_piece)
+            yield _chunk(piece)
+
+
+class ReplayTransport(_SimulatedTransport):
+    """Responde con las grabaciones; varias respuestas de la misma petición se rotan.
+
+    Sin ``latency`` se reproduce la latencia grabada (``speedup`` la acelera);
+    con un LatencyModel se usa esa distribución.
+    """
+
+    def __init__(self, store: CassetteStore, latency: Optional[LatencyModel] = None,
+                 speedup: float = 1.0, seed: Optional[int] = None):
+        super().__init__(latency, seed)
+        self.store = store
+        self.speedup = speedup
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self._turns: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _respond(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        key = request_key(params)
+        with self._lock:
+            cassette = self._cache.get(key)
+            if cassette is None:
+                cassette = self.store.load(key)
+                if cassette is None:
+                    self.misses += 1
+                    raise CassetteMissError(f"No hay grabación para la petición {key}")
+                self._cache[key] = cassette
+            turn = self._turns.get(key, 0)
+            self._turns[key] = turn + 1
+            self.hits += 1
+        recording = dict(cassette["responses"][turn % len(cassette["responses"])])
+        if self.latency is None and self.speedup != 1.0:
+            recording["latency_seconds"] = (recording.get("latency_seconds") or 0.0) / self.speedup
+            if recording.get("first_token_seconds") is not None:
+                recording["first_token_seconds"] /= self.speedup
+        return recording
+
+
+class SyntheticTransport(_SimulatedTransport):
+    """Genera JSON válido para cada prompt (trivia, aventura, mercadito, feedback) sin red"""
+
+    def _respond(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = params["messages"][-1]["content"]
+        with self._rng_lock:
+            content = synthetic_content(prompt, self.rng)
+        return {"content": content, "model": params.get("model")}
+
+
+# ========== CONTENIDO SINTÉTICO ==========
+
+_INTELLIGENCES = ["linguistic", "logical_mathematical", "spatial", "naturalistic", "interpersonal"]
+_PRODUCTS = [("Papa", "verdura", "🥔"), ("Choclo", "verdura", "🌽"), ("Palta", "fruta", "🥑"),
+             ("Lúcuma", "fruta", "🟤"), ("Quinua", "cereal", "🌾"), ("Manzana", "fruta", "🍎"),
+             ("Camote", "verdura", "🍠"), ("Chirimoya", "fruta", "💚"), ("Maíz morado", "cereal", "🟣"),
+             ("Plátano", "fruta", "🍌")]
+_PLACES = ["Cusco", "Arequipa", "la selva de Madre de Dios", "el lago Titicaca", "Chan Chan", "Paracas"]
+
+
+def _count(pattern: str, prompt: str, default: int) -> int:
+    match = re.search(pattern, prompt)
+    return int(match.group(1)) if match else default
+
+
+def _topic(prompt: str) -> str:
+    match = re.search(r"Tema(?: educativo)?: (.+)", prompt)
+    return match.group(1).strip() if match else "el tema"
+
+
+def _question(topic: str, n: int, rng: random.Random, intelligence: Optional[str] = None) -> Dict[str, Any]:
+    place = rng.choice(_PLACES)
+    return {
+        "question": f"¿Qué aprendemos sobre {topic} en {place}? (pregunta {n}-{rng.randint(100, 999)})",
+        "options": [f"Respuesta {letter} sobre {topic} en {place}" for letter in "ABCD"],
+        "correct_answer": rng.randint(0, 3),
+        "explanation": f"En {place} se puede observar cómo {topic} forma parte de la vida diaria de las familias peruanas.",
+        "difficulty": "medium",
+        "intelligence_type": intelligence or rng.choice(_INTELLIGENCES)
+    }
+
+
+def _scene(topic: str, n: int, total: int, rng: random.Random) -> Dict[str, Any]:
+    next_scene = n + 1 if n < total else 0
+    place = rng.choice(_PLACES)
+    return {
+        "scene_number": n,
+        "description": (f"Killa y su llama Pelusa llegan a {place}. Allí descubren algo nuevo sobre {topic} "
+                        f"y deben decidir qué hacer para seguir su camino."),
+        "choices": [
+            {"text": f"Observar con atención cómo funciona {topic}", "next_scene": next_scene,
+             "is_correct": True, "points": 10, "feedback": f"¡Muy bien! Observar te ayuda a entender {topic}."},
+            {"text": "Seguir caminando sin mirar", "next_scene": next_scene,
+             "is_correct": False, "points": 5, "feedback": "Intenta de nuevo. Mira con más atención a tu alrededor."},
+            {"text": "Preguntar a un abuelo del pueblo", "next_scene": next_scene,
+             "is_correct": True, "points": 10, "feedback": "¡Excelente! Los mayores saben mucho."}
+        ],
+        "learning_point": f"{topic.capitalize()} está presente en {place}"
+    }
+
+
+def _mission(n: int, rng: random.Random, task_type: Optional[str] = None) -> Dict[str, Any]:
+    products = rng.sample(_PRODUCTS, 4)
+    items = [{"id": f"item{i}", "name": name, "price": rng.randint(1, 9), "category": category, "image": image}
+             for i, (name, category, image) in enumerate(products, start=1)]
+    return {
+        "mission_id": n,
+        "title": f"Misión {n}: compras en el mercado de {rng.choice(_PLACES)}",
+        "description": "Ayuda a la casera a elegir los productos correctos con tus soles.",
+        "task_type": task_type or rng.choice(["selection", "math", "classification", "matching"]),
+        "items": items,
+        "correct_items": [items[0]["id"], items[2]["id"]],
+        "points": 10,
+        "hint": "Fíjate en la categoría y en el precio de cada producto.",
+        "intelligence_type": "logical_mathematical"
+    }
+
+
+def synthetic_content(prompt: str, rng: random.Random) -> str:
+    """Respuesta sintética con la forma que pide el prompt"""
+    topic = _topic(prompt)
+    dump = lambda data: json.dumps(data, ensure_ascii=False, indent=2)
+
+    if "UNA pregunta" in prompt:
+        intelligence = re.search(r'"intelligence_type": "(\w+)"', prompt)
+        return dump(_question(topic, 1, rng, intelligence.group(1) if intelligence else None))
+    if "UNA misión" in prompt:
+        task_type = re.search(r'de tipo "(\w+)"', prompt)
+        return dump(_mission(_count(r"la número (\d+)", prompt, 1), rng, task_type.group(1) if task_type else None))
+    if "ESQUEMA" in prompt:
+        total = _count(r"EXACTAMENTE (\d+) escenas", prompt, 5)
+        return dump({
+            "title": f"La gran aventura de {topic}",
+            "introduction": f"Killa despierta en su pueblo con una misión: descubrir los secretos de {topic}.",
+            "scenes": [{"scene_number": n, "summary": f"Killa explora {rng.choice(_PLACES)}",
+                        "learning_point": f"Un dato sobre {topic}"} for n in range(1, total + 1)],
+            "conclusion": f"Killa regresa a casa sabiendo mucho más sobre {topic}."
+        })
+    if "Escribe SOLO la escena" in prompt:
+        return dump(_scene(topic, _count(r"Escribe SOLO la escena (\d+)", prompt, 1), 5, rng))
+    if "tutor amigable" in prompt:
+        count = _count(r"array JSON de (\d+) strings", prompt, 0)
+        messages = [f"¡Muy bien! 🎉 Aprendiste mucho jugando. Sigue explorando y pregunta en casa qué saben del tema. (variante {i + 1})"
+                    for i in range(max(count, 1))]
+        return dump(messages) if count else messages[0]
+    if "preguntas de trivia" in prompt:
+        count = _count(r"Genera (\d+) preguntas", prompt, 5)
+        return "```json\n" + dump([_question(topic, n, rng) for n in range(1, count + 1)]) + "\n```"
+    if "cuentos educativos" in prompt:
+        total = _count(r"EXACTAMENTE (\d+) escenas", prompt, 5)
+        return dump({
+            "title": f"La gran aventura de {topic}",
+            "introduction": f"Killa despierta en su pueblo con una misión: descubrir los secretos de {topic}.",
+            "scenes": [_scene(topic, n, total, rng) for n in range(1, total + 1)],
+            "conclusion": f"Killa regresa a casa sabiendo mucho más sobre {topic}.",
+            "total_scenes": total
+        })
+    if "juegos educativos" in prompt:
+        count = _count(r"Genera (\d+) misiones", prompt, 3)
+        return dump([_mission(n, rng) for n in range(1, count + 1)])
+    return "{}"
+
+
+# ========== CONFIGURACIÓN ==========
+
+def build_transport(client, async_client=None, mode: Optional[str] = None) -> LLMTransport:
+    """Transporte según LLM_TRANSPORT: live | record | replay | synthetic"""
+    mode = (mode or Config.LLM_TRANSPORT).lower()
+    if mode == "live":
+        return LiveTransport(client, async_client)
+    if mode == "record":
+        return RecordingTransport(LiveTransport(client, async_client), CassetteStore(Config.LLM_CASSETTE_DIR))
+    if mode == "replay":
+        return ReplayTransport(CassetteStore(Config.LLM_CASSETTE_DIR), LatencyModel.from_config(),
+                               speedup=Config.LLM_REPLAY_SPEEDUP, seed=Config.LLM_TRANSPORT_SEED)
+    if mode == "synthetic":
+        return SyntheticTransport(LatencyModel.from_config(), seed=Config.LLM_TRANSPORT_SEED)
+    raise ValueError(f"LLM_TRANSPORT desconocido: {mode}")
@@ -0,0 +1,161 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+from config import Config
+
+# Atributos propios de LogRecord; lo demás vino en ``extra`` y va como campo en JSON
+_RECORD_FIELDS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def truncate(text: str, limit: Optional[int] = None) -> str:
+    limit = Config.LOG_MAX_CHARS if limit is None else limit
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} caracteres)"
+
+
+class Truncated:
+    """Payload que se convierte a texto recortado solo si el registro se escribe"""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: Optional[int] = None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return truncate(self.value if isinstance(self.value, str) else str(self.value), self.limit)
+
+
+def log_payload(logger: logging.Logger, message: str, payload: Any,
+                level: int = logging.DEBUG, **fields):
+    """Registra un payload grande (respuesta de la IA, contenido de un juego...).
+
+    Solo si el nivel está activo, solo en una fracción LOG_PAYLOAD_SAMPLE_RATE
+    de las llamadas y recortado a LOG_MAX_CHARS. Con el nivel apagado cuesta
+    una comparación.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if Config.LOG_PAYLOAD_SAMPLE_RATE < 1 and random.random() >= Config.LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.log(level, "%s: %s", message, Truncated(payload), extra=fields or None)
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro, con los campos pasados en ``extra``"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RECORD_FIELDS and not k.startswith("_")}
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return text
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Encola el registro ya formateado y recortado; si la cola está llena lo descarta.
+
+    La petición nunca espera a stdout: lo escribe el hilo del QueueListener.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        # Tope de respaldo para mensajes armados a mano; los payloads ya vienen recortados
+        record.msg = truncate(record.msg, self.max_chars * 4 if self.max_chars > 0 else 0)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Configura el logger raíz con un handler de cola; se puede llamar varias veces"""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(JsonFormatter() if (fmt or Config.LOG_FORMAT) == "json" else TextFormatter())
+
+        log_queue: queue.Queue = queue.Queue(maxsize=max(0, Config.LOG_QUEUE_SIZE))
+        _handler = NonBlockingQueueHandler(log_queue, Config.LOG_MAX_CHARS)
+        _listener = QueueListener(log_queue, output, respect_handler_level=False)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(_handler)
+        root.setLevel(level or Config.LOG_LEVEL)
+        for noisy in ("httpx", "httpcore", "hpack"):
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def _restart_in_child():
+    # El hilo del QueueListener no sobrevive a fork (gunicorn con preload_app): se crea uno nuevo
+    global _listener, _handler, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener, _handler = None, None
+    setup_logging(logging.getLevelName(logging.getLogger().level))
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
+
+
+def logging_stats() -> Dict[str, Any]:
+    if _handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "level": logging.getLevelName(logging.getLogger().level),
+        "queued": _handler.queue.qsize(),
+        "dropped": _handler.dropped
+    }
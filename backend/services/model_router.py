@@ -0,0 +1,373 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from config import Config
+from services.groq_scheduler import SchedulerError
+
+logger = logging.getLogger(__name__)
+
+_served_models: contextvars.ContextVar = contextvars.ContextVar("served_models", default=None)
+
+
+@contextmanager
+def track_models():
+    """Junta los modelos que respondieron las llamadas hechas dentro del bloque"""
+    models: Set[str] = set()
+    token = _served_models.set(models)
+    try:
+        yield models
+    finally:
+        _served_models.reset(token)
+
+
+def record_model(model: str):
+    models = _served_models.get()
+    if models is not None:
+        models.add(model)
+
+
+def models_label(models: Set[str]) -> Optional[str]:
+    return ",".join(sorted(models)) if models else None
+
+
+class CircuitBreaker:
+    """Cortacircuitos: tras ``failure_threshold`` fallos seguidos deja de usar el modelo.
+
+    Pasado ``reset_timeout`` se pasa a medio abierto y se deja salir una sola
+    llamada de prueba; si funciona se cierra, si falla se vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Indica si se puede llamar al modelo ahora"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """La llamada no llegó al modelo: libera la prueba sin contar éxito ni fallo"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "trips": self.trips}
+
+
+class ModelRouter:
+    """Elige el modelo de cada llamada: primario con respaldo rápido.
+
+    Si el primario no responde en ``hedge_after`` segundos se lanza la misma
+    llamada al modelo de respaldo. En ``acomplete`` gana el primer resultado
+    válido; en ``complete`` el primario ocupa el hilo de la petición, así que
+    el respaldo se usa si el primario falla (ya lleva ventaja) y se abandona
+    si el primario responde. Si el primario falla se usa el respaldo de
+    inmediato, y con el cortacircuitos abierto las llamadas van directo al
+    respaldo.
+    """
+
+    def __init__(self, primary: str, fallback: Optional[str] = None, hedge_after: float = 0.0,
+                 breaker: Optional[CircuitBreaker] = None, max_workers: int = 8):
+        self.primary = primary
+        self.fallback = fallback if fallback and fallback != primary else None
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+        self._lock = threading.Lock()
+        self.served: Dict[str, int] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_errors = 0
+        self.short_circuited = 0
+
+    @classmethod
+    def from_config(cls) -> "ModelRouter":
+        return cls(
+            primary=Config.AI_PRIMARY_MODEL,
+            fallback=Config.AI_FALLBACK_MODEL,
+            hedge_after=Config.AI_HEDGE_AFTER_SECONDS,
+            breaker=CircuitBreaker(Config.AI_BREAKER_FAILURES, Config.AI_BREAKER_RESET_SECONDS)
+        )
+
+    def pick_model(self) -> str:
+        """Modelo para una llamada sin respaldo en paralelo (por ejemplo streaming)"""
+        if self.fallback is None or self.breaker.allow():
+            return self.primary
+        self._count(short_circuited=True)
+        return self.fallback
+
+    def report(self, model: str, ok: bool):
+        """Registra el resultado de una llamada hecha con pick_model()"""
+        if model == self.primary and self.fallback is not None:
+            if ok:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+        if ok:
+            self._served(model)
+
+    def release(self, model: str):
+        """La llamada hecha con pick_model() no llegó al modelo (error del planificador)"""
+        if model == self.primary:
+            self.breaker.release()
+
+    def complete(self, call: Callable[[str], Any],
+                 validate: Callable[[Any], bool] = bool) -> Tuple[Any, str]:
+        """Ejecuta ``call(modelo)`` con respaldo y devuelve (resultado, modelo que respondió)"""
+        if self.fallback is None:
+            result = call(self.primary)
+            self._served(self.primary)
+            return result, self.primary
+
+        if not self.breaker.allow():
+            self._count(short_circuited=True)
+            return self._run_fallback(call)
+
+        # El primario corre en el hilo de la petición, con su prioridad en el planificador;
+        # al executor va solo la llamada de respaldo, si el primario tarda más de hedge_after
+        hedge = _Hedge(self, call, self.hedge_after) if self.hedge_after > 0 else None
+        try:
+            ok, result = self._primary_result(call(self.primary), validate)
+        except SchedulerError:
+            self.breaker.release()
+            if hedge is not None:
+                hedge.abandon()
+            raise
+        except Exception as e:
+            ok, result = self._primary_failed(e), None
+        if ok:
+            if hedge is not None:
+                hedge.abandon()
+            return result, self.primary
+
+        secondary = hedge.settle() if hedge is not None else None
+        if secondary is None:
+            return self._run_fallback(call)
+        # El respaldo ya salió mientras el primario tardaba: esperar esa misma llamada
+        try:
+            result = secondary.result()
+        except SchedulerError:
+            raise
+        except Exception as e:
+            logger.warning("El modelo de respaldo falló: %s", e)
+            result = None
+        if result is None or not validate(result):
+            raise RuntimeError("Ni el modelo principal ni el de respaldo devolvieron una respuesta válida")
+        self._count(hedge_win=True)
+        self._served(self.fallback)
+        return result, self.fallback
+
+    async def acomplete(self, call: Callable[[str], Awaitable[Any]],
+                        validate: Callable[[Any], bool] = bool) -> Tuple[Any, str]:
+        """Versión asíncrona de complete()"""
+        if self.fallback is None:
+            result = await call(self.primary)
+            self._served(self.primary)
+            return result, self.primary
+
+        if not self.breaker.allow():
+            self._count(short_circuited=True)
+            result = await call(self.fallback)
+            self._served(self.fallback)
+            return result, self.fallback
+
+        primary = asyncio.ensure_future(call(self.primary))
+        timeout = self.hedge_after if self.hedge_after > 0 else None
+        done, _ = await asyncio.wait({primary}, timeout=timeout)
+        if done:
+            ok, result = self._primary_outcome(primary, validate)
+            if ok:
+                return result, self.primary
+            result = await call(self.fallback)
+            self._served(self.fallback)
+            return result, self.fallback
+
+        self._count(hedge=True)
+        secondary = asyncio.ensure_future(call(self.fallback))
+        pending = {primary, secondary}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is primary:
+                    try:
+                        ok, result = self._primary_outcome(primary, validate)
+                    except SchedulerError:
+                        secondary.cancel()
+                        raise
+                    if ok:
+                        secondary.cancel()
+                        return result, self.primary
+                elif not task.cancelled() and task.exception() is None and validate(task.result()):
+                    self._count(hedge_win=True)
+                    self._served(self.fallback)
+                    primary.add_done_callback(lambda t: self._primary_outcome(t, validate, serve=False))
+                    return task.result(), self.fallback
+        raise RuntimeError("Ni el modelo principal ni el de respaldo devolvieron una respuesta válida")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "primary": self.primary,
+                "fallback": self.fallback,
+                "hedge_after_seconds": self.hedge_after,
+                "served_by": dict(self.served),
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "primary_errors": self.primary_errors,
+                "short_circuited": self.short_circuited,
+                "breaker": self.breaker.stats()
+            }
+
+    def _run_fallback(self, call: Callable[[str], Any]) -> Tuple[Any, str]:
+        result = call(self.fallback)
+        self._served(self.fallback)
+        return result, self.fallback
+
+    def _primary_outcome(self, future, validate: Callable[[Any], bool], serve: bool = True) -> Tuple[bool, Any]:
+        """Actualiza el cortacircuitos con el resultado de una tarea del primario.
+
+        Los errores del planificador (cola saturada, 429 agotados) no dicen nada
+        del modelo: no cuentan para el cortacircuitos y se relanzan, salvo
+        cuando el primario ya perdió la carrera (``serve=False``).
+        """
+        try:
+            if future.cancelled():
+                return False, None
+            result = future.result()
+        except SchedulerError:
+            self.breaker.release()
+            if serve:
+                raise
+            return False, None
+        except Exception as e:
+            return self._primary_failed(e), None
+        return self._primary_result(result, validate, serve)
+
+    def _primary_failed(self, error: Exception) -> bool:
+        logger.warning("El modelo principal falló: %s", error)
+        self._count(primary_error=True)
+        self.breaker.record_failure()
+        return False
+
+    def _primary_result(self, result: Any, validate: Callable[[Any], bool], serve: bool = True) -> Tuple[bool, Any]:
+        if not validate(result):
+            self._count(primary_error=True)
+            self.breaker.record_failure()
+            return False, None
+        self.breaker.record_success()
+        if serve:
+            self._served(self.primary)
+        return True, result
+
+    def _served(self, model: str):
+        record_model(model)
+        with self._lock:
+            self.served[model] = self.served.get(model, 0) + 1
+
+    def _count(self, hedge: bool = False, hedge_win: bool = False,
+               primary_error: bool = False, short_circuited: bool = False):
+        with self._lock:
+            self.hedges += hedge
+            self.hedge_wins += hedge_win
+            self.primary_errors += primary_error
+            self.short_circuited += short_circuited
+
+
+class _Hedge:
+    """Llamada al modelo de respaldo que sale si el primario tarda más de ``delay`` segundos.
+
+    Se abandona si el primario responde antes: se cancela si todavía no
+    empezó y, si ya estaba en curso, su resultado se descarta.
+    """
+
+    def __init__(self, router: ModelRouter, call: Callable[[str], Any], delay: float):
+        self._router = router
+        self._call = call
+        self._context = contextvars.copy_context()  # prioridad y usuario del planificador
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self._future: Optional[Future] = None
+        self._timer = threading.Timer(delay, self._launch)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def settle(self) -> Optional[Future]:
+        """El primario falló: la llamada de respaldo si ya salió (None = no va a salir)"""
+        self._timer.cancel()
+        with self._lock:
+            if self._future is None:
+                self._abandoned = True
+            return self._future
+
+    def abandon(self):
+        self._timer.cancel()
+        with self._lock:
+            self._abandoned = True
+            if self._future is not None:
+                self._future.cancel()
+
+    def _launch(self):
+        with self._lock:
+            if self._abandoned:
+                return
+            self._router._count(hedge=True)
+            self._future = self._router._executor.submit(self._context.run, self._run)
+
+    def _run(self) -> Any:
+        if self._abandoned:
+            return None  # el primario respondió mientras la llamada esperaba un hilo
+        return self._call(self._router.fallback)
+
+
+_shared_router: Optional[ModelRouter] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_router() -> ModelRouter:
+    """Router compartido: el cortacircuitos debe ver todas las llamadas del proceso"""
+    global _shared_router
+    with _shared_lock:
+        if _shared_router is None:
+            _shared_router = ModelRouter.from_config()
+        return _shared_router
@@ -0,0 +1,475 @@
+import hashlib
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from models.game import GameContent, GameType, DifficultyLevel, TriviaQuestion, MarketMission
+from services.content_cache import normalize_topic
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Tipos de juego cuyos elementos son independientes y se pueden recombinar
+BANKABLE_GAME_TYPES = (GameType.TRIVIA, GameType.MARKET)
+BANK_GENERATOR = "question-bank"
+
+BankItem = Union[TriviaQuestion, MarketMission]
+
+
+def _normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def item_id(game_type: GameType, data: Dict[str, Any]) -> str:
+    """Id estable de una pregunta o misión: hash de su texto normalizado"""
+    game_type = GameType(game_type)
+    if game_type == GameType.TRIVIA:
+        text = data.get("question", "")
+    else:
+        text = f"{data.get('title', '')} {data.get('description', '')}"
+    digest = hashlib.sha1(f"{game_type.value}|{_normalize_text(text)}".encode("utf-8")).hexdigest()
+    return digest[:20]
+
+
+def content_items(game_type: GameType, content: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Preguntas o misiones de un contenido serializado (por ejemplo game_sessions.content)"""
+    game_type = GameType(game_type)
+    if game_type == GameType.TRIVIA:
+        return content.get("trivia_questions") or []
+    if game_type == GameType.MARKET:
+        return content.get("market_missions") or []
+    return []
+
+
+class SQLiteBankStore:
+    """Banco de preguntas persistido en un archivo SQLite local"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS question_bank (
+                item_id TEXT PRIMARY KEY,
+                game_type TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                difficulty TEXT NOT NULL,
+                age_range TEXT NOT NULL,
+                intelligence_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                times_served INTEGER DEFAULT 0,
+                times_answered INTEGER DEFAULT 0,
+                times_correct INTEGER DEFAULT 0
+            )
+        """)
+        self._conn.commit()
+
+    def load(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("""
+                SELECT item_id, game_type, topic, difficulty, age_range, intelligence_type,
+                       payload, times_served, times_answered, times_correct
+                FROM question_bank ORDER BY rowid DESC LIMIT ?
+            """, (limit,))
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def add(self, rows: List[Dict[str, Any]]):
+        with self._lock:
+            self._conn.executemany("""
+                INSERT OR IGNORE INTO question_bank
+                    (item_id, game_type, topic, difficulty, age_range, intelligence_type, payload)
+                VALUES (:item_id, :game_type, :topic, :difficulty, :age_range, :intelligence_type, :payload)
+            """, rows)
+            self._conn.commit()
+
+    def record_usage(self, usage: List[Dict[str, Any]]):
+        with self._lock:
+            self._conn.executemany("""
+                UPDATE question_bank SET
+                    times_served = times_served + :served,
+                    times_answered = times_answered + :answered,
+                    times_correct = times_correct + :correct
+                WHERE item_id = :item_id
+            """, usage)
+            self._conn.commit()
+
+
+class SupabaseBankStore:
+    """Banco de preguntas en la tabla question_bank de Supabase"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def load(self, limit: int, page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Los ``limit`` elementos más nuevos, por páginas: PostgREST corta cada respuesta en 1000 filas"""
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < limit:
+            start = len(rows)
+            end = min(start + page_size, limit) - 1
+            response = self.client.table("question_bank")\
+                .select("item_id, game_type, topic, difficulty, age_range, intelligence_type, "
+                        "payload, times_served, times_answered, times_correct")\
+                .order("created_at", desc=True)\
+                .order("item_id")\
+                .range(start, end)\
+                .execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < end - start + 1:
+                break
+        return rows
+
+    def add(self, rows: List[Dict[str, Any]]):
+        records = [{**row, "payload": json.loads(row["payload"])} for row in rows]
+        self.client.table("question_bank").upsert(records, ignore_duplicates=True).execute()
+
+    def record_usage(self, usage: List[Dict[str, Any]]):
+        # Suma en la base de datos: dos procesos pueden registrar el mismo elemento a la vez
+        self.client.rpc("record_question_usage", {"p_usage": usage}).execute()
+
+
+class _BankEntry:
+    """Elemento del banco con sus contadores de uso"""
+
+    __slots__ = ("item", "times_served", "times_answered", "times_correct")
+
+    def __init__(self, item: BankItem, times_served: int = 0, times_answered: int = 0, times_correct: int = 0):
+        self.item = item
+        self.times_served = times_served
+        self.times_answered = times_answered
+        self.times_correct = times_correct
+
+
+class QuestionBank:
+    """Banco de preguntas de trivia y misiones del mercadito ya generadas.
+
+    Cada contenido generado alimenta el banco; los elementos se indexan en
+    memoria por (tipo de juego, tema normalizado, dificultad, rango de edad)
+    y dentro de eso por ``intelligence_type``. ``assemble`` arma un juego
+    nuevo con elementos que el usuario todavía no vio, mezclando tipos de
+    inteligencia y priorizando los menos servidos; si el banco tiene pocos
+    elementos devuelve None y se genera con la IA. La capa persistente
+    (SQLite o Supabase) se escribe en segundo plano.
+    """
+
+    def __init__(self, store=None, load_limit: int = 20000, history_sessions: int = 30,
+                 max_users: int = 5000, seed: Optional[int] = None):
+        self.store = store
+        self.load_limit = load_limit
+        self.history_sessions = history_sessions
+        self.max_users = max_users
+        self.db = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded = store is None
+        self._entries: Dict[str, _BankEntry] = {}
+        # (tipo, tema, dificultad, edad) -> intelligence_type -> [item_id]
+        self._index: Dict[Tuple[str, str, str, str], Dict[str, List[str]]] = {}
+        self._seen: "OrderedDict[str, Set[str]]" = OrderedDict()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="question-bank") if store else None
+
+        self.items_added = 0
+        self.duplicates = 0
+        self.assembled = 0
+        self.too_thin = 0
+        self.answers_recorded = 0
+
+    @classmethod
+    def from_config(cls) -> "QuestionBank":
+        """Construye el banco según la configuración (memory | sqlite | supabase)"""
+        store = None
+        backend = Config.QUESTION_BANK_BACKEND
+        try:
+            if backend == "sqlite":
+                store = SQLiteBankStore(Config.QUESTION_BANK_SQLITE_PATH)
+            elif backend == "supabase":
+                from supabase import create_client
+                store = SupabaseBankStore(create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY))
+        except Exception as e:
+            logger.warning("Banco de preguntas persistente deshabilitado (%s): %s", backend, e)
+            store = None
+
+        return cls(
+            store=store,
+            load_limit=Config.QUESTION_BANK_LOAD_LIMIT,
+            history_sessions=Config.QUESTION_BANK_HISTORY_SESSIONS
+        )
+
+    def use_session_history(self, db):
+        """Usa las sesiones guardadas para saber qué elementos vio cada usuario antes de reiniciar"""
+        self.db = db
+
+    # ========== ALIMENTAR ==========
+
+    def add_content(self, content: GameContent) -> int:
+        """Agrega al banco las preguntas o misiones de un contenido generado; devuelve cuántas eran nuevas"""
+        if content.game_type not in BANKABLE_GAME_TYPES or content.generated_by == BANK_GENERATOR:
+            return 0
+        items = content.trivia_questions if content.game_type == GameType.TRIVIA else content.market_missions
+        group = (content.game_type.value, normalize_topic(content.topic),
+                 content.difficulty.value, (content.age_range or "").strip())
+
+        rows = []
+        self._ensure_loaded()
+        with self._lock:
+            for item in items or []:
+                key = item_id(content.game_type, item.model_dump())
+                if key in self._entries:
+                    self.duplicates += 1
+                    continue
+                stored = item.model_copy(deep=True)
+                self._add_entry(key, group, stored, _BankEntry(stored))
+                self.items_added += 1
+                rows.append({
+                    "item_id": key,
+                    "game_type": group[0],
+                    "topic": group[1],
+                    "difficulty": group[2],
+                    "age_range": group[3],
+                    "intelligence_type": stored.intelligence_type,
+                    "payload": stored.model_dump_json()
+                })
+        if rows:
+            self._persist("add", rows)
+        return len(rows)
+
+    # ========== ARMAR JUEGOS ==========
+
+    def assemble(self, topic: str, game_type: GameType, difficulty: DifficultyLevel,
+                 age_range: str, user_id: Optional[str] = None) -> Optional[GameContent]:
+        """Arma un juego con elementos del banco que el usuario no vio; None si no alcanzan"""
+        if game_type not in BANKABLE_GAME_TYPES:
+            return None
+        needed = Config.TRIVIA_QUESTIONS_COUNT if game_type == GameType.TRIVIA else Config.MARKET_MISSIONS_COUNT
+        group = (game_type.value, normalize_topic(topic), difficulty.value, (age_range or "").strip())
+        seen = self._seen_items(user_id) if user_id else set()
+
+        self._ensure_loaded()
+        with self._lock:
+            by_intelligence = self._index.get(group, {})
+            candidates = {
+                intelligence: sorted(
+                    (key for key in keys if key not in seen),
+                    key=lambda key: (self._entries[key].times_served, self._rng.random())
+                )
+                for intelligence, keys in by_intelligence.items()
+            }
+            if sum(len(keys) for keys in candidates.values()) < needed:
+                self.too_thin += 1
+                return None
+
+            # Alternar tipos de inteligencia para que el juego no sea monótono
+            order = [intelligence for intelligence, keys in candidates.items() if keys]
+            self._rng.shuffle(order)
+            picked: List[str] = []
+            while len(picked) < needed:
+                for intelligence in order:
+                    if candidates[intelligence] and len(picked) < needed:
+                        picked.append(candidates[intelligence].pop(0))
+            items = [self._entries[key].item.model_copy(deep=True) for key in picked]
+            self.assembled += 1
+
+        if game_type == GameType.TRIVIA:
+            for question in items:
+                question.difficulty = difficulty
+            game_data = {"trivia_questions": items}
+        else:
+            for number, mission in enumerate(items, start=1):
+                mission.mission_id = number
+            game_data = {"market_missions": items}
+        return GameContent(
+            topic=topic,
+            game_type=game_type,
+            difficulty=difficulty,
+            age_range=age_range,
+            generated_by=BANK_GENERATOR,
+            **game_data
+        )
+
+    # ========== USO Y ACIERTOS ==========
+
+    def mark_seen(self, user_id: str, content: Union[GameContent, Dict[str, Any]]):
+        """Registra que el usuario recibió estos elementos (no se le vuelven a armar)"""
+        data = content.model_dump(mode="json") if isinstance(content, GameContent) else content
+        game_type = GameType(data["game_type"])
+        keys = [item_id(game_type, item) for item in content_items(game_type, data)]
+        if not keys:
+            return
+        seen = self._seen_items(user_id)
+        with self._lock:
+            seen.update(keys)
+        self._record([{"item_id": key, "served": 1, "answered": 0, "correct": 0} for key in keys])
+
+    def record_answers(self, game_type: Union[GameType, str], content: Dict[str, Any], answers: List[Dict]):
+        """Suma respuestas y aciertos por elemento a partir de las respuestas de una sesión"""
+        game_type = GameType(game_type)
+        items = content_items(game_type, content)
+        usage: Dict[str, Dict[str, Any]] = {}
+
+        if game_type == GameType.TRIVIA:
+            for i, answer in enumerate(answers):
+                if i < len(items):
+                    correct = answer.get("selected_answer") == items[i].get("correct_answer")
+                    self._count_answer(usage, item_id(game_type, items[i]), correct)
+        elif game_type == GameType.MARKET:
+            for answer in answers:
+                mission_id = answer.get("mission_id", 0)
+                if 0 < mission_id <= len(items):
+                    mission = items[mission_id - 1]
+                    correct = set(answer.get("selected_items", [])) == set(mission.get("correct_items", []))
+                    self._count_answer(usage, item_id(game_type, mission), correct)
+
+        if usage:
+            with self._lock:
+                self.answers_recorded += len(usage)
+            self._record(list(usage.values()))
+
+    @staticmethod
+    def _count_answer(usage: Dict[str, Dict[str, Any]], key: str, correct: bool):
+        entry = usage.setdefault(key, {"item_id": key, "served": 0, "answered": 0, "correct": 0})
+        entry["answered"] += 1
+        entry["correct"] += int(correct)
+
+    def item_stats(self, key: str) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._entries.get(key)
+            return self._describe(key, entry) if entry else None
+
+    def stats(self, hardest: int = 5) -> Dict[str, Any]:
+        self._ensure_loaded()
+        with self._lock:
+            answered = [(key, entry) for key, entry in self._entries.items() if entry.times_answered >= 5]
+            answered.sort(key=lambda pair: pair[1].times_correct / pair[1].times_answered)
+            by_type: Dict[str, int] = {}
+            for group, by_intelligence in self._index.items():
+                by_type[group[0]] = by_type.get(group[0], 0) + sum(len(keys) for keys in by_intelligence.values())
+            return {
+                "items": len(self._entries),
+                "items_by_game_type": by_type,
+                "groups": len(self._index),
+                "items_added": self.items_added,
+                "duplicates": self.duplicates,
+                "assembled": self.assembled,
+                "too_thin": self.too_thin,
+                "answers_recorded": self.answers_recorded,
+                "users_tracked": len(self._seen),
+                "hardest_items": [self._describe(key, entry) for key, entry in answered[:hardest]],
+                "persistent_backend": type(self.store).__name__ if self.store else None
+            }
+
+    # ========== INTERNOS ==========
+
+    @staticmethod
+    def _describe(key: str, entry: _BankEntry) -> Dict[str, Any]:
+        item = entry.item
+        return {
+            "item_id": key,
+            "text": item.question if isinstance(item, TriviaQuestion) else item.title,
+            "intelligence_type": item.intelligence_type,
+            "times_served": entry.times_served,
+            "times_answered": entry.times_answered,
+            "times_correct": entry.times_correct,
+            "correct_rate": round(entry.times_correct / entry.times_answered, 4) if entry.times_answered else None
+        }
+
+    def _add_entry(self, key: str, group: Tuple[str, str, str, str], item: BankItem, entry: _BankEntry):
+        # Debe llamarse con el lock tomado
+        self._entries[key] = entry
+        self._index.setdefault(group, {}).setdefault(item.intelligence_type, []).append(key)
+
+    def _record(self, usage: List[Dict[str, Any]]):
+        with self._lock:
+            for row in usage:
+                entry = self._entries.get(row["item_id"])
+                if entry is not None:
+                    entry.times_served += row["served"]
+                    entry.times_answered += row["answered"]
+                    entry.times_correct += row["correct"]
+        self._persist("record_usage", usage)
+
+    def _persist(self, method: str, rows: List[Dict[str, Any]]):
+        if self._writer is None:
+            return
+
+        def write():
+            try:
+                getattr(self.store, method)(rows)
+            except Exception as e:
+                logger.warning("Error guardando en el banco de preguntas (%s): %s", method, e)
+        self._writer.submit(write)
+
+    def _ensure_loaded(self):
+        """Carga la capa persistente la primera vez que se usa el banco"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                rows = self.store.load(self.load_limit)
+            except Exception as e:
+                logger.warning("Error cargando el banco de preguntas: %s", e)
+                return
+            for row in rows:
+                try:
+                    payload = row["payload"]
+                    if isinstance(payload, str):
+                        payload = json.loads(payload)
+                    model = TriviaQuestion if row["game_type"] == GameType.TRIVIA.value else MarketMission
+                    item = model.model_validate(payload)
+                except (ValueError, KeyError) as e:
+                    logger.warning("Elemento inválido en el banco (%s): %s", row.get('item_id'), e)
+                    continue
+                # Filas guardadas antes de plegar los temas: mismo grupo que las nuevas
+                group = (row["game_type"], normalize_topic(row["topic"]), row["difficulty"], row["age_range"])
+                self._add_entry(row["item_id"], group, item, _BankEntry(
+                    item, row.get("times_served") or 0, row.get("times_answered") or 0, row.get("times_correct") or 0
+                ))
+            logger.info("Banco de preguntas cargado: %s elementos", len(self._entries))
+
+    def _seen_items(self, user_id: str) -> Set[str]:
+        """Elementos que el usuario ya recibió (en memoria; la primera vez, desde sus sesiones)"""
+        with self._lock:
+            seen = self._seen.get(user_id)
+            if seen is not None:
+                self._seen.move_to_end(user_id)
+                return seen
+
+        seen = set()
+        if self.db is not None:
+            for session in self.db.get_user_sessions(user_id, limit=self.history_sessions,
+                                                  columns="game_type, content"):
+                try:
+                    seen.update(item_id(session["game_type"], item)
+                                for item in content_items(session["game_type"], session.get("content") or {}))
+                except (KeyError, ValueError, AttributeError):
+                    continue
+
+        with self._lock:
+            seen = self._seen.setdefault(user_id, seen)
+            self._seen.move_to_end(user_id)
+            while len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+            return seen
+
+
+_shared_bank: Optional[QuestionBank] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_question_bank() -> QuestionBank:
+    """Banco compartido por todas las instancias de AIService del proceso"""
+    global _shared_bank
+    with _shared_lock:
+        if _shared_bank is None:
+            _shared_bank = QuestionBank.from_config()
+        return _shared_bank
@@ -0,0 +1,247 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+import httpx
+from config import Config
+from services.unit_of_work import record_db_call
+
+logger = logging.getLogger(__name__)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.HTTP_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.HTTP_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=Config.HTTP_KEEPALIVE_SECONDS
+    )
+
+
+class ServiceRegistry:
+    """Servicios compartidos por todos los blueprints de un proceso.
+
+    Cada servicio se crea la primera vez que se usa, no al importar las
+    rutas: con ``preload_app`` de gunicorn el proceso maestro importa la app
+    sin abrir conexiones ni lanzar hilos, y cada worker crea los suyos al
+    atender su primera petición. Supabase y Groq usan un cliente httpx por
+    proceso con conexiones keep-alive, así las peticiones reutilizan la
+    conexión TLS en lugar de negociar una nueva.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._instances: Dict[str, Any] = {}
+        self._timings: Dict[str, float] = {}
+
+    def _get(self, name: str, factory: Callable[[], Any]) -> Any:
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = factory()
+                self._timings[name] = round((time.perf_counter() - start) * 1000, 2)
+                logger.info("Servicio '%s' creado en %.1f ms", name, self._timings[name])
+            return self._instances[name]
+
+    # ========== CLIENTES HTTP ==========
+
+    @property
+    def supabase_http(self) -> httpx.Client:
+        return self._get("supabase_http", lambda: httpx.Client(
+            limits=_limits(),
+            timeout=httpx.Timeout(Config.SUPABASE_TIMEOUT_SECONDS, connect=Config.HTTP_CONNECT_TIMEOUT_SECONDS),
+            follow_redirects=True,
+            event_hooks={"request": [record_db_call]}  # cuenta las llamadas de cada petición
+        ))
+
+    @property
+    def groq_http(self) -> httpx.Client:
+        return self._get("groq_http", lambda: httpx.Client(limits=_limits(), follow_redirects=True))
+
+    @property
+    def groq_async_http(self) -> httpx.AsyncClient:
+        return self._get("groq_async_http", lambda: httpx.AsyncClient(limits=_limits(), follow_redirects=True))
+
+    # ========== SERVICIOS ==========
+
+    @property
+    def db(self):
+        def build():
+            from supabase import create_client
+            from supabase.lib.client_options import SyncClientOptions
+            from services.supabase_service import SupabaseService
+            if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
+                return SupabaseService()  # lanza el error de credenciales de siempre
+            client = create_client(
+                Config.SUPABASE_URL,
+                Config.SUPABASE_KEY,
+                options=SyncClientOptions(httpx_client=self.supabase_http)
+            )
+            return SupabaseService(client)
+        return self._get("db", build)
+
+    @property
+    def ai(self):
+        """AsyncAIService: sirve a las rutas síncronas (hereda AIService) y a las asíncronas"""
+        def build():
+            from services.async_ai_service import AsyncAIService
+            live = Config.LLM_TRANSPORT in ("live", "record")
+            service = AsyncAIService(
+                http_client=self.groq_http if live else None,
+                async_http_client=self.groq_async_http if live else None
+            )
+            # El banco de preguntas consulta las sesiones para no repetir elementos a un usuario
+            if service.bank is not None:
+                service.bank.use_session_history(self.db)
+            return service
+        return self._get("ai", build)
+
+    @property
+    def content_pool(self):
+        """Pool de contenido pre-generado (None si está deshabilitado)"""
+        def build():
+            if not Config.CONTENT_POOL_ENABLED:
+                return None
+            from services.content_pool import ContentPool
+            pool = ContentPool.from_config(self.ai, self.db)
+            pool.start()
+            return pool
+        return self._get("content_pool", build)
+
+    @property
+    def feedback_worker(self):
+        def build():
+            from services.feedback_worker import FeedbackWorker
+            return FeedbackWorker.from_config(self.ai, self.db)
+        return self._get("feedback_worker", build)
+
+    @property
+    def topic_index(self):
+        """Índice de temas canónicos (None si está deshabilitado), sembrado en segundo plano"""
+        def build():
+            if not Config.TOPIC_INDEX_ENABLED:
+                return None
+            from services.topic_index import get_shared_topic_index
+            index = get_shared_topic_index()
+            threading.Thread(
+                target=index.seed_from_sessions,
+                args=(self.db, Config.TOPIC_INDEX_SEED_SESSIONS),
+                name="topic-index-seed",
+                daemon=True
+            ).start()
+            return index
+        return self._get("topic_index", build)
+
+    @property
+    def leaderboard(self):
+        """Ranking en memoria (None si está deshabilitado), cargado y reconciliado en segundo plano"""
+        def build():
+            if not Config.LEADERBOARD_ENABLED:
+                return None
+            from services.leaderboard import Leaderboard
+            board = Leaderboard.from_config(self.db)
+            self.db.user_listeners.append(board.apply)
+            board.start()
+            return board
+        return self._get("leaderboard", build)
+
+    @property
+    def write_behind(self):
+        """Escritura diferida de puntaje y estadísticas (None si está deshabilitada)"""
+        def build():
+            if not Config.WRITE_BEHIND_ENABLED:
+                return None
+            from services.write_behind import StatsWriteBehind
+            queue = StatsWriteBehind.from_config(self.db)
+            queue.start()
+            self.db.pending_stats = queue.pending_for
+            atexit.register(queue.stop)
+            return queue
+        return self._get("write_behind", build)
+
+    # ========== CICLO DE VIDA ==========
+
+    def warm(self):
+        """Crea de una vez los servicios de uso frecuente (por ejemplo al arrancar un worker)"""
+        for name in ("db", "ai", "feedback_worker", "content_pool", "topic_index", "leaderboard", "write_behind"):
+            getattr(self, name)
+
+    def reset(self):
+        """Olvida los servicios creados; en un proceso hijo recién creado con fork se vuelven a crear.
+
+        No se cierran: sus sockets e hilos pertenecen al proceso padre.
+        """
+        self._lock = threading.RLock()
+        self._instances = {}
+        self._timings = {}
+
+    def stats(self) -> Dict[str, Any]:
+        board = self._instances.get("leaderboard")
+        queue = self._instances.get("write_behind")
+        return {
+            "pid": os.getpid(),
+            "created": dict(self._timings),
+            "http_pool": {
+                "max_connections": Config.HTTP_POOL_MAX_CONNECTIONS,
+                "max_keepalive": Config.HTTP_POOL_MAX_KEEPALIVE,
+                "keepalive_seconds": Config.HTTP_KEEPALIVE_SECONDS
+            },
+            "leaderboard": board.stats() if board is not None else None,
+            "write_behind": queue.stats() if queue is not None else None
+        }
+
+
+class LazyService:
+    """Referencia a un servicio del registro que se resuelve en cada uso.
+
+    Permite seguir escribiendo ``db.get_user(...)`` en las rutas sin crear
+    el servicio al importar el módulo.
+    """
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: ServiceRegistry, name: str):
+        self._registry = registry
+        self._name = name
+
+    def resolve(self) -> Any:
+        return getattr(self._registry, self._name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __bool__(self) -> bool:
+        return self.resolve() is not None
+
+
+_registry: Optional[ServiceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ServiceRegistry:
+    """Registro compartido por todas las rutas del proceso"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ServiceRegistry()
+        return _registry
+
+
+def lazy(name: str) -> LazyService:
+    return LazyService(get_registry(), name)
+
+
+def _after_fork_in_child():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    if _registry is not None:
+        _registry.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
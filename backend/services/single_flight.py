@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import Any, Callable, Awaitable, Dict, Tuple
+
+
+class _Call:
+    """Una ejecución en curso y sus resultados"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma llave en una sola ejecución.
+
+    La primera llamada ejecuta la función; las que llegan mientras tanto
+    esperan y comparten su resultado (o su excepción).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Ejecuta fn una sola vez por llave en curso. Devuelve (resultado, compartido)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Versión asíncrona de do() para tareas del mismo event loop"""
+        loop = asyncio.get_running_loop()
+        key = (id(loop), key)  # los futures solo sirven dentro de su propio loop
+        future = self._async_calls.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+            return await asyncio.shield(future), True
+
+        future = loop.create_future()
+        self._async_calls[key] = future
+        with self._lock:
+            self.executions += 1
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el aviso de "exception was never retrieved" si nadie esperaba
+            future.exception()
+            raise
+        finally:
+            self._async_calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.executions + self.coalesced
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0.0
+            }
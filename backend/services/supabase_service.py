@@ -1,27 +1,153 @@
+import base64
+import json
+import logging
+import uuid
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
 from config import Config
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable, Tuple
+from datetime import date, datetime
 from models.user import User
+from services.unit_of_work import UnitOfWork, current_unit_of_work
+from services.leaderboard import age_bracket
+from services.game_contents import ContentLRU, content_hash, pack_content, unpack_content
+
+logger = logging.getLogger(__name__)
+
+# Logros por juego completado: (tipo, título, descripción, condición(juegos_jugados, puntaje)).
+# Las mismas reglas están en las funciones submit_game_session y apply_stat_events de database/schema.sql
+ACHIEVEMENT_RULES = [
+    ("first_game", "🎮 Primer Juego", "¡Completaste tu primer juego en YachAI!", lambda games, score: games == 1),
+    ("dedicated", "🔥 Dedicado", "¡Completaste 5 juegos!", lambda games, score: games == 5),
+    ("veteran", "⭐ Veterano", "¡Completaste 10 juegos!", lambda games, score: games == 10),
+    ("high_score", "🌟 Súper Estrella", "¡Obtuviste más de 50 puntos en un juego!", lambda games, score: score >= 50),
+]
+
+# Columnas de game_sessions para listas e historiales: sin content ni answers, que pesan decenas de KB.
+# La sesión completa solo se lee en GET /api/games/<session_id>
+SESSION_SUMMARY_COLUMNS = "id, topic, game_type, difficulty, score, status, completed, started_at, completed_at"
+
+
+# Errores de PostgREST cuando la base todavía no tiene game_contents o game_sessions.content_id:
+# relación, columna o tabla inexistente
+MISSING_SCHEMA_CODES = {"PGRST200", "PGRST204", "PGRST205", "42P01", "42703"}
+
+
+class InvalidCursor(ValueError):
+    """El cursor de paginación no es uno devuelto por la API"""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Cursor opaco con la posición (started_at, id) de la última sesión de una página"""
+    raw = json.dumps([row['started_at'], row['id']], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Posición (started_at, id) del cursor, ya normalizada: va tal cual dentro del filtro or_"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        started_at, session_id = json.loads(raw)
+        return datetime.fromisoformat(started_at).isoformat(), str(uuid.UUID(session_id))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidCursor("Cursor inválido") from e
+
 
 class SupabaseService:
     """Servicio para manejar la base de datos Supabase"""
     
-    def __init__(self):
-        """Inicializar cliente de Supabase"""
+    def __init__(self, client: Optional[Client] = None):
+        """Inicializar cliente de Supabase (o usar uno ya creado, ver services.registry)"""
         try:
-            if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
+            if client is None and (not Config.SUPABASE_URL or not Config.SUPABASE_KEY):
                 raise ValueError("Faltan credenciales de Supabase en .env")
             
-            self.supabase: Client = create_client(
+            self.supabase: Client = client or create_client(
                 Config.SUPABASE_URL, 
                 Config.SUPABASE_KEY
             )
-            print("✅ Supabase conectado correctamente")
+            # Hasta saber que la base no tiene la función submit_game_session
+            self.submit_rpc_available = True
+            # Contenido de las sesiones guardado una sola vez en game_contents (hasta saber que la base no la tiene)
+            self.game_contents_available = Config.GAME_CONTENTS_ENABLED
+            self.known_contents = ContentLRU(Config.GAME_CONTENTS_CACHE_SIZE)
+            # Funciones llamadas con la fila del usuario cada vez que cambia su puntaje (ver services.leaderboard)
+            self.user_listeners: List[Callable[[Dict[str, Any]], None]] = []
+            # Puntaje y estadísticas todavía sin aplicar de un usuario (ver services.write_behind)
+            self.pending_stats: Optional[Callable[[str], Optional[Dict[str, int]]]] = None
+            logger.info("Supabase conectado correctamente")
         except Exception as e:
-            print(f"❌ Error al conectar con Supabase: {str(e)}")
+            logger.error("Error al conectar con Supabase: %s", e)
             raise e
     
+    # ========== MAPA DE IDENTIDAD DE LA PETICIÓN ==========
+    # Dentro de una petición (ver services.unit_of_work) una fila ya leída o
+    # escrita se devuelve desde memoria; fuera de una petición no se guarda nada.
+
+    @staticmethod
+    def _cached(table: str, key: str) -> Optional[Dict[str, Any]]:
+        uow = current_unit_of_work()
+        return uow.get(table, key) if uow is not None else None
+
+    @staticmethod
+    def _remember(table: str, key: str, row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.put(table, key, row)
+        return row
+
+    @staticmethod
+    def _forget(table: str, key: str):
+        uow = current_unit_of_work()
+        if uow is not None:
+            uow.forget(table, key)
+
+    def flush_unit_of_work(self, uow: UnitOfWork):
+        """Inserta las filas diferidas de la petición, una llamada por tabla"""
+        for table, rows in uow.take_pending().items():
+            try:
+                self.supabase.table(table).insert(rows).execute()
+            except Exception as e:
+                logger.error("Error insertando %s fila(s) diferidas en %s: %s", len(rows), table, e)
+
+    def notify_user_changed(self, user: Optional[Dict[str, Any]]):
+        if not user:
+            return
+        for listener in self.user_listeners:
+            try:
+                listener(user)
+            except Exception as e:
+                logger.warning("Error notificando el cambio de usuario: %s", e)
+
+    # Con la escritura diferida, lo que se lee de users y user_statistics se completa
+    # con los juegos que todavía están en la cola
+
+    def _with_pending_user(self, user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        delta = self.pending_stats(user['id']) if user and self.pending_stats else None
+        if not delta:
+            return user
+        total_score = (user.get('total_score') or 0) + delta.get('score', 0)
+        return {
+            **user,
+            "total_score": total_score,
+            "total_coins": (user.get('total_coins') or 0) + delta.get('coins', 0),
+            "level": total_score // 100 + 1
+        }
+
+    def _with_pending_stats(self, stats: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        delta = self.pending_stats(stats['user_id']) if stats and self.pending_stats else None
+        if not delta:
+            return stats
+        stats = dict(stats)
+        for key, value in delta.items():
+            if key == "games":
+                stats['games_played'] = (stats.get('games_played') or 0) + value
+                stats['topics_completed'] = (stats.get('topics_completed') or 0) + value
+            elif key.endswith(("_count", "_score")):
+                stats[key] = (stats.get(key) or 0) + value
+        return stats
+
     # ========== USUARIOS ==========
     
     def create_user(self, username: str, password: str, avatar: str, age: int, email: Optional[str] = None) -> Dict[str, Any]:
@@ -45,73 +171,53 @@ class SupabaseService:
             if response.data and len(response.data) > 0:
                 user = response.data[0]
                 user.pop('password', None)
-                print(f"✅ Usuario creado: {user['username']}")
+                logger.info("Usuario creado", extra={"user_id": user['id']})
+                self.notify_user_changed(user)
                 return user
             else:
                 raise Exception("No se pudo crear el usuario")
                 
         except Exception as e:
-            print(f"❌ Error en create_user: {str(e)}")
+            logger.error("Error en create_user: %s", e)
             raise e
     
     def authenticate_user(self, username: str, password: str) -> Optional[Dict[str, Any]]:
         """Autentica un usuario"""
         try:
-            print(f"\n🔐 === DEBUGGING LOGIN ===")
-            print(f"Username recibido: '{username}'")
-            print(f"Password recibido: '{password}'")
-            
             response = self.supabase.table("users").select("*").eq("username", username.lower()).execute()
             
-            print(f"Usuarios encontrados: {len(response.data) if response.data else 0}")
-            
             if response.data and len(response.data) > 0:
                 user = response.data[0]
                 
-                print(f"Usuario encontrado en BD:")
-                print(f"  - ID: {user['id']}")
-                print(f"  - Username: {user['username']}")
-                print(f"  - Hash en BD: {user['password'][:30]}...")
-                print(f"  - Edad: {user.get('age')}")
-                
-                print(f"\n🔑 Verificando contraseña...")
-                is_valid = User.verify_password(password, user['password'])
-                print(f"¿Contraseña válida? {is_valid}")
-                
-                if is_valid:
+                if User.verify_password(password, user['password']):
                     user.pop('password', None)
-                    print(f"✅ Login exitoso: {username}")
-                    return user
+                    logger.info("Login exitoso", extra={"user_id": user['id']})
+                    return self._with_pending_user(user)
                 else:
-                    print(f"❌ Contraseña incorrecta para: {username}")
-                    
-                    test_hash = User.hash_password(password)
-                    print(f"\n🧪 Hash de prueba con la contraseña '{password}':")
-                    print(f"   Nuevo hash: {test_hash[:30]}...")
-                    print(f"   Hash en BD: {user['password'][:30]}...")
-                    print(f"   ¿Son iguales? {test_hash == user['password']}")
-                    
+                    logger.info("Contraseña incorrecta", extra={"user_id": user['id']})
                     return None
             else:
-                print(f"❌ Usuario no encontrado: {username}")
+                logger.info("Login de usuario inexistente")
                 return None
-        except Exception as e:
-            print(f"❌ Error en authenticate_user: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error en authenticate_user")
             return None
     
-    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Obtiene un usuario por ID"""
+    def get_user(self, user_id: str, include_pending: bool = True) -> Optional[Dict[str, Any]]:
+        """Obtiene un usuario por ID (con include_pending, sumando sus juegos todavía en la cola)"""
+        user = self._cached("users", user_id)
+        if user is not None:
+            return self._with_pending_user(user) if include_pending else user
         try:
             response = self.supabase.table("users").select("*").eq("id", user_id).execute()
             if response.data:
                 user = response.data[0]
                 user.pop('password', None)
-                return user
+                self._remember("users", user_id, user)
+                return self._with_pending_user(user) if include_pending else user
             return None
         except Exception as e:
-            print(f"❌ Error en get_user: {str(e)}")
+            logger.error("Error en get_user: %s", e)
             return None
     
     def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
@@ -121,16 +227,16 @@ class SupabaseService:
             if response.data:
                 user = response.data[0]
                 user.pop('password', None)
-                return user
+                return self._with_pending_user(user)
             return None
         except Exception as e:
-            print(f"❌ Error en get_user_by_username: {str(e)}")
+            logger.error("Error en get_user_by_username: %s", e)
             return None
 
     def update_user_score(self, user_id: str, score: int, coins: int) -> Dict[str, Any]:
         """Actualiza el puntaje y monedas del usuario"""
         try:
-            user = self.get_user(user_id)
+            user = self.get_user(user_id, include_pending=False)
             if not user:
                 raise Exception("Usuario no encontrado")
             
@@ -145,13 +251,81 @@ class SupabaseService:
             }).eq("id", user_id).execute()
             
             if response.data:
-                return response.data[0]
+                user = response.data[0]
+                user.pop('password', None)
+                self.notify_user_changed(user)
+                return self._remember("users", user_id, user)
             return None
         except Exception as e:
-            print(f"❌ Error en update_user_score: {str(e)}")
+            logger.error("Error en update_user_score: %s", e)
             raise e
     
     # ========== SESIONES DE JUEGO ==========
+    # El contenido de una sesión (decenas de KB) se guarda una sola vez en game_contents,
+    # con llave el hash de su JSON canónico; la sesión solo guarda content_id. Las sesiones
+    # anteriores (o las de una base sin game_contents) siguen con el contenido en content.
+
+    def store_game_content(self, content: Dict[str, Any]) -> Optional[str]:
+        """Guarda el contenido en game_contents si no estaba; devuelve su content_id (None si no hay tabla)"""
+        if not self.game_contents_available:
+            return None
+        content_id = content_hash(content)
+        if content_id in self.known_contents:
+            return content_id
+        try:
+            self.supabase.table("game_contents").upsert(
+                {"content_id": content_id, "payload": pack_content(content)},
+                on_conflict="content_id",
+                ignore_duplicates=True,
+                returning=ReturnMethod.minimal
+            ).execute()
+        except APIError as e:
+            if e.code not in MISSING_SCHEMA_CODES:
+                raise e
+            self._game_contents_missing()
+            return None
+        self.known_contents.put(content_id, content)
+        return content_id
+
+    def _game_contents_missing(self):
+        logger.warning("La base no tiene game_contents (ejecuta database/schema.sql); "
+                       "el contenido se guarda en cada sesión")
+        self.game_contents_available = False
+
+    def _select_sessions(self, columns: str, build: Callable):
+        """SELECT sobre game_sessions que trae el contenido de game_contents en la misma llamada"""
+        wants_content = columns.strip() == "*" or "content" in columns
+        if wants_content and self.game_contents_available:
+            embedded = columns if columns.strip() == "*" else f"{columns}, content_id"
+            try:
+                response = build(self.supabase.table("game_sessions")
+                                 .select(f"{embedded}, game_contents(payload)")).execute()
+                for row in response.data or []:
+                    self._fill_content(row, row.pop('game_contents', None))
+                return response
+            except APIError as e:
+                if e.code not in MISSING_SCHEMA_CODES:
+                    raise e
+                self._game_contents_missing()
+        return build(self.supabase.table("game_sessions").select(columns)).execute()
+
+    def _fill_content(self, row: Dict[str, Any], embedded: Optional[Dict[str, Any]] = None):
+        content_id = row.get('content_id')
+        if row.get('content') is not None or not content_id:
+            return
+        content = self.known_contents.get(content_id)
+        if content is None and embedded and embedded.get('payload'):
+            content = unpack_content(embedded['payload'])
+            self.known_contents.put(content_id, content)
+        row['content'] = content
+
+    def _remember_session(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        """Guarda en la unidad de trabajo una sesión devuelta por un UPDATE, si se le puede completar el contenido"""
+        self._fill_content(session)
+        if session.get('content') is None and session.get('content_id'):
+            self._forget("game_sessions", session['id'])
+            return session
+        return self._remember("game_sessions", session['id'], session)
     
     def create_game_session(self, user_id: str, topic: str, game_type: str, 
                            difficulty: str, age_range: str, content: dict = None) -> Dict[str, Any]:
@@ -167,14 +341,27 @@ class SupabaseService:
                 "score": 0,
                 "content": content
             }
-            
-            response = self.supabase.table("game_sessions").insert(session_data).execute()
+            content_id = self.store_game_content(content) if content else None
+            if content_id:
+                try:
+                    response = self.supabase.table("game_sessions")\
+                        .insert({**session_data, "content": None, "content_id": content_id}).execute()
+                except APIError as e:
+                    if e.code not in MISSING_SCHEMA_CODES:
+                        raise e
+                    self._game_contents_missing()  # game_sessions todavía sin content_id
+                    content_id = None
+            if not content_id:
+                response = self.supabase.table("game_sessions").insert(session_data).execute()
             
             if response.data:
-                return response.data[0]
+                session = response.data[0]
+                if content_id:
+                    session['content'] = content
+                return self._remember("game_sessions", session['id'], session)
             raise Exception("No se pudo crear la sesión")
         except Exception as e:
-            print(f"❌ Error en create_game_session: {str(e)}")
+            logger.error("Error en create_game_session: %s", e)
             raise e
     
     def update_game_session(self, session_id: str, score: int, answers: List[Dict], status: str = "completed") -> Dict[str, Any]:
@@ -191,44 +378,193 @@ class SupabaseService:
             response = self.supabase.table("game_sessions").update(update_data).eq("id", session_id).execute()
             
             if response.data:
-                return response.data[0]
+                return self._remember_session(response.data[0])
             return None
         except Exception as e:
-            print(f"❌ Error en update_game_session: {str(e)}")
+            logger.error("Error en update_game_session: %s", e)
+            raise e
+    
+    def submit_game_session(self, session: Dict[str, Any], score: int, coins: int, answers: List[Dict],
+                            intelligence_scores: Dict[str, int]) -> Dict[str, Any]:
+        """Completa una sesión: la marca, suma puntaje y estadísticas y otorga logros.
+
+        Es una sola llamada a la función submit_game_session de schema.sql, que
+        lo hace todo en una transacción. Si la base todavía no tiene la función
+        se hacen las mismas escrituras una por una.
+        Devuelve {"status": "completed" | "already_completed" | "not_found", "achievements": [...], ...}
+        """
+        if self.submit_rpc_available:
+            try:
+                response = self.supabase.rpc("submit_game_session", {
+                    "p_session_id": session['id'],
+                    "p_score": score,
+                    "p_coins": coins,
+                    "p_answers": answers,
+                    "p_intelligence": intelligence_scores
+                }).execute()
+                # La función cambió estas filas; la siguiente lectura debe ir a la base
+                self._forget("game_sessions", session['id'])
+                self._forget("users", session['user_id'])
+                if response.data and response.data.get('statistics'):
+                    self._remember("user_statistics", session['user_id'], response.data['statistics'])
+                if response.data:
+                    self.notify_user_changed(response.data.get('user'))
+                return response.data
+            except APIError as e:
+                if e.code != "PGRST202":  # PGRST202: la función no existe
+                    logger.error("Error en submit_game_session: %s", e)
+                    raise e
+                logger.warning("La base no tiene la función submit_game_session (ejecuta database/schema.sql); "
+                               "se usan llamadas separadas")
+                self.submit_rpc_available = False
+        return self._submit_game_session_by_steps(session, score, coins, answers, intelligence_scores)
+
+    def complete_game_session(self, session_id: str, score: int, answers: List[Dict]) -> Optional[Dict[str, Any]]:
+        """Marca la sesión como completada solo si no lo estaba; devuelve None si ya lo estaba (o no existe)"""
+        try:
+            response = self.supabase.table("game_sessions").update({
+                "score": score,
+                "answers": answers,
+                "status": "completed",
+                "completed": True,
+                "completed_at": datetime.utcnow().isoformat()
+            }).eq("id", session_id).or_("completed.is.null,completed.is.false").execute()
+            return self._remember_session(response.data[0]) if response.data else None
+        except Exception as e:
+            logger.error("Error en complete_game_session: %s", e)
+            raise e
+
+    def apply_stat_events(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Aplica en una llamada los eventos de la escritura diferida (función apply_stat_events de schema.sql).
+
+        Devuelve {"applied": n, "achievements": n, "users": [{id, total_score, total_coins, level}, ...]}
+        """
+        response = self.supabase.rpc("apply_stat_events", {"p_events": events}).execute()
+        for event in events:
+            self._forget("users", event['user_id'])
+            self._forget("user_statistics", event['user_id'])
+        return response.data or {}
+
+    def _submit_game_session_by_steps(self, session: Dict[str, Any], score: int, coins: int,
+                                      answers: List[Dict], intelligence_scores: Dict[str, int]) -> Dict[str, Any]:
+        """Lo mismo que submit_game_session en varias llamadas (sin transacción)"""
+        if session.get('completed'):
+            return {"status": "already_completed"}
+        user_id = session['user_id']
+        self.update_game_session(session['id'], score, answers, status="completed")
+        user = self.update_user_score(user_id=user_id, score=score, coins=coins)
+        self.add_score_bucket(user_id, (user or {}).get('age'), score)
+        stats = self.update_user_statistics(
+            user_id=user_id,
+            game_type=session['game_type'],
+            intelligence_scores=intelligence_scores,
+            topic=session['topic']
+        ) or {}
+        achievements = []
+        for achievement_type, title, description, earned in ACHIEVEMENT_RULES:
+            if earned(stats.get('games_played', 0), score):
+                self.add_achievement(user_id, achievement_type, title, description)
+                achievements.append({"achievement_type": achievement_type, "title": title, "description": description})
+        return {
+            "status": "completed",
+            "user": {key: (user or {}).get(key) for key in ("id", "total_score", "total_coins", "level")},
+            "statistics": stats,
+            "achievements": achievements
+        }
+    
+    def update_session_feedback(self, session_id: str, feedback: str, status: str = "ready") -> Optional[Dict[str, Any]]:
+        """Guarda el feedback generado en segundo plano"""
+        try:
+            response = self.supabase.table("game_sessions")\
+                .update({"feedback": feedback, "feedback_status": status})\
+                .eq("id", session_id)\
+                .execute()
+            return self._remember_session(response.data[0]) if response.data else None
+        except Exception as e:
+            logger.error("Error en update_session_feedback: %s", e)
             raise e
     
     def get_game_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Obtiene una sesión de juego"""
+        cached = self._cached("game_sessions", session_id)
+        if cached is not None:
+            return cached
         try:
-            response = self.supabase.table("game_sessions").select("*").eq("id", session_id).execute()
-            return response.data[0] if response.data else None
+            response = self._select_sessions("*", lambda query: query.eq("id", session_id))
+            return self._remember("game_sessions", session_id, response.data[0]) if response.data else None
         except Exception as e:
-            print(f"❌ Error en get_game_session: {str(e)}")
+            logger.error("Error en get_game_session: %s", e)
             return None
     
-    def get_user_sessions(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Obtiene las sesiones de un usuario"""
+    def get_user_sessions(self, user_id: str, limit: int = 10, columns: str = "*") -> List[Dict[str, Any]]:
+        """Obtiene las sesiones de un usuario (las más recientes primero)"""
+        try:
+            response = self._select_sessions(columns, lambda query: query
+                                             .eq("user_id", user_id)
+                                             .order("started_at", desc=True)
+                                             .limit(limit))
+            return response.data if response.data else []
+        except Exception as e:
+            logger.error("Error en get_user_sessions: %s", e)
+            return []
+    
+    def get_user_session_page(self, user_id: str, limit: int = 10,
+                              cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Una página del historial de un usuario (SESSION_SUMMARY_COLUMNS), de la más reciente a la más vieja.
+
+        Paginación por clave (started_at, id) sobre idx_game_sessions_user_started: cada página
+        sigue desde la última fila de la anterior, sin OFFSET. Devuelve (sesiones, cursor de la
+        página siguiente o None si no hay más). Lanza InvalidCursor si el cursor no es válido.
+        """
+        query = self.supabase.table("game_sessions")\
+            .select(SESSION_SUMMARY_COLUMNS)\
+            .eq("user_id", user_id)
+        if cursor:
+            started_at, session_id = decode_cursor(cursor)
+            query = query.or_(f'started_at.lt."{started_at}",'
+                              f'and(started_at.eq."{started_at}",id.lt."{session_id}")')
+        try:
+            response = query\
+                .order("started_at", desc=True)\
+                .order("id", desc=True)\
+                .limit(limit + 1)\
+                .execute()
+        except Exception as e:
+            logger.error("Error en get_user_session_page: %s", e)
+            raise e
+        rows = response.data or []
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, encode_cursor(rows[-1])
+        return rows, None
+
+    def get_recent_session_keys(self, limit: int = 500) -> List[Dict[str, Any]]:
+        """Obtiene tema, tipo, dificultad y edad de las sesiones más recientes"""
         try:
             response = self.supabase.table("game_sessions")\
-                .select("*")\
-                .eq("user_id", user_id)\
+                .select("topic, game_type, difficulty, age_range, started_at")\
                 .order("started_at", desc=True)\
                 .limit(limit)\
                 .execute()
             return response.data if response.data else []
         except Exception as e:
-            print(f"❌ Error en get_user_sessions: {str(e)}")
+            logger.error("Error en get_recent_session_keys: %s", e)
             return []
     
     # ========== ESTADÍSTICAS Y PROGRESO ==========
     
-    def get_user_statistics(self, user_id: str) -> Optional[Dict[str, Any]]:
-        """Obtiene estadísticas del usuario"""
+    def get_user_statistics(self, user_id: str, include_pending: bool = True) -> Optional[Dict[str, Any]]:
+        """Obtiene estadísticas del usuario (con include_pending, sumando sus juegos todavía en la cola)"""
+        if include_pending:
+            return self._with_pending_stats(self.get_user_statistics(user_id, include_pending=False))
+        cached = self._cached("user_statistics", user_id)
+        if cached is not None:
+            return cached
         try:
             response = self.supabase.table("user_statistics").select("*").eq("user_id", user_id).execute()
             
             if response.data:
-                return response.data[0]
+                return self._remember("user_statistics", user_id, response.data[0])
             else:
                 new_stats = {
                     "user_id": user_id,
@@ -244,9 +580,11 @@ class SupabaseService:
                     "interpersonal_score": 0
                 }
                 create_response = self.supabase.table("user_statistics").insert(new_stats).execute()
-                return create_response.data[0] if create_response.data else None
+                if create_response.data:
+                    return self._remember("user_statistics", user_id, create_response.data[0])
+                return None
         except Exception as e:
-            print(f"❌ Error en get_user_statistics: {str(e)}")
+            logger.error("Error en get_user_statistics: %s", e)
             return None
     
     def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
@@ -259,8 +597,84 @@ class SupabaseService:
                 .execute()
             return response.data if response.data else []
         except Exception as e:
-            print(f"❌ Error en get_leaderboard: {str(e)}")
+            logger.error("Error en get_leaderboard: %s", e)
+            return []
+
+    def get_windowed_leaderboard(self, since: Optional[date], bracket: Optional[str],
+                                 limit: int = 10) -> List[Dict[str, Any]]:
+        """Ranking por puntaje ganado desde ``since`` (None: desde siempre) y rango de edad, desde score_buckets"""
+        try:
+            response = self.supabase.rpc("windowed_leaderboard", {
+                "p_since": since.isoformat() if since else None,
+                "p_age_bracket": bracket,
+                "p_limit": limit
+            }).execute()
+            return response.data or []
+        except Exception as e:
+            logger.error("Error en get_windowed_leaderboard: %s", e)
             return []
+
+    def add_score_bucket(self, user_id: str, age: Optional[int], score: int):
+        """Suma un juego al score_buckets del día (lo hace submit_game_session cuando existe la función)"""
+        key = {
+            "period": "day",
+            "period_start": datetime.utcnow().date().isoformat(),
+            "age_bracket": age_bracket(age),
+            "user_id": user_id
+        }
+        try:
+            query = self.supabase.table("score_buckets").select("score, games")
+            for column, value in key.items():
+                query = query.eq(column, value)
+            current = (query.execute().data or [{}])[0]
+            self.supabase.table("score_buckets").upsert({
+                **key,
+                "score": current.get('score', 0) + score,
+                "games": current.get('games', 0) + 1
+            }, on_conflict="period,period_start,age_bracket,user_id").execute()
+        except Exception as e:
+            logger.error("Error en add_score_bucket: %s", e)
+
+    def compact_score_buckets(self, keep_days: int = 62) -> int:
+        """Junta en filas mensuales los días de meses viejos; devuelve cuántas filas diarias se movieron"""
+        response = self.supabase.rpc("compact_score_buckets", {"p_keep_days": keep_days}).execute()
+        return response.data or 0
+
+    def get_user_rank(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Puesto del usuario contando en la base a quienes tienen más puntos (sin ranking en memoria)"""
+        user = self.get_user(user_id)
+        if not user:
+            return None
+        try:
+            ahead = self.supabase.table("users").select("id", count="exact")\
+                .gt("total_score", user['total_score']).limit(1).execute()
+            total = self.supabase.table("users").select("id", count="exact").limit(1).execute()
+        except Exception as e:
+            logger.error("Error en get_user_rank: %s", e)
+            raise e
+        public = {key: user.get(key) for key in ("id", "username", "avatar", "total_score", "level")}
+        return {"user": {**public, "rank": (ahead.count or 0) + 1}, "total_users": total.count or 0}
+
+    def get_user_scores(self, limit: int = 100000, page_size: int = 1000) -> List[Dict[str, Any]]:
+        """Campos públicos y puntaje de todos los usuarios (hasta ``limit``), para cargar el ranking.
+
+        Se pide por páginas porque PostgREST corta cada respuesta en 1000 filas.
+        """
+        rows: List[Dict[str, Any]] = []
+        while len(rows) < limit:
+            start = len(rows)
+            end = min(start + page_size, limit) - 1
+            response = self.supabase.table("users")\
+                .select("id, username, avatar, total_score, level")\
+                .order("total_score", desc=True)\
+                .order("id")\
+                .range(start, end)\
+                .execute()
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < end - start + 1:
+                break
+        return rows
     
     def get_user_achievements(self, user_id: str) -> List[Dict[str, Any]]:
         """Obtiene los logros del usuario"""
@@ -271,12 +685,12 @@ class SupabaseService:
                 .execute()
             return response.data if response.data else []
         except Exception as e:
-            print(f"❌ Error en get_user_achievements: {str(e)}")
+            logger.error("Error en get_user_achievements: %s", e)
             return []
     
     def add_achievement(self, user_id: str, achievement_type: str, 
                        title: str, description: str) -> Dict[str, Any]:
-        """Agrega un logro al usuario"""
+        """Agrega un logro al usuario (dentro de una petición se inserta al final, junto con los demás)"""
         try:
             data = {
                 "user_id": user_id,
@@ -286,10 +700,15 @@ class SupabaseService:
                 "earned_at": datetime.utcnow().isoformat()
             }
             
+            uow = current_unit_of_work()
+            if uow is not None:
+                uow.defer_insert("achievements", data)
+                return data
+            
             response = self.supabase.table("achievements").insert(data).execute()
             return response.data[0] if response.data else None
         except Exception as e:
-            print(f"❌ Error en add_achievement: {str(e)}")
+            logger.error("Error en add_achievement: %s", e)
             return None
 
     def update_user_statistics(self, user_id: str, game_type: str, 
@@ -297,11 +716,10 @@ class SupabaseService:
                               topic: str) -> Optional[Dict[str, Any]]:
         """Actualiza las estadísticas del usuario después de un juego"""
         try:
-            # Obtener estadísticas actuales
-            stats = self.get_user_statistics(user_id)
+            # Obtener estadísticas actuales (si no existían, get_user_statistics las crea)
+            stats = self.get_user_statistics(user_id, include_pending=False)
             if not stats:
-                # Si no existen, se crearon en get_user_statistics
-                stats = self.get_user_statistics(user_id)
+                return None
             
             # Incrementar juegos jugados
             new_games_played = stats['games_played'] + 1
@@ -335,13 +753,12 @@ class SupabaseService:
                 .execute()
             
             if response.data:
-                print(f" Estadísticas actualizadas para {user_id}")
-                print(f"   Juegos jugados: {new_games_played}")
-                print(f"   Temas completados: {new_topics_completed}")
+                self._remember("user_statistics", user_id, response.data[0])
+                logger.debug("Estadísticas actualizadas", extra={
+                    "user_id": user_id, "games_played": new_games_played, "topics_completed": new_topics_completed
+                })
                 return response.data[0]
             return None
-        except Exception as e:
-            print(f"❌ Error en update_user_statistics: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Error en update_user_statistics")
             return None
\ No newline at end of file
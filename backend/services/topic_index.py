@@ -0,0 +1,262 @@
+import logging
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SPANISH_STOPWORDS = frozenset("""
+a acerca al algo algun alguna algunas alguno algunos ante cada como con contra cual cuales de del desde
+donde e el ella ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos hacia hasta
+la las le les lo los mas me mi mis muy mucho muchos nos o otra otras otro otros para pero poco por que
+se segun ser si sin sobre su sus tambien te tu tus u un una unas uno unos y ya
+""".split())
+
+
+def fold_topic(topic: str) -> str:
+    """Minúsculas, sin tildes, sin signos, espacios normalizados y sin palabras vacías.
+
+    "  La Fotosíntesis de las plantas " -> "fotosintesis plantas". Si el tema
+    solo tiene palabras vacías se conservan.
+    """
+    text = unicodedata.normalize("NFKD", topic or "").encode("ascii", "ignore").decode("ascii")
+    words = re.sub(r"[^a-z0-9]+", " ", text.lower()).split()
+    content_words = [w for w in words if w not in SPANISH_STOPWORDS]
+    return " ".join(content_words or words)
+
+
+def trigrams(folded: str) -> Set[str]:
+    """Trigramas de caracteres de cada palabra, con relleno para que cuenten los bordes"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def clean_display(topic: str) -> str:
+    """Forma para mostrar: sin espacios sobrantes, conserva tildes y mayúsculas"""
+    return " ".join((topic or "").split())
+
+
+class TopicIndex:
+    """Índice de temas canónicos para unir variantes de un mismo tema.
+
+    "Fotosíntesis", "fotosintesis", "la fotosintesis " y "fotosintesys"
+    terminan en el mismo tema canónico, así comparten caché, pool y banco de
+    preguntas. Primero se busca la forma plegada exacta; si no está, se
+    buscan temas parecidos por trigramas de caracteres (coeficiente de Dice)
+    usando un índice invertido. Solo se revisan los trigramas menos
+    frecuentes del tema (filtro por prefijo), así la búsqueda sigue en
+    microsegundos con decenas de miles de temas. El primer texto que llega
+    de un tema es su forma canónica.
+
+    Un tema más específico ("animales de la selva") es otro tema: solo se une
+    a uno más general ("animales") con ``containment_merge``.
+    """
+
+    def __init__(self, threshold: float = 0.75, containment: float = 0.9,
+                 min_length_ratio: float = 0.5, max_topics: int = 50000,
+                 containment_merge: bool = False):
+        self.threshold = threshold
+        # Un tema que contiene casi todo otro más corto ("fotosintesis plantas" ⊃ "fotosintesis")
+        self.containment_merge = containment_merge
+        self.containment = containment
+        self.min_length_ratio = min_length_ratio
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self._canonical: List[str] = []                 # id -> forma canónica para mostrar
+        self._folded: List[str] = []                    # id -> forma plegada canónica
+        self._grams: List[Set[str]] = []                # id -> trigramas
+        self._postings: Dict[str, List[int]] = {}       # trigrama -> ids
+        self._aliases: Dict[str, int] = {}              # forma plegada (canónica o variante) -> id
+        self._variants: Dict[int, Counter] = {}         # id -> variante plegada -> veces vista
+        self.lookups = 0
+        self.exact_hits = 0
+        self.fuzzy_merges = 0
+        self.new_topics = 0
+
+    @classmethod
+    def from_config(cls) -> "TopicIndex":
+        return cls(
+            threshold=Config.TOPIC_SIMILARITY_THRESHOLD,
+            max_topics=Config.TOPIC_INDEX_MAX_TOPICS,
+            containment_merge=Config.TOPIC_CONTAINMENT_MERGE
+        )
+
+    def canonicalize(self, topic: str) -> str:
+        """Tema canónico para ``topic``; si es nuevo queda registrado como canónico"""
+        display = clean_display(topic)
+        folded = fold_topic(display)
+        if not folded:
+            return display
+
+        with self._lock:
+            self.lookups += 1
+            topic_id = self._aliases.get(folded)
+            if topic_id is not None:
+                self.exact_hits += 1
+                self._variants[topic_id][folded] += 1
+                return self._canonical[topic_id]
+
+            grams = trigrams(folded)
+            topic_id = self._best_match(folded, grams)
+            if topic_id is not None:
+                self.fuzzy_merges += 1
+                self._aliases[folded] = topic_id
+                self._variants[topic_id][folded] += 1
+                return self._canonical[topic_id]
+
+            if len(self._canonical) >= self.max_topics:
+                return display
+            self.new_topics += 1
+            self._add(display, folded, grams)
+            return display
+
+    def seed(self, topics: Iterable[str]) -> int:
+        """Registra temas conocidos (por ejemplo de sesiones anteriores); devuelve cuántos hay"""
+        for topic in topics:
+            if topic:
+                self.canonicalize(topic)
+        with self._lock:
+            return len(self._canonical)
+
+    def seed_from_sessions(self, db, limit: int = 1000) -> int:
+        """Registra los temas de las sesiones recientes (la variante más antigua queda como canónica)"""
+        try:
+            sessions = db.get_recent_session_keys(limit=limit)
+        except Exception as e:
+            logger.warning("No se pudieron cargar temas de las sesiones: %s", e)
+            return 0
+        count = self.seed(s.get("topic") for s in reversed(sessions))
+        logger.info("Índice de temas cargado: %s temas", count)
+        return count
+
+    def match(self, topic: str) -> Optional[Tuple[str, float]]:
+        """Tema canónico más parecido y su similitud, sin registrar nada (None si no hay)"""
+        folded = fold_topic(topic)
+        if not folded:
+            return None
+        with self._lock:
+            topic_id = self._aliases.get(folded)
+            if topic_id is not None:
+                return self._canonical[topic_id], 1.0
+            grams = trigrams(folded)
+            topic_id = self._best_match(folded, grams)
+            if topic_id is None:
+                return None
+            return self._canonical[topic_id], round(self._dice(grams, self._grams[topic_id]), 4)
+
+    def clusters(self, min_size: int = 2, limit: int = 100) -> List[Dict[str, Any]]:
+        """Temas canónicos con las variantes que se unieron a ellos (las más grandes primero)"""
+        with self._lock:
+            groups = [
+                (topic_id, variants) for topic_id, variants in self._variants.items()
+                if len(variants) >= min_size
+            ]
+            groups.sort(key=lambda pair: (-len(pair[1]), -sum(pair[1].values())))
+            return [
+                {
+                    "canonical": self._canonical[topic_id],
+                    "requests": sum(variants.values()),
+                    "variants": [
+                        {"folded": folded, "requests": count} for folded, count in variants.most_common()
+                    ]
+                }
+                for topic_id, variants in groups[:limit]
+            ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "topics": len(self._canonical),
+                "aliases": len(self._aliases),
+                "trigrams": len(self._postings),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "fuzzy_merges": self.fuzzy_merges,
+                "new_topics": self.new_topics,
+                "merge_rate": round((self.lookups - self.new_topics) / self.lookups, 4) if self.lookups else 0.0,
+                "threshold": self.threshold,
+                "containment_merge": self.containment_merge
+            }
+
+    # ========== INTERNOS ==========
+
+    def _add(self, display: str, folded: str, grams: Set[str]):
+        # Debe llamarse con el lock tomado
+        topic_id = len(self._canonical)
+        self._canonical.append(display)
+        self._folded.append(folded)
+        self._grams.append(grams)
+        for gram in grams:
+            self._postings.setdefault(gram, []).append(topic_id)
+        self._aliases[folded] = topic_id
+        self._variants[topic_id] = Counter({folded: 1})
+
+    def _best_match(self, folded: str, grams: Set[str]) -> Optional[int]:
+        """Id del tema más parecido que supera algún criterio de similitud"""
+        # Debe llamarse con el lock tomado
+        size = len(grams)
+        if not size:
+            return None
+        # Mínimo de trigramas en común para cumplir algún criterio:
+        # Dice >= t exige compartir t/(2-t) de los propios; la contención, containment * ratio
+        min_ratio = self.threshold / (2 - self.threshold)
+        if self.containment_merge:
+            min_ratio = min(min_ratio, self.containment * self.min_length_ratio)
+        min_shared = max(1, math.ceil(size * min_ratio))
+        # Filtro por prefijo: quien comparte min_shared tiene al menos uno de los size-min_shared+1 más raros
+        probe = sorted(grams, key=lambda g: len(self._postings.get(g, ())))[:size - min_shared + 1]
+        candidates = set()
+        for gram in probe:
+            candidates.update(self._postings.get(gram, ()))
+
+        best_id, best_score = None, 0.0
+        for topic_id in candidates:
+            other = self._grams[topic_id]
+            shared = len(grams & other)
+            dice = 2 * shared / (size + len(other))
+            score = dice
+            if dice < self.threshold:
+                if not self.containment_merge or len(other) >= size or len(other) / size < self.min_length_ratio \
+                        or shared / len(other) < self.containment:
+                    continue
+                score = shared / len(other) * self.threshold  # la contención pesa menos que un Dice alto
+            if score <= best_score or not self._words_covered(self._folded[topic_id], folded):
+                continue
+            # Sin containment_merge las palabras deben corresponder en los dos sentidos:
+            # "animales selva" llega a Dice 0.75 con "animales" y aun así es otro tema
+            if not self.containment_merge and not self._words_covered(folded, self._folded[topic_id]):
+                continue
+            best_id, best_score = topic_id, score
+        return best_id
+
+    def _words_covered(self, general: str, specific: str) -> bool:
+        """Cada palabra del tema general aparece (con tolerancia a errores) en el específico"""
+        specific_words = [trigrams(word) for word in specific.split()]
+        return all(
+            any(self._dice(trigrams(word), other) >= self.threshold for other in specific_words)
+            for word in general.split()
+        )
+
+    @staticmethod
+    def _dice(a: Set[str], b: Set[str]) -> float:
+        return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+_shared_index: Optional[TopicIndex] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_topic_index() -> TopicIndex:
+    """Índice compartido por todas las rutas del proceso"""
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = TopicIndex.from_config()
+        return _shared_index
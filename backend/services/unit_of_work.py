@@ -0,0 +1,113 @@
+import contextvars
+import copy
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_current: contextvars.ContextVar = contextvars.ContextVar("unit_of_work", default=None)
+
+
+class UnitOfWork:
+    """Lecturas y escrituras a Supabase de una petición.
+
+    - Mapa de identidad: una fila leída (o escrita) en la petición se sirve
+      desde memoria si se vuelve a pedir.
+    - Inserciones diferidas: las filas que nadie lee en la misma petición
+      (logros, por ejemplo) se juntan y se insertan al final, una llamada
+      por tabla.
+    - Cuenta las llamadas HTTP a Supabase hechas durante la petición.
+    """
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.pending: Dict[str, List[Dict[str, Any]]] = {}
+        self.db_calls = 0
+        self.cache_hits = 0
+        self.closed = False
+
+    def get(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self.rows.get((table, key))
+        if row is None:
+            return None
+        self.cache_hits += 1
+        return copy.deepcopy(row)
+
+    def put(self, table: str, key: str, row: Optional[Dict[str, Any]]):
+        if row is not None:
+            self.rows[(table, key)] = copy.deepcopy(row)
+
+    def forget(self, table: str, key: str):
+        self.rows.pop((table, key), None)
+
+    def defer_insert(self, table: str, row: Dict[str, Any]):
+        self.pending.setdefault(table, []).append(row)
+
+    def take_pending(self) -> Dict[str, List[Dict[str, Any]]]:
+        pending, self.pending = self.pending, {}
+        return pending
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    """Unidad de trabajo de la petición en curso (None fuera de una petición o ya cerrada)"""
+    uow = _current.get()
+    return uow if uow is not None and not uow.closed else None
+
+
+def begin_unit_of_work(name: Optional[str] = None) -> UnitOfWork:
+    uow = UnitOfWork(name)
+    _current.set(uow)
+    return uow
+
+
+def end_unit_of_work(flush: Optional[Callable[[UnitOfWork], None]] = None) -> Optional[UnitOfWork]:
+    """Escribe lo pendiente y cierra la unidad de trabajo actual; se puede llamar más de una vez"""
+    uow = current_unit_of_work()
+    if uow is None:
+        return None
+    try:
+        if flush is not None and uow.pending:
+            flush(uow)
+    finally:
+        uow.closed = True
+        _current.set(None)
+        db_call_stats.record(uow)
+    return uow
+
+
+def record_db_call(*_):
+    """Hook de httpx: cuenta una llamada a Supabase en la petición actual"""
+    uow = current_unit_of_work()
+    if uow is not None:
+        uow.db_calls += 1
+
+
+class DbCallStats:
+    """Llamadas a Supabase por endpoint, para notar cuando una ruta empieza a hacer más"""
+
+    def __init__(self, max_endpoints: int = 200):
+        self.max_endpoints = max_endpoints
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, int]] = {}
+
+    def record(self, uow: UnitOfWork):
+        name = uow.name or "?"
+        with self._lock:
+            entry = self._endpoints.get(name)
+            if entry is None:
+                if len(self._endpoints) >= self.max_endpoints:
+                    return
+                entry = self._endpoints[name] = {"requests": 0, "db_calls": 0, "cache_hits": 0, "max_db_calls": 0}
+            entry["requests"] += 1
+            entry["db_calls"] += uow.db_calls
+            entry["cache_hits"] += uow.cache_hits
+            entry["max_db_calls"] = max(entry["max_db_calls"], uow.db_calls)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {**entry, "avg_db_calls": round(entry["db_calls"] / entry["requests"], 2)}
+                for name, entry in sorted(self._endpoints.items())
+            }
+
+
+db_call_stats = DbCallStats()
@@ -0,0 +1,310 @@
+import contextlib
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from config import Config
+from services.supabase_service import ACHIEVEMENT_RULES
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, un solo journal
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+GAME_TYPE_COUNTERS = ("trivia", "adventure", "market")
+
+
+class StatsWriteBehind:
+    """Escritura diferida del puntaje, las estadísticas y los logros de los juegos completados.
+
+    ``submit_game_session`` marca la sesión como completada (eso sigue siendo
+    síncrono: evita enviar dos veces el mismo juego) y anota un evento con lo
+    que suma el juego. Un hilo junta los eventos pendientes cada
+    ``flush_interval`` segundos y los aplica con una sola llamada a la función
+    apply_stat_events de schema.sql, que los suma por usuario y registra su
+    event_id: aplicar dos veces el mismo evento no suma dos veces.
+
+    Cada evento se escribe primero en un journal append-only del worker
+    (``<journal_dir>/stats-<pid>.jsonl``) y se marca como aplicado en el mismo
+    archivo. Al arrancar, un worker adopta los journals de workers que ya no
+    existen (nadie tiene tomado su lock) y reenvía lo que quedó sin aplicar.
+
+    Mientras un evento está pendiente, SupabaseService lo suma a lo que lee de
+    users y user_statistics (``pending_for``), así el usuario ve sus totales al día.
+    """
+
+    def __init__(self, db, journal_dir: str = "write_behind", flush_interval: float = 0.25,
+                 max_batch: int = 500, fsync: bool = True, journal_max_bytes: int = 1024 * 1024):
+        self.db = db
+        self.journal_dir = journal_dir
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.journal_max_bytes = journal_max_bytes
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}      # event_id -> evento, en orden de llegada
+        self._by_user: Dict[str, Dict[str, int]] = {}      # user_id -> suma de sus eventos pendientes
+        self._journal = None
+        self._lock_file = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.enqueued = 0
+        self.applied = 0
+        self.recovered = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ms: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, db) -> "StatsWriteBehind":
+        return cls(
+            db,
+            journal_dir=Config.WRITE_BEHIND_JOURNAL_DIR,
+            flush_interval=Config.WRITE_BEHIND_FLUSH_MS / 1000,
+            max_batch=Config.WRITE_BEHIND_MAX_BATCH,
+            fsync=Config.WRITE_BEHIND_FSYNC,
+            journal_max_bytes=Config.WRITE_BEHIND_JOURNAL_MAX_BYTES
+        )
+
+    # ========== CICLO DE VIDA ==========
+
+    def start(self):
+        """Abre el journal del worker, adopta los huérfanos y lanza el hilo que aplica los eventos"""
+        if self._thread is not None:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        name = f"stats-{os.getpid()}" if fcntl else "stats"
+        self._journal_path = os.path.join(self.journal_dir, f"{name}.jsonl")
+        self._lock_file = self._try_lock(os.path.join(self.journal_dir, f"{name}.lock"))
+        if self._lock_file is None:
+            raise RuntimeError(f"Otro proceso tiene tomado el journal {self._journal_path}")
+
+        # Lo que quedó en nuestro propio archivo (pid reutilizado) y en los de workers muertos
+        events = self._read_journal(self._journal_path)
+        orphans = self._claim_orphans() if fcntl else []
+        for _, _, orphan_events in orphans:
+            events.extend(orphan_events)
+        self._rewrite_journal(events)
+        for lock_file, path, _ in orphans:
+            for leftover in (path, path + ".tmp", lock_file.name):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(leftover)
+            lock_file.close()
+        with self._lock:
+            for event in events:
+                self._add_pending(event)
+        self.recovered = len(events)
+        if events:
+            logger.info("Escritura diferida: %s eventos recuperados del journal", len(events))
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Detiene el hilo e intenta aplicar lo pendiente (lo que no se aplique queda en el journal)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            if not self.flush():
+                break
+
+    # ========== ESCRITURA ==========
+
+    def submit_game_session(self, session: Dict[str, Any], score: int, coins: int, answers: List[Dict],
+                            intelligence_scores: Dict[str, int]) -> Dict[str, Any]:
+        """Igual que SupabaseService.submit_game_session, pero el puntaje y las estadísticas se aplican después.
+
+        Los logros de la respuesta se calculan con las estadísticas que ve este
+        worker; los que se guardan los decide apply_stat_events.
+        """
+        if self.db.complete_game_session(session['id'], score, answers) is None:
+            return {"status": "already_completed"}
+        user_id = session['user_id']
+        stats = self.db.get_user_statistics(user_id) or {}
+        games_played = stats.get('games_played', 0) + 1
+        self.enqueue({
+            "event_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "session_id": session['id'],
+            "day": datetime.utcnow().date().isoformat(),
+            "score": score,
+            "coins": coins,
+            "game_type": session['game_type'],
+            "intelligence": {k: v for k, v in intelligence_scores.items() if v}
+        })
+        return {
+            "status": "completed",
+            "queued": True,
+            "achievements": [
+                {"achievement_type": achievement_type, "title": title, "description": description}
+                for achievement_type, title, description, earned in ACHIEVEMENT_RULES
+                if earned(games_played, score)
+            ]
+        }
+
+    def enqueue(self, event: Dict[str, Any]):
+        """Anota el evento en el journal (durable al volver) y lo deja pendiente"""
+        line = json.dumps({"event": event}, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._write(line)
+            self._add_pending(event)
+            self.enqueued += 1
+
+    def flush(self) -> bool:
+        """Aplica hasta ``max_batch`` eventos pendientes; devuelve False si la base falló"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending.values())[:self.max_batch]
+            if not batch:
+                return True
+            start = time.perf_counter()
+            try:
+                result = self.db.apply_stat_events(batch) or {}
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.warning("No se pudieron aplicar %s eventos de estadísticas: %s", len(batch), e)
+                return False
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+
+            event_ids = [event['event_id'] for event in batch]
+            with self._lock:
+                self._write(json.dumps({"ack": event_ids}, separators=(",", ":")) + "\n")
+                for event_id in event_ids:
+                    self._remove_pending(event_id)
+                self.applied += len(event_ids)
+                if self._journal.tell() > self.journal_max_bytes:
+                    self._rewrite_journal(list(self._pending.values()))
+            for user in result.get('users') or []:
+                self.db.notify_user_changed(user)
+            return True
+
+    # ========== LECTURA ==========
+
+    def pending_for(self, user_id: str) -> Optional[Dict[str, int]]:
+        """Suma de los eventos todavía no aplicados del usuario (None si no tiene)"""
+        with self._lock:
+            delta = self._by_user.get(user_id)
+            return dict(delta) if delta else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "pending_users": len(self._by_user),
+                "enqueued": self.enqueued,
+                "applied": self.applied,
+                "recovered": self.recovered,
+                "failures": self.failures,
+                "last_error": self.last_error,
+                "last_flush_ms": self.last_flush_ms,
+                "journal": getattr(self, "_journal_path", None),
+                "journal_bytes": self._journal.tell() if self._journal else 0
+            }
+
+    # ========== INTERNOS ==========
+
+    def _run(self):
+        failures = 0
+        while not self._stop.wait(self.flush_interval * (2 ** min(failures, 6))):
+            failures = 0 if self.flush() else failures + 1
+
+    def _add_pending(self, event: Dict[str, Any]):
+        # Debe llamarse con el lock tomado
+        self._pending[event['event_id']] = event
+        delta = self._by_user.setdefault(event['user_id'], {})
+        for key, value in self._event_delta(event).items():
+            delta[key] = delta.get(key, 0) + value
+
+    def _remove_pending(self, event_id: str):
+        # Debe llamarse con el lock tomado
+        event = self._pending.pop(event_id, None)
+        if event is None:
+            return
+        delta = self._by_user.get(event['user_id'], {})
+        for key, value in self._event_delta(event).items():
+            delta[key] = delta.get(key, 0) - value
+        if delta.get('games', 0) <= 0:
+            self._by_user.pop(event['user_id'], None)
+
+    @staticmethod
+    def _event_delta(event: Dict[str, Any]) -> Dict[str, int]:
+        delta = {"score": event['score'], "coins": event['coins'], "games": 1}
+        if event['game_type'] in GAME_TYPE_COUNTERS:
+            delta[f"{event['game_type']}_count"] = 1
+        for intelligence, points in (event.get('intelligence') or {}).items():
+            delta[f"{intelligence}_score"] = points
+        return delta
+
+    def _write(self, line: str):
+        self._journal.write(line)
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _rewrite_journal(self, events: List[Dict[str, Any]]):
+        """Reemplaza el journal por uno con solo los eventos pendientes (archivo nuevo + rename)"""
+        tmp = self._journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps({"event": event}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._journal_path)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self._journal_path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _read_journal(path: str) -> List[Dict[str, Any]]:
+        """Eventos del journal que no tienen su marca de aplicado"""
+        events: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # última línea a medio escribir
+                    if "event" in entry:
+                        events[entry["event"]["event_id"]] = entry["event"]
+                    for event_id in entry.get("ack", []):
+                        events.pop(event_id, None)
+        except FileNotFoundError:
+            pass
+        return list(events.values())
+
+    def _claim_orphans(self):
+        """Journals de otros workers cuyo lock está libre: (lock tomado, ruta, eventos pendientes)"""
+        orphans = []
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, "stats-*.jsonl"))):
+            if path == self._journal_path:
+                continue
+            lock_file = self._try_lock(path[:-len(".jsonl")] + ".lock")
+            if lock_file is None:
+                continue  # el worker dueño sigue vivo
+            orphans.append((lock_file, path, self._read_journal(path)))
+        return orphans
+
+    @staticmethod
+    def _try_lock(path: str):
+        lock_file = open(path, "a")
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except OSError:
+            lock_file.close()
+            return None
@@ -21,6 +21,17 @@ CREATE INDEX idx_users_total_score ON users(total_score DESC);
 CREATE INDEX idx_users_age ON users(age);
 CREATE INDEX idx_users_total_coins ON users(total_coins DESC);
 
+-- ==================== TABLA: game_contents ====================
+-- Contenido de juego guardado una sola vez: content_id es el sha256 de su JSON
+-- canónico (llaves ordenadas, sin espacios) y payload ese JSON comprimido con
+-- zlib y en base64 (services/game_contents.py). Muchas sesiones comparten el
+-- mismo contenido (caché, pool, banco de preguntas); cada una guarda solo content_id.
+CREATE TABLE IF NOT EXISTS game_contents (
+    content_id VARCHAR(64) PRIMARY KEY,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ==================== TABLA: game_sessions ====================
 CREATE TABLE IF NOT EXISTS game_sessions (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
@@ -34,14 +45,20 @@ CREATE TABLE IF NOT EXISTS game_sessions (
     score INTEGER DEFAULT 0,
     answers JSONB DEFAULT '[]'::jsonb,
     completed BOOLEAN DEFAULT FALSE,
+    feedback TEXT,
+    feedback_status VARCHAR(20),
     started_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-    completed_at TIMESTAMP WITH TIME ZONE
+    completed_at TIMESTAMP WITH TIME ZONE,
+    -- content queda NULL cuando el contenido está en game_contents
+    content_id VARCHAR(64) REFERENCES game_contents(content_id)
 );
 
 -- Índices para game_sessions
 CREATE INDEX idx_game_sessions_user_id ON game_sessions(user_id);
 CREATE INDEX idx_game_sessions_completed ON game_sessions(completed);
 CREATE INDEX idx_game_sessions_started_at ON game_sessions(started_at DESC);
+-- Historial de un usuario paginado por (started_at, id)
+CREATE INDEX idx_game_sessions_user_started ON game_sessions(user_id, started_at DESC, id DESC);
 
 -- ==================== TABLA: game_results ====================
 CREATE TABLE IF NOT EXISTS game_results (
@@ -79,6 +96,9 @@ CREATE TABLE IF NOT EXISTS user_statistics (
     spatial_score INTEGER DEFAULT 0,
     naturalistic_score INTEGER DEFAULT 0,
     interpersonal_score INTEGER DEFAULT 0,
+    intrapersonal_score INTEGER DEFAULT 0,
+    musical_score INTEGER DEFAULT 0,
+    bodily_kinesthetic_score INTEGER DEFAULT 0,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -99,6 +119,355 @@ CREATE TABLE IF NOT EXISTS achievements (
 CREATE INDEX idx_achievements_user_id ON achievements(user_id);
 CREATE INDEX idx_achievements_earned_at ON achievements(earned_at DESC);
 
+-- ==================== TABLA: content_cache ====================
+-- Capa persistente opcional de la caché de contenido (CONTENT_CACHE_BACKEND=supabase)
+CREATE TABLE IF NOT EXISTS content_cache (
+    cache_key VARCHAR(400) PRIMARY KEY,
+    payload TEXT NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX idx_content_cache_expires_at ON content_cache(expires_at);
+
+-- ==================== TABLA: question_bank ====================
+-- Preguntas de trivia y misiones del mercadito reutilizables (QUESTION_BANK_BACKEND=supabase)
+CREATE TABLE IF NOT EXISTS question_bank (
+    item_id VARCHAR(40) PRIMARY KEY,
+    game_type VARCHAR(20) NOT NULL CHECK (game_type IN ('trivia', 'market')),
+    topic VARCHAR(255) NOT NULL,
+    difficulty VARCHAR(20) NOT NULL,
+    age_range VARCHAR(10) NOT NULL,
+    intelligence_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    times_served INTEGER DEFAULT 0,
+    times_answered INTEGER DEFAULT 0,
+    times_correct INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_question_bank_lookup ON question_bank(game_type, topic, difficulty, age_range);
+CREATE INDEX idx_question_bank_created_at ON question_bank(created_at DESC);
+
+-- Suma uso y aciertos de varios elementos en una sola llamada
+-- p_usage: [{"item_id": "...", "served": 1, "answered": 0, "correct": 0}, ...]
+CREATE OR REPLACE FUNCTION record_question_usage(p_usage JSONB)
+RETURNS VOID AS $$
+    UPDATE question_bank q SET
+        times_served = q.times_served + u.served,
+        times_answered = q.times_answered + u.answered,
+        times_correct = q.times_correct + u.correct
+    FROM (
+        SELECT e->>'item_id' AS item_id,
+               SUM((e->>'served')::INTEGER) AS served,
+               SUM((e->>'answered')::INTEGER) AS answered,
+               SUM((e->>'correct')::INTEGER) AS correct
+        FROM jsonb_array_elements(p_usage) AS e
+        GROUP BY e->>'item_id'
+    ) u
+    WHERE q.item_id = u.item_id;
+$$ LANGUAGE sql;
+
+-- ==================== TABLA: score_buckets ====================
+-- Puntaje de los juegos completados sumado por usuario, día y rango de edad
+-- (la edad del usuario cuando jugó). Los rankings semanales, mensuales y por
+-- edad suman unas pocas filas por usuario en lugar de recorrer game_sessions.
+-- compact_score_buckets junta los días de meses viejos en una fila por mes.
+CREATE TABLE IF NOT EXISTS score_buckets (
+    period VARCHAR(5) NOT NULL CHECK (period IN ('day', 'month')),
+    period_start DATE NOT NULL,
+    age_bracket VARCHAR(10) NOT NULL,
+    user_id UUID REFERENCES users(id) ON DELETE CASCADE,
+    score INTEGER NOT NULL DEFAULT 0,
+    games INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, period_start, age_bracket, user_id)
+);
+
+CREATE INDEX idx_score_buckets_window ON score_buckets(age_bracket, period_start);
+CREATE INDEX idx_score_buckets_period_start ON score_buckets(period_start);
+
+-- Mismos rangos que AGE_BRACKETS en backend/services/leaderboard.py
+CREATE OR REPLACE FUNCTION score_age_bracket(p_age INTEGER)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN p_age BETWEEN 5 AND 7 THEN '5-7'
+        WHEN p_age BETWEEN 8 AND 10 THEN '8-10'
+        WHEN p_age BETWEEN 11 AND 13 THEN '11-13'
+        WHEN p_age BETWEEN 14 AND 18 THEN '14-18'
+        ELSE 'unknown'
+    END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Ranking desde p_since (NULL: desde siempre), opcionalmente de un solo rango de edad
+CREATE OR REPLACE FUNCTION windowed_leaderboard(p_since DATE, p_age_bracket TEXT, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (id UUID, username TEXT, avatar TEXT, level INTEGER, score BIGINT, games BIGINT) AS $$
+    SELECT u.id, u.username::TEXT, u.avatar::TEXT, u.level, b.score, b.games
+    FROM (
+        SELECT user_id, SUM(score) AS score, SUM(games) AS games
+        FROM score_buckets
+        WHERE (p_since IS NULL OR period_start >= p_since)
+          AND (p_age_bracket IS NULL OR age_bracket = p_age_bracket)
+        GROUP BY user_id
+    ) b
+    JOIN users u ON u.id = b.user_id
+    ORDER BY b.score DESC, u.id
+    LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+-- Junta en una fila por mes los días de los meses que terminaron hace más de
+-- p_keep_days días (así las ventanas semanal y mensual siempre ven días).
+-- Devuelve cuántas filas diarias se compactaron.
+CREATE OR REPLACE FUNCTION compact_score_buckets(p_keep_days INTEGER DEFAULT 62)
+RETURNS INTEGER AS $$
+DECLARE
+    v_cutoff DATE := date_trunc('month', CURRENT_DATE - GREATEST(p_keep_days, 35))::DATE;
+    v_rows INTEGER;
+BEGIN
+    WITH moved AS (
+        DELETE FROM score_buckets
+        WHERE period = 'day' AND period_start < v_cutoff
+        RETURNING *
+    ), merged AS (
+        INSERT INTO score_buckets (period, period_start, age_bracket, user_id, score, games)
+        SELECT 'month', date_trunc('month', period_start)::DATE, age_bracket, user_id, SUM(score), SUM(games)
+        FROM moved
+        GROUP BY 2, 3, 4
+        ON CONFLICT (period, period_start, age_bracket, user_id) DO UPDATE SET
+            score = score_buckets.score + EXCLUDED.score,
+            games = score_buckets.games + EXCLUDED.games
+    )
+    SELECT COUNT(*) INTO v_rows FROM moved;
+    RETURN v_rows;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==================== FUNCIÓN: submit_game_session ====================
+-- Completa una sesión en una sola llamada y en una sola transacción: marca la
+-- sesión, suma puntaje y monedas al usuario (y recalcula su nivel), suma los
+-- contadores e inteligencias en user_statistics, suma el puntaje al
+-- score_buckets del día y otorga los logros.
+-- Los incrementos se hacen en la misma sentencia UPDATE, así dos envíos
+-- simultáneos del mismo usuario no pisan sus cambios, y una sesión solo se
+-- puede completar una vez.
+-- p_intelligence: {"linguistic": 10, "logical_mathematical": 0, ...}
+-- Devuelve {"status": "completed" | "already_completed" | "not_found", ...}
+CREATE OR REPLACE FUNCTION submit_game_session(
+    p_session_id UUID,
+    p_score INTEGER,
+    p_coins INTEGER,
+    p_answers JSONB,
+    p_intelligence JSONB
+)
+RETURNS JSONB AS $$
+DECLARE
+    v_session game_sessions%ROWTYPE;
+    v_user users%ROWTYPE;
+    v_stats user_statistics%ROWTYPE;
+    v_achievements JSONB;
+BEGIN
+    UPDATE game_sessions SET
+        score = p_score,
+        answers = p_answers,
+        status = 'completed',
+        completed = TRUE,
+        completed_at = NOW()
+    WHERE id = p_session_id AND completed IS NOT TRUE
+    RETURNING * INTO v_session;
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('status', CASE
+            WHEN EXISTS (SELECT 1 FROM game_sessions WHERE id = p_session_id) THEN 'already_completed'
+            ELSE 'not_found'
+        END);
+    END IF;
+
+    -- En el SET las columnas tienen su valor anterior
+    UPDATE users SET
+        total_score = total_score + p_score,
+        total_coins = total_coins + p_coins,
+        level = (total_score + p_score) / 100 + 1
+    WHERE id = v_session.user_id
+    RETURNING * INTO v_user;
+
+    INSERT INTO user_statistics (user_id) VALUES (v_session.user_id)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    UPDATE user_statistics SET
+        games_played = games_played + 1,
+        topics_completed = topics_completed + 1,
+        trivia_count = trivia_count + (v_session.game_type = 'trivia')::INTEGER,
+        adventure_count = adventure_count + (v_session.game_type = 'adventure')::INTEGER,
+        market_count = market_count + (v_session.game_type = 'market')::INTEGER,
+        linguistic_score = linguistic_score + COALESCE((p_intelligence->>'linguistic')::INTEGER, 0),
+        logical_mathematical_score = logical_mathematical_score + COALESCE((p_intelligence->>'logical_mathematical')::INTEGER, 0),
+        spatial_score = spatial_score + COALESCE((p_intelligence->>'spatial')::INTEGER, 0),
+        naturalistic_score = naturalistic_score + COALESCE((p_intelligence->>'naturalistic')::INTEGER, 0),
+        interpersonal_score = interpersonal_score + COALESCE((p_intelligence->>'interpersonal')::INTEGER, 0),
+        intrapersonal_score = intrapersonal_score + COALESCE((p_intelligence->>'intrapersonal')::INTEGER, 0),
+        musical_score = musical_score + COALESCE((p_intelligence->>'musical')::INTEGER, 0),
+        bodily_kinesthetic_score = bodily_kinesthetic_score + COALESCE((p_intelligence->>'bodily_kinesthetic')::INTEGER, 0),
+        updated_at = NOW()
+    WHERE user_id = v_session.user_id
+    RETURNING * INTO v_stats;
+
+    INSERT INTO score_buckets (period, period_start, age_bracket, user_id, score, games)
+    VALUES ('day', CURRENT_DATE, score_age_bracket(v_user.age), v_session.user_id, p_score, 1)
+    ON CONFLICT (period, period_start, age_bracket, user_id) DO UPDATE SET
+        score = score_buckets.score + EXCLUDED.score,
+        games = score_buckets.games + 1;
+
+    -- Mismas reglas que check_achievements en game_routes.py
+    WITH earned AS (
+        INSERT INTO achievements (user_id, achievement_type, title, description)
+        SELECT v_session.user_id, a.achievement_type, a.title, a.description
+        FROM (VALUES
+            ('first_game', '🎮 Primer Juego', '¡Completaste tu primer juego en YachAI!', v_stats.games_played = 1),
+            ('dedicated', '🔥 Dedicado', '¡Completaste 5 juegos!', v_stats.games_played = 5),
+            ('veteran', '⭐ Veterano', '¡Completaste 10 juegos!', v_stats.games_played = 10),
+            ('high_score', '🌟 Súper Estrella', '¡Obtuviste más de 50 puntos en un juego!', p_score >= 50)
+        ) AS a(achievement_type, title, description, is_earned)
+        WHERE a.is_earned
+        RETURNING achievement_type, title, description
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(earned)), '[]'::jsonb) INTO v_achievements FROM earned;
+
+    RETURN jsonb_build_object(
+        'status', 'completed',
+        'user', jsonb_build_object(
+            'id', v_user.id,
+            'total_score', v_user.total_score,
+            'total_coins', v_user.total_coins,
+            'level', v_user.level
+        ),
+        'statistics', to_jsonb(v_stats),
+        'achievements', v_achievements
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- ==================== ESCRITURA DIFERIDA DE ESTADÍSTICAS ====================
+-- Con WRITE_BEHIND_ENABLED, submit solo marca la sesión; el puntaje, las
+-- estadísticas, los logros y score_buckets de los juegos se aplican en lotes
+-- desde services/write_behind.py. stat_events_applied guarda los eventos ya
+-- aplicados: reenviar un lote (por ejemplo al recuperar el journal de un worker
+-- que se cayó) no suma dos veces. Las filas viejas se pueden borrar cuando no
+-- quedan journals de esas fechas:
+--   DELETE FROM stat_events_applied WHERE applied_at < NOW() - INTERVAL '30 days';
+CREATE TABLE IF NOT EXISTS stat_events_applied (
+    event_id UUID PRIMARY KEY,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_stat_events_applied_at ON stat_events_applied(applied_at);
+
+-- p_events: [{"event_id": "uuid", "user_id": "uuid", "day": "2026-10-18", "score": 40, "coins": 4,
+--             "game_type": "trivia", "intelligence": {"linguistic": 10, ...}}, ...]
+-- Suma los eventos nuevos por usuario y los aplica en una sola sentencia. Los
+-- logros por cantidad de juegos se otorgan cuando el lote cruza el umbral
+-- (mismas reglas que submit_game_session); el de puntaje, una vez por juego.
+-- Devuelve {"applied": n, "achievements": n, "users": [{id, total_score, total_coins, level}, ...]}
+CREATE OR REPLACE FUNCTION apply_stat_events(p_events JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_result JSONB;
+BEGIN
+    WITH input AS (
+        SELECT DISTINCT ON (e.event_id) e.*
+        FROM jsonb_to_recordset(p_events) AS e(
+            event_id UUID, user_id UUID, day DATE, score INTEGER, coins INTEGER, game_type TEXT, intelligence JSONB
+        )
+    ), fresh AS (
+        INSERT INTO stat_events_applied (event_id)
+        SELECT event_id FROM input
+        ON CONFLICT (event_id) DO NOTHING
+        RETURNING event_id
+    ), events AS (
+        -- Los eventos de usuarios borrados se marcan como aplicados y se descartan
+        SELECT input.*, u.age
+        FROM input
+        JOIN fresh USING (event_id)
+        JOIN users u ON u.id = input.user_id
+    ), per_user AS (
+        SELECT e.user_id,
+            SUM(e.score) AS score,
+            SUM(e.coins) AS coins,
+            COUNT(*) AS games,
+            COUNT(*) FILTER (WHERE e.game_type = 'trivia') AS trivia,
+            COUNT(*) FILTER (WHERE e.game_type = 'adventure') AS adventure,
+            COUNT(*) FILTER (WHERE e.game_type = 'market') AS market,
+            SUM(COALESCE((e.intelligence->>'linguistic')::INTEGER, 0)) AS linguistic,
+            SUM(COALESCE((e.intelligence->>'logical_mathematical')::INTEGER, 0)) AS logical_mathematical,
+            SUM(COALESCE((e.intelligence->>'spatial')::INTEGER, 0)) AS spatial,
+            SUM(COALESCE((e.intelligence->>'naturalistic')::INTEGER, 0)) AS naturalistic,
+            SUM(COALESCE((e.intelligence->>'interpersonal')::INTEGER, 0)) AS interpersonal,
+            SUM(COALESCE((e.intelligence->>'intrapersonal')::INTEGER, 0)) AS intrapersonal,
+            SUM(COALESCE((e.intelligence->>'musical')::INTEGER, 0)) AS musical,
+            SUM(COALESCE((e.intelligence->>'bodily_kinesthetic')::INTEGER, 0)) AS bodily_kinesthetic
+        FROM events e
+        GROUP BY e.user_id
+    ), updated_users AS (
+        -- En el SET las columnas tienen su valor anterior
+        UPDATE users u SET
+            total_score = u.total_score + p.score,
+            total_coins = u.total_coins + p.coins,
+            level = (u.total_score + p.score) / 100 + 1
+        FROM per_user p
+        WHERE u.id = p.user_id
+        RETURNING u.id, u.total_score, u.total_coins, u.level
+    ), stats AS (
+        INSERT INTO user_statistics (user_id, games_played, topics_completed, trivia_count, adventure_count, market_count,
+                                     linguistic_score, logical_mathematical_score, spatial_score, naturalistic_score, interpersonal_score, intrapersonal_score, musical_score, bodily_kinesthetic_score)
+        SELECT user_id, games, games, trivia, adventure, market, linguistic, logical_mathematical, spatial, naturalistic, interpersonal, intrapersonal, musical, bodily_kinesthetic
+        FROM per_user
+        ON CONFLICT (user_id) DO UPDATE SET
+            games_played = user_statistics.games_played + EXCLUDED.games_played,
+            topics_completed = user_statistics.topics_completed + EXCLUDED.topics_completed,
+            trivia_count = user_statistics.trivia_count + EXCLUDED.trivia_count,
+            adventure_count = user_statistics.adventure_count + EXCLUDED.adventure_count,
+            market_count = user_statistics.market_count + EXCLUDED.market_count,
+            linguistic_score = user_statistics.linguistic_score + EXCLUDED.linguistic_score,
+            logical_mathematical_score = user_statistics.logical_mathematical_score + EXCLUDED.logical_mathematical_score,
+            spatial_score = user_statistics.spatial_score + EXCLUDED.spatial_score,
+            naturalistic_score = user_statistics.naturalistic_score + EXCLUDED.naturalistic_score,
+            interpersonal_score = user_statistics.interpersonal_score + EXCLUDED.interpersonal_score,
+            intrapersonal_score = user_statistics.intrapersonal_score + EXCLUDED.intrapersonal_score,
+            musical_score = user_statistics.musical_score + EXCLUDED.musical_score,
+            bodily_kinesthetic_score = user_statistics.bodily_kinesthetic_score + EXCLUDED.bodily_kinesthetic_score,
+            updated_at = NOW()
+        RETURNING user_id, games_played
+    ), earned AS (
+        INSERT INTO achievements (user_id, achievement_type, title, description)
+        SELECT s.user_id, a.achievement_type, a.title, a.description
+        FROM stats s
+        JOIN per_user p USING (user_id)
+        CROSS JOIN (VALUES
+            ('first_game', '🎮 Primer Juego', '¡Completaste tu primer juego en YachAI!', 1),
+            ('dedicated', '🔥 Dedicado', '¡Completaste 5 juegos!', 5),
+            ('veteran', '⭐ Veterano', '¡Completaste 10 juegos!', 10)
+        ) AS a(achievement_type, title, description, games)
+        WHERE s.games_played - p.games < a.games AND s.games_played >= a.games
+        UNION ALL
+        SELECT e.user_id, 'high_score', '🌟 Súper Estrella', '¡Obtuviste más de 50 puntos en un juego!'
+        FROM events e
+        WHERE e.score >= 50
+        RETURNING user_id
+    ), buckets AS (
+        INSERT INTO score_buckets (period, period_start, age_bracket, user_id, score, games)
+        SELECT 'day', e.day, score_age_bracket(e.age), e.user_id, SUM(e.score), COUNT(*)
+        FROM events e
+        GROUP BY e.day, score_age_bracket(e.age), e.user_id
+        ON CONFLICT (period, period_start, age_bracket, user_id) DO UPDATE SET
+            score = score_buckets.score + EXCLUDED.score,
+            games = score_buckets.games + EXCLUDED.games
+    )
+    SELECT jsonb_build_object(
+        'applied', (SELECT COUNT(*) FROM events),
+        'achievements', (SELECT COUNT(*) FROM earned),
+        'users', COALESCE((SELECT jsonb_agg(to_jsonb(updated_users)) FROM updated_users), '[]'::jsonb)
+    ) INTO v_result;
+    RETURN v_result;
+END;
+$$ LANGUAGE plpgsql;
+
 -- ==================== POLÍTICAS DE SEGURIDAD (RLS) ====================
 -- Habilitar Row Level Security
 ALTER TABLE users ENABLE ROW LEVEL SECURITY;
@@ -106,6 +475,11 @@ ALTER TABLE game_sessions ENABLE ROW LEVEL SECURITY;
 ALTER TABLE game_results ENABLE ROW LEVEL SECURITY;
 ALTER TABLE user_statistics ENABLE ROW LEVEL SECURITY;
 ALTER TABLE achievements ENABLE ROW LEVEL SECURITY;
+ALTER TABLE content_cache ENABLE ROW LEVEL SECURITY;
+ALTER TABLE question_bank ENABLE ROW LEVEL SECURITY;
+ALTER TABLE score_buckets ENABLE ROW LEVEL SECURITY;
+ALTER TABLE game_contents ENABLE ROW LEVEL SECURITY;
+ALTER TABLE stat_events_applied ENABLE ROW LEVEL SECURITY;
 
 -- Políticas para users (lectura pública, inserción pública)
 CREATE POLICY "Users are viewable by everyone" ON users
@@ -149,4 +523,74 @@ CREATE POLICY "Achievements are viewable by everyone" ON achievements
     FOR SELECT USING (true);
 
 CREATE POLICY "Achievements can be created by anyone" ON achievements
-    FOR INSERT WITH CHECK (true);
\ No newline at end of file
+    FOR INSERT WITH CHECK (true);
+
+-- Políticas para content_cache
+CREATE POLICY "Content cache is viewable by everyone" ON content_cache
+    FOR SELECT USING (true);
+
+CREATE POLICY "Content cache can be written by anyone" ON content_cache
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- Políticas para question_bank (sin DELETE; record_question_usage necesita UPDATE)
+CREATE POLICY "Question bank is viewable by everyone" ON question_bank
+    FOR SELECT USING (true);
+
+CREATE POLICY "Question bank can be created by anyone" ON question_bank
+    FOR INSERT WITH CHECK (true);
+
+CREATE POLICY "Question bank usage can be updated by anyone" ON question_bank
+    FOR UPDATE USING (true);
+
+-- Políticas para score_buckets
+CREATE POLICY "Score buckets are viewable by everyone" ON score_buckets
+    FOR SELECT USING (true);
+
+CREATE POLICY "Score buckets can be written by anyone" ON score_buckets
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- Políticas para game_contents
+CREATE POLICY "Game contents are viewable by everyone" ON game_contents
+    FOR SELECT USING (true);
+
+CREATE POLICY "Game contents can be created by anyone" ON game_contents
+    FOR INSERT WITH CHECK (true);
+
+-- Políticas para stat_events_applied
+CREATE POLICY "Stat events can be written by anyone" ON stat_events_applied
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- ==================== MIGRACIÓN: feedback en segundo plano ====================
+-- Para bases creadas antes de agregar el feedback diferido
+ALTER TABLE game_sessions ADD COLUMN IF NOT EXISTS feedback TEXT;
+ALTER TABLE game_sessions ADD COLUMN IF NOT EXISTS feedback_status VARCHAR(20);
+
+-- ==================== MIGRACIÓN: envío de juegos en una llamada ====================
+-- Para bases creadas antes de submit_game_session (la función se crea arriba)
+ALTER TABLE user_statistics ADD COLUMN IF NOT EXISTS intrapersonal_score INTEGER DEFAULT 0;
+ALTER TABLE user_statistics ADD COLUMN IF NOT EXISTS musical_score INTEGER DEFAULT 0;
+ALTER TABLE user_statistics ADD COLUMN IF NOT EXISTS bodily_kinesthetic_score INTEGER DEFAULT 0;
+
+-- ==================== MIGRACIÓN: rankings por semana, mes y edad ====================
+-- Para bases creadas antes de score_buckets (la tabla y las funciones se crean
+-- arriba): carga los juegos ya completados; luego SELECT compact_score_buckets();
+-- junta los meses viejos. Solo corre con la tabla vacía: al volver a ejecutar
+-- este archivo no suma otra vez los días que la compactación pasó a meses.
+INSERT INTO score_buckets (period, period_start, age_bracket, user_id, score, games)
+SELECT 'day', s.completed_at::DATE, score_age_bracket(u.age), s.user_id, SUM(s.score), COUNT(*)
+FROM game_sessions s
+JOIN users u ON u.id = s.user_id
+WHERE s.completed IS TRUE AND s.completed_at IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM score_buckets)
+GROUP BY 2, 3, 4
+ON CONFLICT (period, period_start, age_bracket, user_id) DO NOTHING;
+
+-- ==================== MIGRACIÓN: historial paginado ====================
+-- Para bases creadas antes de idx_game_sessions_user_started
+CREATE INDEX IF NOT EXISTS idx_game_sessions_user_started ON game_sessions(user_id, started_at DESC, id DESC);
+
+-- ==================== MIGRACIÓN: contenido deduplicado ====================
+-- Para bases creadas antes de game_contents (la tabla se crea arriba). Las sesiones
+-- existentes se pasan con: python migrate_game_contents.py (desde backend/), que
+-- calcula el mismo hash que la app; jsonb::text no da el JSON canónico.
+ALTER TABLE game_sessions ADD COLUMN IF NOT EXISTS content_id VARCHAR(64) REFERENCES game_contents(content_id);
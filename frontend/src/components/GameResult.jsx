@@ -3,10 +3,12 @@ import { motion } from 'framer-motion';
 import { useNavigate } from 'react-router-dom';
 import { calculatePercentage, getScoreMessage, getGameTypeLabel } from '../utils/helpers';
 import { INTELLIGENCE_TYPES } from '../utils/constants';
+import { getGameFeedback } from '../services/api';
 
 const GameResult = ({ result, topic, onPlayAgain, onGoToDashboard }) => {
   const navigate = useNavigate();
   const [showConfetti, setShowConfetti] = useState(false);
+  const [feedback, setFeedback] = useState(result.feedback);
 
   const percentage = calculatePercentage(result.score, result.max_score);
   const scoreMessage = getScoreMessage(percentage);
@@ -19,6 +21,34 @@ const GameResult = ({ result, topic, onPlayAgain, onGoToDashboard }) => {
     }
   }, [percentage]);
 
+  // El feedback de la IA llega después; mientras tanto se muestra el mensaje provisional
+  useEffect(() => {
+    setFeedback(result.feedback);
+    if (result.feedback_status !== 'pending' || !result.feedback_ticket) return;
+
+    let cancelled = false;
+    let attempts = 0;
+    const poll = async () => {
+      attempts += 1;
+      try {
+        const data = await getGameFeedback(result.feedback_ticket);
+        if (cancelled) return;
+        if (data.status !== 'pending') {
+          setFeedback(data.feedback || result.feedback);
+          return;
+        }
+      } catch (error) {
+        console.error('Error obteniendo feedback:', error);
+      }
+      if (!cancelled && attempts < 15) setTimeout(poll, 1000);
+    };
+    const timer = setTimeout(poll, 1000);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [result.feedback_ticket, result.feedback_status, result.feedback]);
+
   // Obtener las inteligencias más desarrolladas
   const intelligenceScores = Object.entries(result.intelligence_analysis || {})
     .filter(([_, score]) => score > 0)
@@ -119,7 +149,7 @@ const GameResult = ({ result, topic, onPlayAgain, onGoToDashboard }) => {
           </div>
 
           {/* AI Feedback */}
-          {result.feedback && (
+          {feedback && (
             <motion.div
               initial={{ opacity: 0, y: 20 }}
               animate={{ opacity: 1, y: 0 }}
@@ -129,7 +159,7 @@ const GameResult = ({ result, topic, onPlayAgain, onGoToDashboard }) => {
               <h3 className="font-bold text-lg mb-2 text-gray-800 flex items-center gap-2">
                 <span>🤖</span> Mensaje de tu tutor IA
               </h3>
-              <p className="text-gray-700 leading-relaxed">{result.feedback}</p>
+              <p className="text-gray-700 leading-relaxed">{feedback}</p>
             </motion.div>
           )}
 
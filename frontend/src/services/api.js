@@ -82,6 +82,11 @@ export const submitGame = async (sessionId, answers) => {
   return response.data;
 };
 
+export const getGameFeedback = async (sessionId) => {
+  const response = await api.get(`/api/games/${sessionId}/feedback`);
+  return response.data;
+};
+
 // ========== IA ==========
 
 export const generateContent = async (topic, gameType, difficulty = 'medium', ageRange = '8-14') => {